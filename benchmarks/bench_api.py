@@ -0,0 +1,74 @@
+import os
+import time
+import argparse
+import threading
+import http.client
+from urllib.parse import urlencode
+from concurrent.futures import ThreadPoolExecutor
+from utils.groups import Group
+from utils.aggregates_api import make_server, AGGREGATES_PATH
+from utils.instrumentation import get_stage_stats, reset_stats
+from benchmarks.synthetic_chat import generate_chat
+
+# Load test of the aggregates API on a synthetic chat: many clients polling the same filters at the same time, first
+# without an ETag (full responses, all but one served from memory) and then with it (304 responses without a body).
+# Run from the project root with: python -m benchmarks.bench_api [--messages 1000000] [--clients 32] [--requests 2000]
+
+DATA_FOLDER = os.path.join('cache', 'benchmarks')
+QUERY = f"{AGGREGATES_PATH}?{urlencode({'inicio': '2022-01-01', 'bebida': 'Mini,Média', 'valor': 'cervejas'})}"
+
+
+# Function to send requests to the API over a persistent connection, returning their statuses and ETags
+def poll(port, n_requests, etag=None):
+    connection = http.client.HTTPConnection('127.0.0.1', port)
+    results = []
+    for _ in range(n_requests):
+        connection.request('GET', QUERY, headers={'If-None-Match': etag} if etag else {})
+        response = connection.getresponse()
+        response.read()
+        results.append((response.status, response.getheader('ETag')))
+    connection.close()
+    return results
+
+
+# Function to run n_requests split among n_clients concurrent clients, printing their throughput
+def run_clients(label, port, n_clients, n_requests, etag=None):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(n_clients) as pool:
+        results = [result for part in pool.map(lambda _: poll(port, n_requests // n_clients, etag), range(n_clients)) for result in part]
+    seconds = time.perf_counter() - start
+    statuses = sorted({status for status, _ in results})
+    print(f'{label:<22} {len(results):>7} pedidos {len(results) / seconds:>9.0f} pedidos/s  estados {statuses}')
+    return results
+
+
+def main(n_messages, n_clients, n_requests):
+    os.makedirs(DATA_FOLDER, exist_ok=True)
+    data_folder = os.path.join(DATA_FOLDER, f'api_{n_messages}')
+    if not os.path.exists(data_folder):
+        os.makedirs(data_folder)
+        generate_chat(os.path.join(data_folder, '_chat.txt'), n_messages)
+    group = Group('bench', 'Benchmark', None, data_folder, os.path.join(data_folder, 'cache'))
+
+    server = make_server('127.0.0.1', 0, {group.group_id: group})
+    port = server.server_address[1]
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    reset_stats()
+
+    # The tables are loaded by the first request; every other one is answered from memory.
+    results = run_clients('sem ETag', port, n_clients, n_requests)
+    run_clients('com ETag (304)', port, n_clients, n_requests, results[0][1])
+    computations = {stats['stage']: stats for stats in get_stage_stats()}.get('api_compute', {'count': 0, 'p50_ms': 0})
+    print(f"Respostas calculadas: {computations['count']} ({computations['p50_ms']} ms)")
+    server.shutdown()
+    # All the requests share one data version, so the response must have been computed only once.
+    assert computations['count'] == 1, 'The response was computed more than once for the same data version'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load test the aggregates API with concurrent clients.')
+    parser.add_argument('--messages', type=int, default=1_000_000)
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=2000, help='requests of each phase (split among the clients)')
+    args = parser.parse_args()
+    main(args.messages, args.clients, args.requests)
@@ -0,0 +1,116 @@
+import os
+import sys
+import time
+import shutil
+import zipfile
+import argparse
+from utils.data_extraction import CHAT_TXT_NAME
+from utils.export_merge import merge_exports, iter_messages, get_merge_paths, EXPORTS_FOLDER_NAME
+from benchmarks.synthetic_chat import generate_chat
+
+# Benchmark (and check) of the merge of overlapping exports: a synthetic chat is split into exports covering overlapping
+# stretches of it, which are merged in several orders; the merged chat must always be the original one, and merging
+# exports that were already merged must be nearly free.
+# Run from the project root with: python -m benchmarks.bench_merge [--messages 1000000] (exits with an error if a check fails)
+
+DATA_FOLDER = os.path.join('cache', 'benchmarks')
+# Stretches of the chat covered by each export (as fractions of its messages); the second one is zipped.
+EXPORT_RANGES = {'a.txt': (0.0, 0.6), 'b.zip': (0.3, 0.9), 'c.txt': (0.5, 1.0)}
+# Budget (in seconds) of a merge where every export was already merged.
+REMERGE_BUDGET = 0.05
+
+
+# Function to split a chat into overlapping exports. Exports start at the first message of a minute, like the chat
+# of a member who joined the group (an export cut in the middle of a minute could repeat ordinals of identical messages).
+def make_exports(chat_path, folder, n_messages):
+    os.makedirs(folder, exist_ok=True)
+    bounds = {name: (int(start * n_messages), int(end * n_messages)) for name, (start, end) in EXPORT_RANGES.items()}
+    files = {}
+    for name in EXPORT_RANGES:
+        if name.endswith('.zip'):
+            archive = zipfile.ZipFile(os.path.join(folder, name), 'w', compression=zipfile.ZIP_DEFLATED)
+            files[name] = (archive, archive.open(CHAT_TXT_NAME, 'w', force_zip64=True))
+        else:
+            files[name] = (None, open(os.path.join(folder, name), 'wb'))
+    started, minute = set(), None
+    for position, message in enumerate(iter_messages(chat_path)):
+        new_minute, minute = message.minute != minute, message.minute
+        for name, (start, end) in bounds.items():
+            if name not in started and position >= start and new_minute:
+                started.add(name)
+            if name in started and position < end:
+                files[name][1].write(('\n'.join(message.lines) + '\n').encode('utf-8'))
+    for archive, file in files.values():
+        file.close()
+        if archive is not None:
+            archive.close()
+
+
+# Function to merge some exports into an empty group, one batch after another, returning the time of each merge
+def merge_batches(exports_folder, group_folder, batches):
+    shutil.rmtree(group_folder, ignore_errors=True)
+    os.makedirs(os.path.join(group_folder, EXPORTS_FOLDER_NAME))
+    seconds = []
+    for batch in batches:
+        for name in batch:
+            shutil.copy2(os.path.join(exports_folder, name), os.path.join(group_folder, EXPORTS_FOLDER_NAME, name))
+        start = time.perf_counter()
+        merge_exports(group_folder, os.path.join(group_folder, 'cache'))
+        seconds.append(time.perf_counter() - start)
+    return seconds
+
+
+# Function to check if two files have the same content
+def same_content(path, other_path, chunk_size=1024 * 1024):
+    with open(path, 'rb') as file, open(other_path, 'rb') as other:
+        while True:
+            chunk, other_chunk = file.read(chunk_size), other.read(chunk_size)
+            if chunk != other_chunk:
+                return False
+            if not chunk:
+                return True
+
+
+def main(n_messages):
+    folder = os.path.join(DATA_FOLDER, f'merge_{n_messages}')
+    chat_path = os.path.join(folder, 'full.txt')
+    exports_folder = os.path.join(folder, 'exports')
+    if not os.path.exists(exports_folder):
+        os.makedirs(folder, exist_ok=True)
+        generate_chat(chat_path, n_messages)
+        make_exports(chat_path, exports_folder, n_messages)
+
+    failures = []
+    # All at once; the newest export first, then an older one (rewrites the chat); oldest first (appends to it).
+    scenarios = {
+        'todas de uma vez': [['a.txt', 'b.zip', 'c.txt']],
+        'recente, depois antigas': [['c.txt'], ['a.txt'], ['b.zip']],
+        'antigas, depois recentes': [['a.txt'], ['b.zip'], ['c.txt']],
+    }
+    for label, batches in scenarios.items():
+        group_folder = os.path.join(folder, 'group')
+        seconds = merge_batches(exports_folder, group_folder, batches)
+        index_path = get_merge_paths(os.path.join(group_folder, 'cache'))[1]
+        # Merging again, with every export already merged, only checks their signatures.
+        start = time.perf_counter()
+        changed = merge_exports(group_folder, os.path.join(group_folder, 'cache'))
+        remerge_seconds = time.perf_counter() - start
+        print(f"{label:<26} {' + '.join(f'{s:.2f} s' for s in seconds):<28} nova fusão {remerge_seconds * 1000:7.2f} ms"
+              f"  índice {os.path.getsize(index_path) / 1e6:6.2f} MB")
+        if not same_content(os.path.join(group_folder, CHAT_TXT_NAME), chat_path):
+            failures.append(f'{label}: a conversa fundida difere da original')
+        if changed or remerge_seconds > REMERGE_BUDGET:
+            failures.append(f'{label}: nova fusão das mesmas exportações não foi gratuita ({remerge_seconds:.3f} s)')
+
+    for failure in failures:
+        print(f'FALHOU: {failure}')
+    if failures:
+        sys.exit(1)
+    print('OK')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Merge overlapping synthetic exports and check the merged chat.')
+    parser.add_argument('--messages', type=int, default=1_000_000)
+    args = parser.parse_args()
+    main(args.messages)
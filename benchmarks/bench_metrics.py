@@ -0,0 +1,94 @@
+import time
+import numpy as np
+import pandas as pd
+from utils.metrics import compute_metrics
+from utils.timeseries import FREQUENCIES
+from utils.app_plots import make_total_consumption_figure, make_consumption_by_type_figure, make_weekly_consumption_figure, make_hourly_consumption_figure, make_consumption_over_time_figure
+
+# Benchmark of the single-pass metrics engine against the per-chart groupbys it replaced, after checking that the metrics
+# and every chart can be built for filters that select no drink.
+# Run from the project root with: python -m benchmarks.bench_metrics
+
+PEOPLE = ['Ronaldo', 'Toy', 'Marcelo', 'Anselmo Ralph', 'Bruno Nogueira', 'Tony Carreira', 'Samuel Mira']
+DRINKS = {'Mini': 0.25, 'Média': 0.33, 'Litrosa': 1.0, 'Vinho': 0.25}
+
+
+# Function to build a random event table with the same columns as the dashboard's
+def make_events(n_events, n_days=3 * 365, seed=0):
+    rng = np.random.default_rng(seed)
+    timestamps = pd.Timestamp('2021-01-01') + pd.to_timedelta(np.sort(rng.integers(0, n_days * 24 * 60, n_events)), unit='min')
+    drinks = rng.choice(list(DRINKS), n_events)
+    return pd.DataFrame({
+        'Timestamp': timestamps,
+        'Date': timestamps.normalize(),
+        'Dia': timestamps.weekday.astype('int8'),
+        'Hora': timestamps.hour.astype('int8'),
+        'Pessoa': rng.choice(PEOPLE, n_events).astype(object),
+        'Emoji': drinks.astype(object),
+        'Quantidade (L)': pd.Series(drinks).map(DRINKS).to_numpy(),
+        'Quantidade': 1,
+    })
+
+
+# Function to build the rollup cube of an event table (same columns, one row per day, hour, person and drink)
+def make_cube(events):
+    keys = ['Date', 'Dia', 'Hora', 'Pessoa', 'Emoji']
+    return events.groupby(keys)[['Quantidade (L)', 'Quantidade']].sum().reset_index()
+
+
+# Function with the aggregations done before the metrics engine: calculate_stats plus one groupby per chart
+def legacy_aggregates(df, value_col):
+    total_volume = df['Quantidade (L)'].sum()
+    avg_daily_consumption = df.groupby('Date')['Quantidade (L)'].sum().mean()
+    top_consumer = df.groupby('Pessoa')['Quantidade (L)'].sum().idxmax()
+    favorite_beer = df.groupby('Emoji')['Quantidade'].sum().idxmax()
+    per_person = df.groupby('Pessoa')[value_col].sum().sort_values(ascending=False)
+    per_drink = df.groupby('Emoji')[value_col].sum()
+    per_weekday = df.groupby('Dia')[value_col].sum().reindex(range(7))
+    per_hour = df.groupby('Hora')[value_col].sum().reindex(range(24)).fillna(0)
+    return total_volume, avg_daily_consumption, top_consumer, favorite_beer, per_person, per_drink, per_weekday, per_hour
+
+
+# Function to check that the metrics and the figure of every chart are built for an empty selection (e.g. a person
+# with a drink they never had), as the dashboard must render it without an error.
+def check_empty_selection():
+    empty = make_events(10).iloc[:0]
+    for value_col in ('Quantidade (L)', 'Quantidade'):
+        metrics = compute_metrics(empty, value_col)
+        assert metrics.total_volume == 0 and metrics.top_consumer is None and metrics.per_date.empty
+        for build in (make_total_consumption_figure, make_consumption_by_type_figure, make_weekly_consumption_figure, make_hourly_consumption_figure):
+            build(metrics)
+        for frequency in FREQUENCIES:
+            make_consumption_over_time_figure(metrics, frequency)
+    print('Seleção vazia: métricas e gráficos OK')
+
+
+# Function to get the best time (in milliseconds) of several runs of a function
+def best_time(function, *args, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000
+
+
+# Function to run the benchmark for several table sizes and print the results
+def main(sizes=(10_000, 100_000, 1_000_000)):
+    check_empty_selection()
+    print(f"{'eventos':>10} {'tabela':>8} {'linhas':>10} {'por gráfico (ms)':>18} {'motor (ms)':>12} {'ganho':>7}")
+    for n_events in sizes:
+        events = make_events(n_events)
+        for name, df in (('eventos', events), ('cubo', make_cube(events))):
+            for value_col in ('Quantidade (L)', 'Quantidade'):
+                # Both approaches must agree before their timings are compared.
+                legacy = legacy_aggregates(df, value_col)
+                metrics = compute_metrics(df, value_col)
+                assert np.isclose(legacy[0], metrics.total_volume) and legacy[2:4] == (metrics.top_consumer, metrics.favorite_beer)
+                legacy_ms = best_time(legacy_aggregates, df, value_col)
+                engine_ms = best_time(compute_metrics, df, value_col)
+                print(f'{n_events:>10} {name:>8} {len(df):>10} {legacy_ms:>18.2f} {engine_ms:>12.2f} {legacy_ms / engine_ms:>6.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+import os
+import time
+import argparse
+from utils.data_extraction import load_data
+from utils.parallel_parse import load_data_parallel
+from benchmarks.synthetic_chat import generate_chat
+
+# Benchmark of the parallel parser against the serial one, for an increasing number of worker processes.
+# Run from the project root with: python -m benchmarks.bench_parallel [--messages 2000000] [--workers 1 2 4 8]
+
+DATA_FOLDER = os.path.join('cache', 'benchmarks')
+
+
+# Function to time a single run of a function (in seconds), returning its result too
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+# Function to run the benchmark on a synthetic chat and print the speedup and efficiency of each worker count
+def main(n_messages, workers_list):
+    os.makedirs(DATA_FOLDER, exist_ok=True)
+    path = os.path.join(DATA_FOLDER, f'chat_{n_messages}.txt')
+    if not os.path.exists(path):
+        generate_chat(path, n_messages)
+
+    serial_seconds, expected = timed(load_data, path)
+    print(f'{n_messages} mensagens, {os.path.getsize(path) / 1e6:.0f} MB, {len(expected)} eventos, {os.cpu_count()} CPUs')
+    print(f"{'processos':>9} {'tempo (s)':>10} {'ganho':>7} {'eficiência':>11}")
+    print(f"{'série':>9} {serial_seconds:>10.2f} {1:>6.2f}x {1:>10.0%}")
+    for workers in workers_list:
+        seconds, result = timed(load_data_parallel, path, workers=workers)
+        # The parallel parser must give exactly the same events as the serial one.
+        assert result.equals(expected), f'The parallel result with {workers} workers differs from the serial one'
+        speedup = serial_seconds / seconds
+        print(f'{workers:>9} {seconds:>10.2f} {speedup:>6.2f}x {speedup / workers:>10.0%}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the parallel chat parser.')
+    parser.add_argument('--messages', type=int, default=2_000_000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[n for n in (2, 4, 8, 16) if n <= (os.cpu_count() or 1)] or [2])
+    args = parser.parse_args()
+    main(args.messages, args.workers)
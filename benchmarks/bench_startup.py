@@ -0,0 +1,108 @@
+import sys
+import json
+import argparse
+import subprocess
+
+# Benchmark of the cold start of the dashboard: the time to import the app (its modules and their libraries) and the
+# time of its first render, each measured in a fresh Python process, against a time budget.
+# Run from the project root with: python -m benchmarks.bench_startup (exits with an error if a budget is exceeded)
+
+# Budgets (in seconds) of the import of the app and of its first render (with the event store already ingested,
+# as in the container image). Streamlit itself is already imported by the server, so it isn't counted.
+IMPORT_BUDGET = 1.0
+FIRST_RENDER_BUDGET = 3.0
+# Libraries that must not be imported by the app at start-up (they are only imported when first used).
+LAZY_MODULES = ['googleapiclient', 'google_auth_oauthlib', 'google.oauth2', 'plotly.express', 'emoji']
+# Number of top-level imports listed, slowest first.
+TOP_IMPORTS = 10
+
+# Code run in the fresh process: import Streamlit, then the app (without running it), reporting the time taken.
+IMPORT_SCRIPT = '''
+import sys, time, json, importlib.util
+import streamlit
+print('-- app --', file=sys.stderr, flush=True)
+start = time.perf_counter()
+spec = importlib.util.spec_from_file_location('streamlit_app', 'streamlit-app.py')
+spec.loader.exec_module(importlib.util.module_from_spec(spec))
+seconds = time.perf_counter() - start
+print(json.dumps({'seconds': seconds, 'loaded': [name for name in %r if name in sys.modules]}))
+''' % (LAZY_MODULES,)
+
+# Code run in the fresh process: import and render the app once, as its first session would.
+RENDER_SCRIPT = '''
+import time, json
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file('streamlit-app.py', default_timeout=120)
+app.run()
+seconds = time.perf_counter() - start
+print(json.dumps({'seconds': seconds, 'exception': [str(e.value) for e in app.exception]}))
+'''
+
+
+# Function to run a script in a fresh Python process, returning its JSON output and its standard error
+def run_fresh(script, *options):
+    result = subprocess.run([sys.executable, *options, '-c', script], capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+
+# Function to get the slowest top-level imports of the app from the output of 'python -X importtime'
+def get_top_imports(importtime_output, n=TOP_IMPORTS):
+    imports = []
+    # Only the imports made after Streamlit (marked by the script) are the app's.
+    for line in importtime_output.split('-- app --', 1)[-1].splitlines():
+        if line.startswith('import time:') and line.count('|') == 2:
+            _, cumulative, name = line.split('|')
+            # Top-level imports have a single space before their name; nested ones are indented further.
+            if cumulative.strip().isdigit() and not name[2:].startswith(' '):
+                imports.append((int(cumulative) / 1e6, name.strip()))
+    return sorted(imports, reverse=True)[:n]
+
+
+# Function to measure the import of the app (best of several fresh processes) and list its slowest imports
+def measure_import(repeat):
+    runs = [run_fresh(IMPORT_SCRIPT)[0] for _ in range(repeat)]
+    _, importtime_output = run_fresh(IMPORT_SCRIPT, '-X', 'importtime')
+    return min(run['seconds'] for run in runs), runs[0]['loaded'], get_top_imports(importtime_output)
+
+
+# Function to measure the first render of the app (best of several fresh processes)
+def measure_first_render(repeat):
+    runs = [run_fresh(RENDER_SCRIPT)[0] for _ in range(repeat)]
+    return min(run['seconds'] for run in runs), runs[0]['exception']
+
+
+def main(repeat=3, import_budget=IMPORT_BUDGET, render_budget=FIRST_RENDER_BUDGET):
+    # The event store is ingested beforehand, as when the container image is built, so only the start-up is measured.
+    subprocess.run([sys.executable, '-m', 'utils.ingest'], check=True)
+
+    import_seconds, loaded, top_imports = measure_import(repeat)
+    print(f'Importação da app:    {import_seconds:6.3f} s (orçamento {import_budget} s)')
+    for seconds, name in top_imports:
+        print(f'    {seconds:6.3f} s  {name}')
+    render_seconds, exceptions = measure_first_render(repeat)
+    print(f'Primeira renderização: {render_seconds:6.3f} s (orçamento {render_budget} s)')
+
+    failures = []
+    if loaded:
+        failures.append(f'módulos importados no arranque: {", ".join(loaded)}')
+    if exceptions:
+        failures.append(f'erros na primeira renderização: {exceptions}')
+    if import_seconds > import_budget:
+        failures.append(f'importação acima do orçamento ({import_seconds:.3f} s > {import_budget} s)')
+    if render_seconds > render_budget:
+        failures.append(f'primeira renderização acima do orçamento ({render_seconds:.3f} s > {render_budget} s)')
+    for failure in failures:
+        print(f'FALHOU: {failure}')
+    if failures:
+        sys.exit(1)
+    print('OK')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure the import and first render time of the dashboard.')
+    parser.add_argument('--repeat', type=int, default=3, help='fresh processes per measurement (the best time is kept)')
+    parser.add_argument('--import-budget', type=float, default=IMPORT_BUDGET, help='budget of the import, in seconds')
+    parser.add_argument('--render-budget', type=float, default=FIRST_RENDER_BUDGET, help='budget of the first render, in seconds')
+    args = parser.parse_args()
+    main(args.repeat, args.import_budget, args.render_budget)
@@ -0,0 +1,173 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import importlib.util
+import subprocess
+import tracemalloc
+from datetime import datetime
+import pyarrow as pa
+from utils.data_extraction import read_blocks, split_lines, read_file, parse_chat, extract_emojis, load_data
+from utils.event_store import to_store_frame, to_store_table, from_store_table
+from utils.rollup import build_cube, from_cube_table
+from utils.metrics import compute_metrics
+from utils.table_index import TableIndex
+from utils.app_plots import calculate_stats, make_total_consumption_figure, make_consumption_by_type_figure, \
+    make_weekly_consumption_figure, make_hourly_consumption_figure, make_consumption_over_time_figure
+from benchmarks.synthetic_chat import generate_chat
+
+# Benchmark suite of the ingest and dashboard paths on synthetic chats, saving its results as JSON.
+# Run from the project root with: python -m benchmarks.bench_suite [--sizes 10k 1M 10M] [--compare results.json]
+
+SIZES = {'10k': 10_000, '1M': 1_000_000, '10M': 10_000_000}
+# Synthetic chats are generated once and reused by later runs (the cache folder isn't versioned).
+DATA_FOLDER = os.path.join('cache', 'benchmarks')
+RESULTS_FOLDER = os.path.join('benchmarks', 'results')
+
+
+# Function to import filter_data from the Streamlit app (its file name isn't a valid module name)
+def load_filter_data():
+    spec = importlib.util.spec_from_file_location('streamlit_app', 'streamlit-app.py')
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.filter_data
+
+
+# Function to get the path of the synthetic chat with n_messages messages, generating it if needed
+def get_chat(n_messages):
+    os.makedirs(DATA_FOLDER, exist_ok=True)
+    path = os.path.join(DATA_FOLDER, f'chat_{n_messages}.txt')
+    if not os.path.exists(path):
+        print(f'A gerar {path}...', file=sys.stderr)
+        generate_chat(f'{path}.tmp', n_messages)
+        os.replace(f'{path}.tmp', path)
+    return path
+
+
+# Function to measure a function: best wall time of several runs and, in a separate run (tracing slows it down),
+# the peak memory allocated from Python (numpy and pandas included) and the memory Arrow still holds for the result
+def measure(function, repeat, profile_memory):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - start)
+        del result
+    measurement = {'seconds': min(timings)}
+
+    if profile_memory:
+        arrow_before = pa.total_allocated_bytes()
+        tracemalloc.start()
+        result = function()
+        measurement['python_peak_mb'] = tracemalloc.get_traced_memory()[1] / 1e6
+        tracemalloc.stop()
+        measurement['arrow_retained_mb'] = (pa.total_allocated_bytes() - arrow_before) / 1e6
+        del result
+    return measurement
+
+
+# Function to run every stage on a synthetic chat of n_messages messages, yielding (stage, measurement)
+def run_stages(n_messages, repeat, profile_memory):
+    filter_data = load_filter_data()
+    path = get_chat(n_messages)
+
+    # Inputs of each stage are built beforehand, outside of the measurements.
+    lines = pa.concat_arrays([split_lines(block) for block in read_blocks(path)])
+    chat_data = parse_chat(lines)
+    events_df = extract_emojis(chat_data)
+    events_table = to_store_table(to_store_frame(events_df))
+    events = from_store_table(events_table)
+    cube = from_cube_table(build_cube(events_table))
+    first_date, last_date = cube['Date'].min(), cube['Date'].max()
+    # A typical interaction: the second half of the history, three people, all drinks, in litres.
+    date_range = ((first_date + (last_date - first_date) / 2).date(), last_date.date())
+    people = sorted(cube['Pessoa'].unique())[:3]
+    metrics = compute_metrics(cube, 'Quantidade (L)')
+    events_index, cube_index = TableIndex(events), TableIndex(cube)
+
+    stages = {
+        'read_file': lambda: sum(1 for _ in read_file(path)),
+        'parse_chat': lambda: parse_chat(lines),
+        'extract_emojis': lambda: extract_emojis(chat_data),
+        'load_data': lambda: load_data(path),
+        'filter_data (eventos)': lambda: filter_data(events, date_range, people, [], ['Quantidade (L)']),
+        'filter_data (cubo)': lambda: filter_data(cube, date_range, people, [], ['Quantidade (L)']),
+        'filter_data indexado (eventos)': lambda: filter_data(events, date_range, people, [], ['Quantidade (L)'], events_index),
+        'filter_data indexado (cubo)': lambda: filter_data(cube, date_range, people, [], ['Quantidade (L)'], cube_index),
+        'calculate_stats (eventos)': lambda: calculate_stats(events),
+        'calculate_stats (cubo)': lambda: calculate_stats(cube),
+        'compute_metrics (eventos)': lambda: compute_metrics(events, 'Quantidade (L)'),
+        'compute_metrics (cubo)': lambda: compute_metrics(cube, 'Quantidade (L)'),
+        'plot_total_consumption': lambda: make_total_consumption_figure(metrics),
+        'plot_consumption_by_type': lambda: make_consumption_by_type_figure(metrics),
+        'weekly_consumption_pattern': lambda: make_weekly_consumption_figure(metrics),
+        'hourly_consumption_pattern': lambda: make_hourly_consumption_figure(metrics),
+        'consumption_over_time': lambda: make_consumption_over_time_figure(metrics, 'Diário'),
+    }
+    for stage, function in stages.items():
+        yield stage, {'lines': len(lines), 'events': len(events), 'cube_rows': len(cube), **measure(function, repeat, profile_memory)}
+
+
+# Function to get the current commit of the repository, to tell results apart
+def get_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+# Function to print the ratio between the timings of a run and those of a previous one (above 1 means slower)
+def compare_results(results, previous_path):
+    with open(previous_path, 'r', encoding='utf-8') as file:
+        previous = {(r['size'], r['stage']): r for r in json.load(file)['results']}
+    print(f"\n{'tamanho':>8} {'etapa':<32} {'antes (s)':>10} {'agora (s)':>10} {'rácio':>7}")
+    for result in results:
+        old = previous.get((result['size'], result['stage']))
+        if old:
+            ratio = result['seconds'] / old['seconds'] if old['seconds'] else float('nan')
+            print(f"{result['size']:>8} {result['stage']:<32} {old['seconds']:>10.4f} {result['seconds']:>10.4f} {ratio:>6.2f}x")
+
+
+# Function to run the suite for several chat sizes, print the results and save them as JSON
+def main(sizes, repeat=3, profile_memory=True, output=None, compare=None):
+    results = []
+    print(f"{'tamanho':>8} {'etapa':<32} {'tempo (s)':>10} {'pico Python (MB)':>17} {'Arrow (MB)':>11}")
+    for size in sizes:
+        n_messages = SIZES[size]
+        # The largest chats are measured only once, as each run takes a while.
+        for stage, measurement in run_stages(n_messages, repeat if n_messages < 10_000_000 else 1, profile_memory):
+            results.append({'size': size, 'messages': n_messages, 'stage': stage, **measurement})
+            print(f"{size:>8} {stage:<32} {measurement['seconds']:>10.4f} "
+                  f"{measurement.get('python_peak_mb', float('nan')):>17.1f} {measurement.get('arrow_retained_mb', float('nan')):>11.1f}")
+
+    commit = get_commit()
+    report = {
+        'commit': commit,
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'versions': {name: sys.modules[name].__version__ for name in ('numpy', 'pandas', 'pyarrow', 'plotly')},
+        'results': results,
+    }
+    if output is None:
+        os.makedirs(RESULTS_FOLDER, exist_ok=True)
+        output = os.path.join(RESULTS_FOLDER, f"{datetime.now():%Y%m%d-%H%M%S}_{commit}.json")
+    with open(output, 'w', encoding='utf-8') as file:
+        json.dump(report, file, indent=2, ensure_ascii=False)
+    print(f'\nResultados guardados em {output}')
+
+    if compare:
+        compare_results(results, compare)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the ingest and dashboard paths on synthetic chats.')
+    parser.add_argument('--sizes', nargs='+', choices=list(SIZES), default=list(SIZES))
+    parser.add_argument('--repeat', type=int, default=3, help='runs per stage (the best time is kept)')
+    parser.add_argument('--no-memory', action='store_true', help="skip the memory profiling run of each stage")
+    parser.add_argument('--output', help='path of the JSON results (default: benchmarks/results/<date>_<commit>.json)')
+    parser.add_argument('--compare', help='JSON results of a previous run to compare with')
+    args = parser.parse_args()
+    main(args.sizes, args.repeat, not args.no_memory, args.output, args.compare)
@@ -0,0 +1,44 @@
+import sys
+import time
+import argparse
+import numpy as np
+from datetime import datetime
+from utils.data_extraction import DRINK_EMOJIS
+from benchmarks.synthetic_chat import make_people, DRINK_WEIGHTS
+
+# Appender of drink messages to a plain chat text (e.g. data/_chat.txt), as if they were sent to the group right now,
+# to try the live mode of the dashboard end to end. Run from the project root with, e.g.:
+# python -m benchmarks.chat_appender data/_chat.txt --interval 3 --count 20
+
+
+# Function to append a drink message of a random person to a chat text, returning the line written
+def append_message(path, rng, people):
+    drinks = rng.choice(len(DRINK_EMOJIS), rng.choice([1, 1, 1, 2]), p=DRINK_WEIGHTS)
+    line = f"{datetime.now():%d/%m/%y, %H:%M} - {people[rng.integers(len(people))]}: {''.join(DRINK_EMOJIS[code] for code in drinks)}"
+    # Each message is written at once and ends with a newline, like the lines of an export.
+    with open(path, 'a', encoding='utf-8') as file:
+        file.write(line + '\n')
+    return line
+
+
+# Function to append count messages (forever if None), one every interval seconds
+def run(path, interval=3.0, count=None, n_people=7, seed=None):
+    rng = np.random.default_rng(seed)
+    people = make_people(n_people)
+    written = 0
+    while count is None or written < count:
+        print(append_message(path, rng, people), file=sys.stderr)
+        written += 1
+        if count is None or written < count:
+            time.sleep(interval)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Append drink messages to a chat text, one every few seconds.')
+    parser.add_argument('path', help='plain chat text to append to (e.g. data/_chat.txt)')
+    parser.add_argument('--interval', type=float, default=3.0, help='seconds between two messages')
+    parser.add_argument('--count', type=int, help='number of messages (default: until interrupted)')
+    parser.add_argument('--people', type=int, default=7)
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+    run(args.path, args.interval, args.count, args.people, args.seed)
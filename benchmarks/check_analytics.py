@@ -0,0 +1,57 @@
+import sys
+import time
+import argparse
+import pandas as pd
+from utils.analytics import PersonAnalytics, compute_analytics
+from utils.compact_events import CompactEvents
+from benchmarks.check_event_memory import make_compact_events
+
+# Check of the per-person analytics (see utils.analytics): the state updated one event at a time, and the state built
+# from part of the events and then updated with the rest, must give the same table as the vectorized computation over
+# all of them. Also times both ways, per event.
+# Run from the project root with: python -m benchmarks.check_analytics [--events 1000000] (exits with an error if a check fails)
+
+# Numbers of events checked: a sparse history (with gaps between drinking days) and a dense one.
+EVENT_COUNTS = [5_000, 1_000_000]
+
+
+# Function to get the first n events of an event table
+def head(events: CompactEvents, n: int) -> CompactEvents:
+    return CompactEvents(events.minutes[:n].copy(), events.person_codes[:n].copy(), events.drink_codes[:n].copy(), events.people.copy())
+
+
+def main(event_counts):
+    failures = []
+    for n_events in event_counts:
+        events, _ = make_compact_events(n_events)
+        start = time.perf_counter()
+        expected = compute_analytics(events)
+        full_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        incremental = PersonAnalytics().extend(events)
+        incremental_seconds = time.perf_counter() - start
+        # The last tenth of the events arrives after the others, as lines appended to a loaded chat.
+        split = n_events - n_events // 10
+        appended = PersonAnalytics.from_events(head(events, split)).extend(events, split)
+
+        print(f'{n_events:>9} eventos  vetorizado {full_seconds * 1000:8.1f} ms ({full_seconds / n_events * 1e9:6.0f} ns/evento)'
+              f'  incremental {incremental_seconds / n_events * 1e6:5.2f} µs/evento')
+        for label, state in (('incremental', incremental), ('vetorizado + incremental', appended)):
+            try:
+                pd.testing.assert_frame_equal(state.to_frame(), expected)
+            except AssertionError as e:
+                failures.append(f'{n_events} eventos, {label}: {e}')
+
+    for failure in failures:
+        print(f'FALHOU: {failure}')
+    if failures:
+        sys.exit(1)
+    print('OK')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check the incremental per-person analytics against the vectorized ones.')
+    parser.add_argument('--events', type=int, nargs='+', default=EVENT_COUNTS)
+    args = parser.parse_args()
+    main(args.events)
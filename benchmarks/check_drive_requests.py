@@ -0,0 +1,64 @@
+import os
+import sys
+import shutil
+from utils.google_api import list_files_in_folder, has_newer_export, FILE_FIELDS
+from utils.update_data import update_chat_data, is_newer_export_available
+from benchmarks.fake_drive import FakeDriveService, make_export
+
+# Check of the number of Drive API requests (see utils.google_api) made against a fake Drive service that counts them
+# (see benchmarks.fake_drive): listing a large folder follows its pages, a second check for newer exports is answered by
+# the cached folder snapshot, and a sync with nothing new makes a single list call.
+# Run from the project root with: python -m benchmarks.check_drive_requests (exits with an error if a check fails)
+
+DATA_FOLDER = os.path.join('cache', 'benchmarks', 'drive_requests')
+N_FILES = 250
+PAGE_SIZE = 100
+# List calls needed for the whole folder (3).
+N_PAGES = -(-N_FILES // PAGE_SIZE)
+
+
+# Function to count the requests (by method) made by a function call on the fake service
+def count_requests(drive, function, *args):
+    drive.requests.clear()
+    result = function(drive, *args)
+    return result, dict(drive.requests)
+
+
+def main():
+    shutil.rmtree(DATA_FOLDER, ignore_errors=True)
+    state_path = os.path.join(DATA_FOLDER, 'cache', 'drive_sync.json')
+    # Pages of at most PAGE_SIZE files, however many are asked for.
+    drive = FakeDriveService(page_size=PAGE_SIZE)
+    for i in range(N_FILES):
+        drive.add_file('pasta-grande', f'WhatsApp Chat {i}.zip', f'{i}'.encode())
+    drive.add_file('pasta-do-grupo', 'WhatsApp Chat com Contabilidade.zip', make_export(
+        '01/01/24, 20:00 - Toy: \N{BEER MUG}\n'.encode('utf-8')))
+
+    # Expected requests of each operation (a folder snapshot is shared by the calls made within SNAPSHOT_MAX_AGE).
+    checks = [
+        (f'listar {N_FILES} ficheiros', list_files_in_folder, ('pasta-grande', FILE_FIELDS), {'list': N_PAGES}),
+        ('novas exportações (1.ª vez)', is_newer_export_available, ('pasta-grande', state_path), {'list': N_PAGES}),
+        ('novas exportações (2.ª vez)', is_newer_export_available, ('pasta-grande', state_path), {}),
+        ('novas exportações (expirada)', has_newer_export, ('pasta-grande', {}, 0), {'list': N_PAGES}),
+        ('primeira sincronização', update_chat_data, ('pasta-do-grupo', DATA_FOLDER, state_path), {'list': 1, 'get_media': 1}),
+        ('sincronização sem novidades', update_chat_data, ('pasta-do-grupo', DATA_FOLDER, state_path), {'list': 1}),
+    ]
+
+    failures = []
+    for label, function, args, expected in checks:
+        result, requests = count_requests(drive, function, *args)
+        print(f'{label:<32} {sum(requests.values()):>3} pedidos  {requests}')
+        if requests != expected:
+            failures.append(f'{label}: {requests} pedidos, esperados {expected}')
+        if function is list_files_in_folder and len({file['id'] for file in result}) != N_FILES:
+            failures.append(f'{label}: a listagem devolveu {len(result)} ficheiros, esperados {N_FILES} diferentes')
+
+    for failure in failures:
+        print(f'FALHOU: {failure}')
+    if failures:
+        sys.exit(1)
+    print('OK')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+import io
+import os
+import sys
+import shutil
+import argparse
+import zipfile
+from utils.data_extraction import CHAT_TXT_NAME
+from utils.export_merge import iter_messages
+from utils.update_data import update_chat_data, is_newer_export_available, load_sync_state
+from benchmarks.synthetic_chat import generate_chat
+from benchmarks.fake_drive import FakeDriveService, make_export
+
+# Check of the Drive sync (see utils.update_data) against an in-memory fake Drive service (see benchmarks.fake_drive):
+# an interrupted download is resumed where it stopped, an export whose checksum didn't change isn't downloaded again,
+# and a file of the folder that isn't a chat export is skipped without failing the sync.
+# Run from the project root with: python -m benchmarks.check_drive_sync [--messages 20000] (exits with an error if a check fails)
+
+DATA_FOLDER = os.path.join('cache', 'benchmarks', 'drive_sync')
+FOLDER_ID = 'pasta-do-grupo'
+# Number of media responses of the first sync before the connection drops.
+RESPONSES_BEFORE_FAILURE = 2
+
+
+# Function to get the messages of a chat file (as lines of text), to compare chats regardless of how they were written
+def read_messages(chat_path):
+    return [message.lines for message in iter_messages(chat_path)]
+
+
+def main(n_messages):
+    shutil.rmtree(DATA_FOLDER, ignore_errors=True)
+    os.makedirs(DATA_FOLDER)
+    data_folder, state_path = os.path.join(DATA_FOLDER, 'data'), os.path.join(DATA_FOLDER, 'cache', 'drive_sync.json')
+    chat_path = generate_chat(os.path.join(DATA_FOLDER, 'full.txt'), n_messages)
+    with open(chat_path, 'rb') as file:
+        export = make_export(file.read(), media=os.urandom(64 * 1024))
+
+    # Responses of a fifth of the export, so it takes several ranged requests.
+    drive = FakeDriveService(max_response_bytes=len(export) // 5 + 1)
+    export_id = drive.add_file(FOLDER_ID, 'WhatsApp Chat com Contabilidade.zip', export)
+    failures = []
+
+    # 1. Interrupted download: the first sync fails midway, the next one only requests the missing bytes.
+    drive.failures_after = RESPONSES_BEFORE_FAILURE
+    try:
+        update_chat_data(drive, FOLDER_ID, data_folder, state_path)
+        failures.append('a primeira sincronização devia ter falhado a meio da transferência')
+    except IOError:
+        pass
+    downloaded = sum(end - start + 1 for _, start, end in drive.ranges)
+    drive.failures_after, drive.ranges = None, []
+    changed = update_chat_data(drive, FOLDER_ID, data_folder, state_path)
+    resumed_from = drive.ranges[0][1] if drive.ranges else None
+    print(f'Retoma: {downloaded} de {len(export)} bytes antes da falha, retomada no byte {resumed_from}')
+    if not changed or resumed_from != downloaded:
+        failures.append(f'a transferência não foi retomada no byte {downloaded} (retomada em {resumed_from})')
+    if sum(end - start + 1 for _, start, end in drive.ranges) != len(export) - downloaded:
+        failures.append('a retoma voltou a transferir bytes já recebidos')
+    if read_messages(os.path.join(data_folder, CHAT_TXT_NAME)) != read_messages(chat_path):
+        failures.append('a conversa sincronizada difere da exportação')
+
+    # 2. Unchanged export: nothing is downloaded and the data doesn't change.
+    drive.ranges = []
+    changed = update_chat_data(drive, FOLDER_ID, data_folder, state_path)
+    print(f'Sem alterações: {len(drive.ranges)} transferências, dados alterados: {changed}')
+    if changed or drive.ranges:
+        failures.append('uma exportação com o mesmo checksum voltou a ser transferida')
+
+    # 3. Files that aren't chat exports (an archive without a chat, and a file that isn't an archive) are skipped.
+    photos = io.BytesIO()
+    with zipfile.ZipFile(photos, 'w') as archive:
+        archive.writestr('IMG-20240101-WA0001.jpg', os.urandom(1024))
+    skipped_ids = {drive.add_file(FOLDER_ID, 'fotos.zip', photos.getvalue()),
+                   drive.add_file(FOLDER_ID, 'notas.pdf', b'%PDF-1.4')}
+    drive.ranges = []
+    try:
+        changed = update_chat_data(drive, FOLDER_ID, data_folder, state_path)
+    except Exception as e:
+        changed = None
+        failures.append(f'um ficheiro que não é uma exportação fez falhar a sincronização: {e!r}')
+    downloads = len({file_id for file_id, _, _ in drive.ranges})
+    drive.ranges = []
+    update_chat_data(drive, FOLDER_ID, data_folder, state_path)
+    print(f'Ficheiros que não são exportações: {downloads} transferidos, {len(drive.ranges)} transferências na sincronização seguinte')
+    if changed is not False or set(load_sync_state(state_path).get('skipped', {})) != skipped_ids:
+        failures.append('os ficheiros que não são exportações não foram ignorados')
+    if drive.ranges or is_newer_export_available(drive, FOLDER_ID, state_path):
+        failures.append('os ficheiros ignorados voltam a ser transferidos (ou dados como novas exportações)')
+    if set(load_sync_state(state_path)['exports']) != {export_id}:
+        failures.append('as exportações sincronizadas não são as esperadas')
+
+    for failure in failures:
+        print(f'FALHOU: {failure}')
+    if failures:
+        sys.exit(1)
+    print('OK')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check the Drive sync against an in-memory fake Drive service.')
+    parser.add_argument('--messages', type=int, default=20_000)
+    args = parser.parse_args()
+    main(args.messages)
@@ -0,0 +1,39 @@
+import sys
+from utils.event_store import to_store_frame, to_store_table, from_store_table
+from utils.compact_events import CompactEvents, BYTES_PER_EVENT_TARGET
+from benchmarks.bench_metrics import make_events
+
+# Check of the memory budget of the events kept by the dashboard (see utils.compact_events.BYTES_PER_EVENT_TARGET).
+# Run from the project root with: python -m benchmarks.check_event_memory (exits with an error if the budget is exceeded)
+
+N_EVENTS = 1_000_000
+# A million events must fit in the per-event target, plus a little room for the names of the people.
+MEMORY_BUDGET = N_EVENTS * BYTES_PER_EVENT_TARGET + 64 * 1024
+
+
+# Function to build the compact events of n_events random drinks, and the DataFrame the dashboard kept before
+def make_compact_events(n_events):
+    df = make_events(n_events)[['Timestamp', 'Pessoa', 'Emoji', 'Quantidade (L)', 'Quantidade']]
+    table = to_store_table(to_store_frame(df))
+    return CompactEvents.from_store_table(table), from_store_table(table)
+
+
+def main():
+    events, frame = make_compact_events(N_EVENTS)
+    frame_bytes = frame.memory_usage(index=True, deep=True).sum()
+    print(f'{len(events)} eventos')
+    print(f'DataFrame:  {frame_bytes / 1e6:8.1f} MB ({frame_bytes / len(frame):6.1f} bytes por evento)')
+    print(f'Compactos:  {events.nbytes / 1e6:8.1f} MB ({events.nbytes / len(events):6.1f} bytes por evento, objetivo {BYTES_PER_EVENT_TARGET})')
+
+    # The compact events must hold exactly the same data as the DataFrame.
+    expanded = events.to_frame()
+    assert expanded.equals(frame), 'The compact events differ from the DataFrame they replace'
+
+    if events.nbytes > MEMORY_BUDGET:
+        print(f'FALHOU: {events.nbytes} bytes acima do orçamento de {MEMORY_BUDGET} bytes')
+        sys.exit(1)
+    print('OK')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+import re
+import io
+import hashlib
+import zipfile
+from collections import Counter
+from datetime import datetime, timedelta
+from utils.data_extraction import CHAT_TXT_NAME
+
+# In-memory stand-in for the Google Drive service object (the part of it used by utils.google_api), so the Drive sync can
+# be checked without credentials or network: files().list with pages, and files().get_media with HTTP Range headers.
+# It counts the requests it executes, so the number of API calls of each operation can be checked too.
+
+
+# Request of the fake service: runs (and is counted) when executed, like the requests of the Google client library.
+class FakeRequest:
+    __slots__ = ('drive', 'method', 'run', 'headers')
+
+    def __init__(self, drive, method, run):
+        self.drive = drive
+        self.method = method
+        self.run = run
+        self.headers = {}
+
+    def execute(self):
+        self.drive.requests[self.method] += 1
+        return self.run(self)
+
+
+# Files resource of the fake service.
+class FakeFiles:
+    __slots__ = ('drive',)
+
+    def __init__(self, drive):
+        self.drive = drive
+
+    # Function to list the files of a folder, one page at a time (at most the page size of the fake service)
+    def list(self, q='', pageSize=100, pageToken=None, fields=None):
+        def run(request):
+            folder_id = re.match(r"'([^']*)' in parents", q).group(1)
+            files = [metadata for metadata in self.drive.metadata.values() if metadata['parents'] == [folder_id]]
+            # Only the requested fields of each file are returned, like the Drive API does.
+            requested = re.search(r'files\(([^)]*)\)', fields or '')
+            if requested:
+                keys = [key.strip() for key in requested.group(1).split(',')]
+                files = [{key: metadata[key] for key in keys if key in metadata} for metadata in files]
+            start, size = int(pageToken or 0), min(pageSize, self.drive.page_size)
+            result = {'files': files[start:start + size]}
+            if start + size < len(files):
+                result['nextPageToken'] = str(start + size)
+            return result
+        return FakeRequest(self.drive, 'list', run)
+
+    # Function to download the bytes of a file, only those of the Range header if there is one
+    def get_media(self, fileId):
+        def run(request):
+            content = self.drive.contents[fileId]
+            start, end = 0, len(content) - 1
+            if 'Range' in request.headers:
+                start, end = map(int, request.headers['Range'].split('=')[1].split('-'))
+            if self.drive.failures_after is not None:
+                if self.drive.failures_after <= 0:
+                    raise IOError('Ligação interrompida (falha simulada)')
+                self.drive.failures_after -= 1
+            # A response may bring fewer bytes than requested; the client asks for the rest.
+            end = min(end, start + self.drive.max_response_bytes - 1)
+            self.drive.ranges.append((fileId, start, end))
+            return content[start:end + 1]
+        return FakeRequest(self.drive, 'get_media', run)
+
+
+# Fake Drive service: a few folders of files kept in memory.
+class FakeDriveService:
+    def __init__(self, page_size=1000, max_response_bytes=None):
+        self.page_size = page_size                    # Maximum number of files per page of a list call
+        self.max_response_bytes = max_response_bytes or float('inf')  # Maximum number of bytes per media response
+        self.failures_after = None                    # Media responses served before every next one fails (None: never)
+        self.metadata = {}                            # Metadata of each file, by file ID
+        self.contents = {}                            # Bytes of each file, by file ID
+        self.ranges = []                              # (file ID, first byte, last byte) of every media response served
+        self.requests = Counter()                     # Number of requests executed, by method (e.g. 'list')
+
+    def files(self):
+        return FakeFiles(self)
+
+    # Function to upload a file to a folder, returning its ID. Files uploaded later are newer.
+    def add_file(self, folder_id, name, content):
+        file_id = f'fake{len(self.metadata) + 1}'
+        created = (datetime(2024, 1, 1) + timedelta(minutes=len(self.metadata))).isoformat() + 'Z'
+        self.metadata[file_id] = {'id': file_id, 'name': name, 'parents': [folder_id], 'createdTime': created,
+                                  'modifiedTime': created, 'md5Checksum': hashlib.md5(content).hexdigest(),
+                                  'size': str(len(content))}
+        self.contents[file_id] = content
+        return file_id
+
+
+# Function to zip a chat text like a WhatsApp export (the chat and, optionally, a media attachment)
+def make_export(chat: bytes, media: bytes = b'') -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr(CHAT_TXT_NAME, chat)
+        if media:
+            archive.writestr('IMG-20240101-WA0001.jpg', media)
+    return buffer.getvalue()
@@ -0,0 +1,116 @@
+import argparse
+import zipfile
+import numpy as np
+import pandas as pd
+from utils.data_extraction import DRINK_EMOJIS, CHAT_TXT_NAME
+
+# Generator of synthetic WhatsApp exports, in the same format as data/_chat.txt ("dd/mm/yy, HH:MM - Autor: msg").
+# Run from the project root with, e.g.: python -m benchmarks.synthetic_chat 1000000 cache/benchmarks/chat_1M.txt
+
+PEOPLE = ['Ronaldo', 'Toy', 'Marcelo', 'Anselmo Ralph', 'Bruno Nogueira', 'Tony Carreira', 'Samuel Mira',
+          'José Mourinho', 'Cândido Costa', 'António Costa', 'Luis Montenegro']
+# Relative frequency of each drink emoji (same order as DRINK_EMOJIS: mini, média, litrosa, vinho).
+DRINK_WEIGHTS = [0.6, 0.25, 0.05, 0.1]
+# Emojis that show up next to the drinks but aren't drinks (including multi-codepoint ones: skin tones, ZWJ sequences).
+OTHER_EMOJIS = ['😂', '👍', '🔥', '🍕', '🙌🏽', '🤦‍♂️', '🥳', '🇵🇹', '❤️', '🫶🏻']
+TEXT_MESSAGES = ['Bora?', 'Hoje não dá', 'Amanhã há jogo', 'Quem paga esta?', 'Isto conta como média?',
+                 'Pessoal. Neste grupo não há mensagem de texto', '<Multimédia omitida>', 'Esta mensagem foi apagada']
+CONTINUATION_LINES = ['🍻 = 1 média', 'Foram duas', 'A seguir vou para casa', 'https://maps.app.goo.gl/xyz']
+SYSTEM_LINES = ['As mensagens e chamadas são encriptadas ponto a ponto.', '‎{} adicionou {}', '‎{} saiu',
+                '‎{} mudou o nome do grupo para "Contabilidade - Cerveja Bebida em emojis"']
+# Hours of the day weighted towards the evening, when most drinks are logged.
+HOUR_WEIGHTS = np.array([3, 2, 1, 1, 0.5, 0.5, 0.5, 0.5, 1, 1, 1, 2, 4, 4, 3, 3, 4, 6, 8, 10, 10, 9, 7, 5], dtype=float)
+
+
+# Function to get the names of n_people people: the known ones first, then numbered ones
+def make_people(n_people):
+    return (PEOPLE + [f'Pessoa {i}' for i in range(len(PEOPLE) + 1, n_people + 1)])[:n_people]
+
+
+# Function to draw sorted message timestamps (in minutes since the start) spread over the given years
+def make_minutes(rng, n_messages, years, start):
+    n_days = max(int(years * 365), 1)
+    days = rng.integers(0, n_days, n_messages)
+    hours = rng.choice(24, n_messages, p=HOUR_WEIGHTS / HOUR_WEIGHTS.sum())
+    minutes = np.sort(days * 1440 + hours * 60 + rng.integers(0, 60, n_messages))
+    return pd.Timestamp(start) + pd.to_timedelta(minutes, unit='min')
+
+
+# Function to format message timestamps as "dd/mm/yy, HH:MM", formatting each distinct day and minute only once
+def format_timestamps(timestamps):
+    day_codes, days = pd.factorize(timestamps.normalize())
+    day_text = pd.DatetimeIndex(days).strftime('%d/%m/%y').to_numpy(dtype=object)
+    minute_text = np.array([f'{m // 60:02d}:{m % 60:02d}' for m in range(1440)], dtype=object)
+    return day_text[day_codes] + ', ' + minute_text[timestamps.hour * 60 + timestamps.minute]
+
+
+# Function to write a chunk of messages, yielding the lines of the export
+def make_lines(rng, timestamps, people, system_ratio, text_ratio, multiline_ratio, emoji_mix_ratio):
+    n_messages = len(timestamps)
+    prefixes = format_timestamps(timestamps)
+    authors = rng.integers(0, len(people), n_messages)
+    kinds = rng.random(n_messages)
+    drink_counts = rng.choice([1, 1, 1, 1, 2, 2, 3], n_messages)
+    drinks = rng.choice(len(DRINK_EMOJIS), (n_messages, 3), p=DRINK_WEIGHTS)
+    mixed = rng.random(n_messages) < emoji_mix_ratio
+    multiline = rng.random(n_messages) < multiline_ratio
+
+    for i in range(n_messages):
+        author = people[authors[i]]
+        if kinds[i] < system_ratio:
+            # System lines have no author separator, so they never count as messages.
+            yield f'{prefixes[i]} - ' + rng.choice(SYSTEM_LINES).format(author, people[authors[i - 1]])
+            continue
+        if kinds[i] < system_ratio + text_ratio:
+            message = rng.choice(TEXT_MESSAGES)
+        else:
+            message = ''.join(DRINK_EMOJIS[code] for code in drinks[i, :drink_counts[i]])
+        if mixed[i]:
+            message += rng.choice(OTHER_EMOJIS)
+        yield f'{prefixes[i]} - {author}: {message}'
+        # Continuation lines of a multi-line message have no prefix (and their drinks aren't counted by the parser).
+        if multiline[i]:
+            yield from rng.choice(CONTINUATION_LINES, rng.integers(1, 3))
+
+
+# Function to generate a synthetic chat export with n_messages messages (system lines included) and write it
+# to output_path: a plain text file, or a WhatsApp-like .zip export with the chat as its only .txt member.
+def generate_chat(output_path, n_messages, n_people=7, years=3.0, system_ratio=0.001, text_ratio=0.05,
+                  multiline_ratio=0.02, emoji_mix_ratio=0.1, start='2021-01-01', seed=0, chunk_messages=500_000):
+    rng = np.random.default_rng(seed)
+    people = make_people(n_people)
+    timestamps = make_minutes(rng, n_messages, years, start)
+
+    if output_path.lower().endswith('.zip'):
+        archive = zipfile.ZipFile(output_path, 'w', compression=zipfile.ZIP_DEFLATED)
+        file = archive.open(CHAT_TXT_NAME, 'w', force_zip64=True)
+    else:
+        archive, file = None, open(output_path, 'wb')
+
+    # Messages are generated and written in chunks, so memory doesn't grow with the size of the export.
+    try:
+        for chunk_start in range(0, n_messages, chunk_messages):
+            chunk = timestamps[chunk_start:chunk_start + chunk_messages]
+            lines = make_lines(rng, chunk, people, system_ratio, text_ratio, multiline_ratio, emoji_mix_ratio)
+            file.write(('\n'.join(lines) + '\n').encode('utf-8'))
+    finally:
+        file.close()
+        if archive is not None:
+            archive.close()
+    return output_path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate a synthetic WhatsApp chat export.')
+    parser.add_argument('messages', type=int, help='number of messages (system lines included)')
+    parser.add_argument('output', help='path of the export (.txt or .zip)')
+    parser.add_argument('--people', type=int, default=7)
+    parser.add_argument('--years', type=float, default=3.0)
+    parser.add_argument('--system-ratio', type=float, default=0.001, help='share of system lines')
+    parser.add_argument('--text-ratio', type=float, default=0.05, help='share of messages without drinks')
+    parser.add_argument('--multiline-ratio', type=float, default=0.02, help='share of messages with continuation lines')
+    parser.add_argument('--emoji-mix-ratio', type=float, default=0.1, help='share of messages with other emojis')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    generate_chat(args.output, args.messages, args.people, args.years, args.system_ratio, args.text_ratio,
+                  args.multiline_ratio, args.emoji_mix_ratio, seed=args.seed)
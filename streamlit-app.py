@@ -1,12 +1,41 @@
+import os
 import streamlit as st
 import pandas as pd
-import os
-from typing import Tuple, List
+import pyarrow as pa
+import cProfile
+from typing import NamedTuple, Tuple, List, Optional
 from datetime import date
-from utils.update_data import update_chat_data
-from utils.google_api import authenticate, get_file_id_by_name, get_latest_file
-from utils.data_extraction import load_data, delete_all_files_in_folder
-from utils.app_plots import calculate_stats, display_key_metrics, display_latest_news, plot_total_consumption, weekly_consumption_pattern, plot_consumption_by_type, hourly_consumption_pattern
+from utils.update_data import update_chat_data, is_newer_export_available
+from utils.google_api import authenticate
+from utils.drive_sync import DriveSyncWorker
+from utils.data_extraction import find_chat_file
+from utils.event_cache import ChatTables, get_tables, get_cache_usage, get_analytics
+from utils.chat_watcher import ChatWatcher
+from utils.table_index import TableIndex
+from utils.groups import Group, load_groups, get_group, GROUP_QUERY_PARAM
+from utils.metrics import DashboardMetrics, compute_metrics
+from utils.compact_events import CompactEvents
+from utils.figure_cache import make_figure_key
+from utils.timeseries import FREQUENCIES
+from utils.instrumentation import stage, trace, get_stage_stats, get_cache_stats, get_rss, log_event, format_profile
+from utils.app_plots import display_key_metrics, display_latest_news, plot_total_consumption, weekly_consumption_pattern, plot_consumption_by_type, hourly_consumption_pattern, consumption_over_time, display_person_trends, load_avatar
+
+# Copy-on-write lets every session work on views of the shared event table without ever modifying it.
+pd.set_option('mode.copy_on_write', True)
+
+# Seconds between two refreshes of the sections of the dashboard in live mode.
+LIVE_REFRESH_SECONDS = 5
+# Seconds between two checks of a pending or running sync by the sessions waiting for it.
+SYNC_STATUS_REFRESH_SECONDS = 2
+
+
+# Filters selected in the sidebar, as applied to the data of the dashboard.
+class DashboardFilters(NamedTuple):
+    date_range: Tuple[date, date]
+    people: List[str]
+    emojis: List[str]
+    value_col: str    # Column the metrics are computed on ('Quantidade (L)' or 'Quantidade')
+    open_ended: bool  # Whether the date range ends at the latest day, so that it follows the new days in live mode
 
 def set_page_config_():
     # Set the configuration for the Streamlit app, including the page title, icon, and layout.
@@ -30,22 +59,22 @@ def set_page_config_():
 
 
 # Function to filter the data based on user-selected filters (date range, people, emojis, and quantity).
-def filter_data(df: pd.DataFrame, date_range: Tuple[date, date], people_filter: List[str], emoji_filter: List[str], quantity_filter: List[str]) -> pd.DataFrame:
-    # Filter by date range.
-    mask = (pd.to_datetime(df['Date'], format='%d/%m/%Y').dt.date >= date_range[0]) & \
-           (pd.to_datetime(df['Date'], format='%d/%m/%Y').dt.date <= date_range[1])
+# It works both on the event table and on the rollup cube, which share the same columns.
+# With the index of the table (see utils.table_index), only the selected rows are touched and the table is never copied.
+def filter_data(df: pd.DataFrame, date_range: Tuple[date, date], people_filter: List[str], emoji_filter: List[str], quantity_filter: List[str], index: Optional[TableIndex] = None) -> pd.DataFrame:
+    if index is not None:
+        return index.select(df, date_range[0], date_range[1], people_filter, emoji_filter)
+
+    # Without an index, filter by date range (the 'Date' column is already a datetime64 day, so there's no parsing here).
+    mask = (df['Date'] >= pd.Timestamp(date_range[0])) & (df['Date'] <= pd.Timestamp(date_range[1]))
     filtered_df = df[mask]
     
-    # Filter by selected people, emojis, and quantity type (liters or number of beers).
+    # Filter by selected people and emojis. The quantity type (liters or number of beers) only picks the column
+    # the metrics are computed on, so no column is copied for it.
     if people_filter:
         filtered_df = filtered_df[filtered_df['Pessoa'].isin(people_filter)]
     if emoji_filter:
         filtered_df = filtered_df[filtered_df['Emoji'].isin(emoji_filter)]
-    if quantity_filter:
-        if quantity_filter == 'Quantidade (L)':
-            filtered_df['Value_Col'] = filtered_df['Quantidade (L)']
-        else:
-            filtered_df['Value_Col'] = filtered_df['Quantidade']
 
     return filtered_df
 
@@ -58,114 +87,360 @@ def create_table_of_contents():
     - [Consumo por Dia da Semana](#consumo-por-dia-da-semana)
     - [Consumo por Tipo de Cerveja](#consumo-por-tipo-de-cerveja)
     - [Consumo por Hora](#consumo-por-hora)
+    - [Consumo ao Longo do Tempo](#consumo-ao-longo-do-tempo)
+    - [Tendências por Pessoa](#tendencias-por-pessoa)
     """)
 
 
-# Function to update the dashboard with the latest data and display it.
-def update_dashboard(file_path: str, dashboard_placeholder: st.empty):
-    df = load_data(file_path)
-    df['Value_Col'] = df['Quantidade (L)']
+# Function to filter the rollup cube of a chat file (with its index) and compute every metric and chart series of the
+# dashboard, returning the metrics and the key of their figures.
+def compute_dashboard(tables: ChatTables, filters: DashboardFilters):
+    cube = tables.cube
+    # An open-ended date range goes up to the latest day of the data, which may be newer than when it was selected.
+    date_range = (filters.date_range[0], cube['Date'].max().date()) if filters.open_ended else filters.date_range
+    with stage('filter_data'):
+        filtered_df = filter_data(cube, date_range, filters.people, filters.emojis, [filters.value_col], tables.cube_index)
+
+    # Compute every metric and chart series in a single pass over the filtered data.
+    with stage('compute_metrics'):
+        metrics = compute_metrics(filtered_df, filters.value_col)
+    # Every figure depends only on the filters, the value column and the version of the data,
+    # so identical interactions (in any session) reuse the figures already built. The version is the one the cube was
+    # built from, so figures are never cached under a newer version than their data.
+    figure_key = make_figure_key(tables.version, tuple(date_range), sorted(filters.people), sorted(filters.emojis), filters.value_col)
+    return metrics, figure_key
+
+
+# Function to get the metrics (and the key of their figures) shown by a session in live mode. They are only computed again
+# when the data changed in a way that alters what the filters select; otherwise the previous ones (and figures) are reused.
+def get_live_dashboard(file_path: str, cache_folder: str, filters: DashboardFilters, watcher: ChatWatcher):
+    # The version is read before the tables, so the tables are at least as new as the version recorded with them.
+    version = watcher.version
+    state = st.session_state.get('live_dashboard')
+    if state is not None and state[0] == filters:
+        shown_version, metrics, figure_key = state[1:]
+        if shown_version == version or not watcher.touches_since(shown_version, filters.date_range, filters.people, filters.emojis, filters.open_ended):
+            st.session_state['live_dashboard'] = (filters, version, metrics, figure_key)
+            return metrics, figure_key
+
+    with stage('get_tables'):
+        tables = get_tables(file_path, cache_folder)
+    metrics, figure_key = compute_dashboard(tables, filters)
+    st.session_state['live_dashboard'] = (filters, version, metrics, figure_key)
+    return metrics, figure_key
+
+
+# Function to display the key metrics section of the dashboard.
+def display_metrics_section(metrics: DashboardMetrics):
+    with stage('display_key_metrics'):
+        display_key_metrics(metrics.total_volume, metrics.avg_daily_consumption, metrics.top_consumer, metrics.favorite_beer)
+
+
+# Function to display the latest updates section of the dashboard.
+def display_news_section(events: CompactEvents):
+    with stage('display_latest_news'):
+        display_latest_news(events)
+
+
+# Function to display the chart sections of the dashboard.
+def display_charts_section(metrics: DashboardMetrics, figure_key: str):
+    st.header('Consumo por Pessoa')
+    with stage('plot_total_consumption'):
+        plot_total_consumption(metrics, figure_key)
+    st.markdown("---")
+    
+    st.header("Consumo por Dia da Semana")
+    with stage('weekly_consumption_pattern'):
+        weekly_consumption_pattern(metrics, figure_key)
+    st.markdown("---")
+    
+    st.header('Consumo por Tipo de Cerveja')
+    with stage('plot_consumption_by_type'):
+        plot_consumption_by_type(metrics, figure_key)
+    st.markdown("---")
+
+    st.header("Consumo por Hora")
+    with stage('hourly_consumption_pattern'):
+        hourly_consumption_pattern(metrics, figure_key)
+    st.markdown("---")
+
+    st.header("Consumo ao Longo do Tempo")
+    frequency = st.radio('Agrupar por', options=list(FREQUENCIES), horizontal=True, key='timeseries_frequency')
+    with stage('consumption_over_time'):
+        consumption_over_time(metrics, frequency, figure_key)
+    st.markdown("---")
+
+
+# Function to display the windowed metrics section of the dashboard: rolling litres, streaks and sessions of each person.
+# They cover the whole history up to the latest drink (the date range doesn't apply), so only the people filter is used.
+def display_trends_section(file_path: str, cache_folder: str, filters: DashboardFilters):
+    st.header('Tendências por Pessoa', anchor='tendencias-por-pessoa')
+    with stage('get_analytics'):
+        version, trends = get_analytics(file_path, cache_folder)
+    if filters.people:
+        trends = trends[trends.index.isin(filters.people)]
+    st.caption('Calculadas sobre todo o histórico, até ao último registo: o filtro de datas não se aplica a esta secção.')
+    with stage('display_person_trends'):
+        display_person_trends(trends, make_figure_key(version, sorted(filters.people)))
+    st.markdown("---")
+
+
+# Live sections of the dashboard: fragments that rerun on their own every few seconds, without rerunning the whole
+# script. Each one only does work when the chat data changed in a way that concerns it (see get_live_dashboard).
+@st.experimental_fragment(run_every=LIVE_REFRESH_SECONDS)
+def live_metrics_section(file_path: str, cache_folder: str, filters: DashboardFilters, watcher: ChatWatcher):
+    with trace('live_update', section='metrics'):
+        metrics, _ = get_live_dashboard(file_path, cache_folder, filters, watcher)
+        display_metrics_section(metrics)
+
+
+@st.experimental_fragment(run_every=LIVE_REFRESH_SECONDS)
+def live_news_section(file_path: str, cache_folder: str):
+    # The latest updates aren't filtered: they are the last events of the cached tables, which the watcher keeps up to date.
+    with trace('live_update', section='news'):
+        events = get_tables(file_path, cache_folder).events
+        display_news_section(events)
+
+
+@st.experimental_fragment(run_every=LIVE_REFRESH_SECONDS)
+def live_trends_section(file_path: str, cache_folder: str, filters: DashboardFilters):
+    # The analytics follow the cached tables, which update them with each new drink instead of recomputing them.
+    with trace('live_update', section='trends'):
+        display_trends_section(file_path, cache_folder, filters)
+
+
+@st.experimental_fragment(run_every=LIVE_REFRESH_SECONDS)
+def live_charts_section(file_path: str, cache_folder: str, filters: DashboardFilters, watcher: ChatWatcher):
+    # Figures are cached by key, so charts whose data didn't change are served again without being rebuilt.
+    with trace('live_update', section='charts'):
+        metrics, figure_key = get_live_dashboard(file_path, cache_folder, filters, watcher)
+        display_charts_section(metrics, figure_key)
+
+
+# Function to update the dashboard with the latest data of a group and display it.
+# In live mode (with the group's watcher), the metrics, the latest updates and the charts refresh on their own.
+def update_dashboard(file_path: str, cache_folder: str, dashboard_placeholder: st.empty, watcher: Optional[ChatWatcher] = None):
+    # The events are only used for the latest updates; metrics and charts are answered from the rollup cube,
+    # so their cost depends on the number of (day, hour, person, drink) cells and not on the number of drinks.
+    # Each stage is timed (see utils.instrumentation); the chart stages include the serialization of the figures.
+    with stage('get_tables'):
+        tables = get_tables(file_path, cache_folder)
+    events, cube = tables.events, tables.cube
 
     # Sidebar Filters
     st.sidebar.header('Filtros')
-    df_date = pd.to_datetime(df['Date'], format='%d/%m/%Y')
+    first_date, last_date = cube['Date'].min(), cube['Date'].max()
 
     # Date range filter.
     date_range = st.sidebar.date_input(
         'Selecionar Datas',
-        value=(df_date.min(), df_date.max()),
-        min_value=df_date.min(),
-        max_value=df_date.max()
+        value=(first_date, last_date),
+        min_value=first_date,
+        max_value=last_date
     )
     
     if len(date_range) < 2:
         date_range = (date_range[0], date_range[0])
     
     # People, emoji, and quantity filters.
-    people_filter = st.sidebar.multiselect('Selecionar Pessoa', options=df['Pessoa'].unique())
-    emoji_filter = st.sidebar.multiselect('Selecionar Emojis', options=df['Emoji'].unique())
+    people_filter = st.sidebar.multiselect('Selecionar Pessoa', options=cube['Pessoa'].unique())
+    emoji_filter = st.sidebar.multiselect('Selecionar Emojis', options=cube['Emoji'].unique())
     quantity_filter = st.sidebar.multiselect('Selecionar Quantidade', options=['Quantidade (L)', 'Número de Cervejas'])
 
     if date_range[0] > date_range[1]:
         st.sidebar.error("Erro: Data de início deve ser anterior à data de fim.")
         st.stop()
     
-    filtered_df = filter_data(df, date_range, people_filter, emoji_filter, quantity_filter)
-    total_volume, avg_daily_consumption, top_consumer, favorite_beer = calculate_stats(filtered_df)
-    
     # Handle case when no quantity filter is selected.
     if quantity_filter == []:
         quantity_filter = ['Quantidade (L)']
     elif quantity_filter == ['Número de Cervejas']:
         quantity_filter = ['Quantidade']
 
+    filters = DashboardFilters(tuple(date_range), people_filter, emoji_filter, quantity_filter[0], date_range[1] == last_date.date())
+
     # Display the dashboard with filtered data and charts.
     with dashboard_placeholder.container():
-        display_key_metrics(total_volume, avg_daily_consumption, top_consumer, favorite_beer)
+        if watcher is None:
+            metrics, figure_key = compute_dashboard(tables, filters)
+            display_metrics_section(metrics)
+        else:
+            live_metrics_section(file_path, cache_folder, filters, watcher)
         st.markdown("---")
 
         create_table_of_contents()
         st.markdown("---")
         
         st.header('Últimas Atualizações')
-        display_latest_news(df)
+        if watcher is None:
+            display_news_section(events)
+        else:
+            live_news_section(file_path, cache_folder)
         st.markdown("---")
 
-        st.header('Consumo por Pessoa')
-        plot_total_consumption(filtered_df, quantity_filter[0])
-        st.markdown("---")
-        
-        st.header("Consumo por Dia da Semana")
-        weekly_consumption_pattern(filtered_df, quantity_filter[0])
-        st.markdown("---")
-        
-        st.header('Consumo por Tipo de Cerveja')
-        plot_consumption_by_type(filtered_df, quantity_filter[0])
-        st.markdown("---")
+        if watcher is None:
+            display_charts_section(metrics, figure_key)
+            display_trends_section(file_path, cache_folder, filters)
+        else:
+            live_charts_section(file_path, cache_folder, filters, watcher)
+            live_trends_section(file_path, cache_folder, filters)
 
-        st.header("Consumo por Hora")
-        hourly_consumption_pattern(filtered_df, quantity_filter[0])
-        st.markdown("---")
+
+# Function to authenticate with Google API (once per process).
+@st.cache_resource
+def get_drive_service():
+    return authenticate()
+
+
+# Function to read the registry of the groups served by this instance (once per process).
+@st.cache_resource
+def get_groups():
+    return load_groups()
+
+
+# Function to start (once per process and group) the background worker that syncs the group's chat data with Google Drive.
+@st.cache_resource
+def get_sync_worker(group_id: str) -> DriveSyncWorker:
+    service = get_drive_service()
+    group = get_groups()[group_id]
+    # Each sync is traced like a rerun of the dashboard, with the timings of its stages.
+    def sync():
+        with trace('update_chat_data', group=group_id):
+            return update_chat_data(service, group.folder_id, group.data_folder, group.sync_state_path)
+
+    # New exports are merged into the group's chat file, whose cached tables follow it on the next rerun (only the
+    # appended messages are parsed), so nothing is invalidated here.
+    return DriveSyncWorker(sync)
+
+
+# Function to start (once per process and group) the background watcher that keeps the group's cached tables up to date
+# with its chat file, for the sessions in live mode.
+@st.cache_resource
+def get_chat_watcher(group_id: str) -> ChatWatcher:
+    group = get_groups()[group_id]
+    return ChatWatcher(group.data_folder, group.cache_folder)
+
+
+# Function to show that a sync of a group is pending or running. The fragment checks the worker on its own every few
+# seconds and, once the sync finished, reruns the whole app, so the session shows its outcome and the new data at once.
+@st.experimental_fragment(run_every=SYNC_STATUS_REFRESH_SECONDS)
+def display_sync_progress(sync_worker: DriveSyncWorker, seen_count: int):
+    if sync_worker.sync_count > seen_count or not sync_worker.is_busy:
+        st.rerun()
+    st.info('Atualizando dados...')
+
+
+# Function to show the outcome of the background syncs of a group in the sidebar, once per finished sync for each session.
+def display_sync_status(sync_worker: DriveSyncWorker, group: Group):
+    seen_key = f'seen_sync_count_{group.group_id}'
+    if seen_key not in st.session_state:
+        st.session_state[seen_key] = sync_worker.sync_count
+
+    # A requested sync may not have started yet (is_syncing is still False), so pending syncs count as running.
+    if sync_worker.is_busy:
+        with st.sidebar:
+            display_sync_progress(sync_worker, st.session_state[seen_key])
+        return
+    if sync_worker.sync_count > st.session_state[seen_key]:
+        st.session_state[seen_key] = sync_worker.sync_count
+        if sync_worker.last_error:
+            st.sidebar.error(f'Erro ao atualizar dados: {sync_worker.last_error}')
+        elif sync_worker.last_changed:
+            st.sidebar.success('Dados atualizados com sucesso!')
+        else:
+            st.sidebar.warning('Não há novos dados para atualizar.')
+
+    # Answered from a cached snapshot of the Drive folder, so reruns don't add round trips to Drive.
+    if is_newer_export_available(get_drive_service(), group.folder_id, group.sync_state_path):
+        st.sidebar.info('Há uma nova exportação no Google Drive.')
+
+
+# Function to show the hidden diagnostics panel (opened with '?diagnostico=1' in the URL): latency percentiles of each
+# stage, cache hit rates and memory footprint of the cached tables, plus optional cProfile captures of each rerun.
+def display_diagnostics(file_path: str, cache_folder: str):
+    with st.sidebar.expander('Diagnóstico', expanded=True):
+        st.checkbox('Perfilar cada execução (cProfile)', key='profile_reruns')
+
+        st.markdown('**Latência por etapa**')
+        stage_stats = get_stage_stats()
+        st.dataframe(pd.DataFrame(stage_stats), hide_index=True)
+
+        st.markdown('**Caches**')
+        avatars = load_avatar.cache_info()
+        cache_stats = get_cache_stats() + [{'cache': 'avatars', 'hits': avatars.hits, 'misses': avatars.misses,
+                                            'hit_rate': round(avatars.hits / (avatars.hits + avatars.misses), 3) if avatars.hits + avatars.misses else None}]
+        st.dataframe(pd.DataFrame(cache_stats), hide_index=True)
+
+        st.markdown('**Memória**')
+        events, cube = get_tables(file_path, cache_folder)[:2]
+        memory = {
+            'eventos_mb': round(events.nbytes / 1e6, 1),
+            'bytes_por_evento': round(events.nbytes / max(len(events), 1), 2),
+            'cubo_mb': round(cube.memory_usage(deep=True).sum() / 1e6, 1),
+            'arrow_mb': round(pa.total_allocated_bytes() / 1e6, 1),
+            'rss_mb': round(get_rss() / 1e6, 1),
+            # Tables of every group loaded in the process (the least recently used are unloaded first).
+            'grupos_carregados_mb': {path: round(size / 1e6, 1) for path, size in get_cache_usage().items()},
+        }
+        st.json(memory)
+
+        if 'last_profile' in st.session_state:
+            st.markdown('**cProfile (última execução)**')
+            st.code(st.session_state['last_profile'], language=None)
+
+        # The same numbers as one structured log entry, which Cloud Run can aggregate.
+        if st.button('Exportar para os logs'):
+            log_event('performance_summary', force=True, stages=stage_stats, caches=cache_stats, memory=memory, events=len(events))
+            st.success('Resumo escrito nos logs.')
 
 
 # Main function to initialize the app, authenticate, and manage data updates.
 def main():
-    data_folder = 'data'
-    zip_file_name = 'chat_data.zip'
-    txt_file_name = '_chat.txt'
     google_connection = False
     
-    # Authenticate with Google API.
-    if google_connection:
-        service = authenticate()
-    txt_file_path = os.path.join(data_folder, txt_file_name)
-    
     # Set the page configuration and title.
     set_page_config_()
     st.title('Contabilidade 🍺')
 
+    # The group is chosen in the URL (e.g. '?grupo=contabilidade'); without it, the first group of the registry is shown.
+    groups = get_groups()
+    group = get_group(groups, st.query_params.get(GROUP_QUERY_PARAM))
+    if group is None:
+        st.error(f"Grupo desconhecido: {st.query_params.get(GROUP_QUERY_PARAM)}")
+        st.stop()
+    if len(groups) > 1:
+        st.caption(group.name)
+    sync_enabled = google_connection and group.folder_id is not None
+
     # Create a placeholder for dynamically updating the dashboard.
     dashboard_placeholder = st.empty()
     
     # Sidebar button to manually trigger data updates.
+    # The sync runs in a background worker, so the dashboard stays usable (with the current data) meanwhile.
     st.sidebar.header('Opções')
     if st.sidebar.button('Atualizar Dados'):
-        with st.spinner('Atualizando dados...'):
-            if google_connection:
-                current_file_id = get_file_id_by_name(service, zip_file_name)
-                latest_file_id = get_latest_file(service)
-                if latest_file_id != current_file_id:
-                    delete_all_files_in_folder(data_folder)
-                    update_chat_data(service)
-                    st.success('Dados atualizados com sucesso!')
-                    st.experimental_rerun()
-                else:
-                    st.warning('Não há novos dados para atualizar.')
-            else:
-                pass
+        if sync_enabled:
+            get_sync_worker(group.group_id).request_sync()
+    if sync_enabled:
+        display_sync_status(get_sync_worker(group.group_id), group)
+    # In live mode, new drinks show up within seconds of being appended to the chat file (or synced), without reruns.
+    live_mode = st.sidebar.toggle('Modo ao vivo', key='live_mode')
             
-    # Update and display the dashboard with the latest data.
-    update_dashboard(txt_file_path, dashboard_placeholder)
+    # Update and display the dashboard with the latest data of the group (the synced .zip export, or the plain chat text).
+    file_path = find_chat_file(group.data_folder)
+    if not os.path.exists(file_path):
+        st.info('Ainda não há dados para este grupo.')
+        st.stop()
+
+    # Every rerun is traced; with profiling turned on in the diagnostics panel it is also profiled with cProfile.
+    profiler = cProfile.Profile() if st.session_state.get('profile_reruns') else None
+    with trace('update_dashboard', profiler, group=group.group_id):
+        update_dashboard(file_path, group.cache_folder, dashboard_placeholder, get_chat_watcher(group.group_id) if live_mode else None)
+    if profiler is not None:
+        st.session_state['last_profile'] = format_profile(profiler)
+
+    if st.query_params.get('diagnostico') == '1':
+        display_diagnostics(file_path, group.cache_folder)
 
 # Run the main function when the script is executed.
 if __name__ == '__main__':
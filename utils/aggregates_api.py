@@ -0,0 +1,221 @@
+import os
+import json
+import hashlib
+import argparse
+import threading
+import traceback
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import NamedTuple, Optional, Tuple
+from urllib.parse import urlsplit, parse_qs
+from utils.data_extraction import find_chat_file
+from utils.event_cache import get_tables, get_data_version
+from utils.groups import Group, load_groups, get_group
+from utils.metrics import compute_metrics, WEEKDAY_NAMES
+from utils.instrumentation import stage, record_cache
+
+# Read-only HTTP API with the aggregates of the dashboard (totals, per person, per drink, per weekday and per hour) as JSON,
+# for other tools (e.g. a leaderboard on a TV or a bot) to poll without going through Streamlit.
+# Run from the project root with: python -m utils.aggregates_api [--port 8081]
+# and query it with, e.g.: GET /agregados?grupo=contabilidade&inicio=2024-01-01&fim=2024-12-31&pessoa=Toy&bebida=Mini&valor=cervejas
+
+API_PORT = int(os.environ.get('AGGREGATES_API_PORT', 8081))
+AGGREGATES_PATH = '/agregados'
+# Column the aggregates are computed on, by value of the 'valor' parameter.
+VALUE_COLUMNS = {'litros': 'Quantidade (L)', 'cervejas': 'Quantidade'}
+# Maximum number of responses kept; the least recently used ones (e.g. of older versions of the data) are dropped first.
+MAX_RESPONSES = 256
+
+# Module-level state is shared by every request thread of the server.
+# Response bodies, keyed by (data version, query), in order of use.
+_responses = OrderedDict()
+# Responses being computed, keyed like _responses, so concurrent identical requests wait for one computation.
+_pending = {}
+_lock = threading.Lock()
+
+
+# Error of a request, answered with its HTTP status and message.
+class RequestError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+# Filters of a request, normalized so that equivalent requests share their response.
+class AggregatesQuery(NamedTuple):
+    group_id: str
+    date_range: Tuple[Optional[date], Optional[date]]  # None for the first (or last) day of the data
+    people: Tuple[str, ...]                             # Sorted; empty for everyone
+    drinks: Tuple[str, ...]                             # Sorted; empty for every drink
+    value_col: str
+
+
+# Function to parse the query string of a request into its filters (people and drinks can be repeated or comma-separated)
+def parse_query(query_string, groups) -> AggregatesQuery:
+    params = parse_qs(query_string)
+    group = get_group(groups, params.get('grupo', [None])[-1])
+    if group is None:
+        raise RequestError(404, f"Grupo desconhecido: {params['grupo'][-1]}")
+
+    def get_list(name):
+        return tuple(sorted({value for values in params.get(name, []) for value in values.split(',') if value}))
+
+    def get_date(name):
+        value = params.get(name, [None])[-1]
+        try:
+            return date.fromisoformat(value) if value else None
+        except ValueError:
+            raise RequestError(400, f"Data inválida em '{name}': {value} (formato AAAA-MM-DD)")
+
+    value = params.get('valor', ['litros'])[-1]
+    if value not in VALUE_COLUMNS:
+        raise RequestError(400, f"Valor inválido: {value} (opções: {', '.join(VALUE_COLUMNS)})")
+    date_range = (get_date('inicio'), get_date('fim'))
+    if None not in date_range and date_range[0] > date_range[1]:
+        raise RequestError(400, 'A data de início deve ser anterior à data de fim.')
+    return AggregatesQuery(group.group_id, date_range, get_list('pessoa'), get_list('bebida'), VALUE_COLUMNS[value])
+
+
+# Function to convert a Series of aggregates to a JSON object (days of the week without drinks are null)
+def to_json_object(series, labels=None):
+    keys = [labels[key] if labels else key for key in series.index]
+    # tolist gives Python numbers; NaN (the only value not equal to itself) becomes null.
+    return {str(key): (None if value != value else value) for key, value in zip(keys, series.tolist())}
+
+
+# Function to compute the aggregates of a group for the filters of a query, as a JSON-serializable dictionary
+def compute_aggregates(group: Group, query: AggregatesQuery) -> dict:
+    file_path = find_chat_file(group.data_folder)
+    _, cube, cube_index, _ = get_tables(file_path, group.cache_folder)
+    first_date, last_date = cube['Date'].min().date(), cube['Date'].max().date()
+    start, end = query.date_range[0] or first_date, query.date_range[1] or last_date
+    filtered_df = cube_index.select(cube, start, end, list(query.people), list(query.drinks))
+    metrics = compute_metrics(filtered_df, query.value_col)
+    return {
+        'grupo': group.group_id,
+        'filtros': {'inicio': start.isoformat(), 'fim': end.isoformat(), 'pessoas': list(query.people),
+                    'bebidas': list(query.drinks), 'valor': query.value_col},
+        'total_litros': round(metrics.total_volume, 2),
+        'media_diaria_litros': round(metrics.avg_daily_consumption, 2),
+        'principal_consumidor': metrics.top_consumer,
+        'cerveja_favorita': metrics.favorite_beer,
+        'por_pessoa': to_json_object(metrics.per_person),
+        'por_bebida': to_json_object(metrics.per_drink),
+        'por_dia_da_semana': to_json_object(metrics.per_weekday, WEEKDAY_NAMES),
+        'por_hora': to_json_object(metrics.per_hour),
+    }
+
+
+# Function to get the key of the response to a query: the version of the group's data and the query itself
+def get_response_key(group: Group, query: AggregatesQuery):
+    file_path = find_chat_file(group.data_folder)
+    if not os.path.exists(file_path):
+        raise RequestError(404, 'Ainda não há dados para este grupo.')
+    return get_data_version(file_path, group.cache_folder), query
+
+
+# Function to get the ETag of a response: it only changes when the data (or the query) does
+def make_etag(key) -> str:
+    return '"' + hashlib.sha256(repr(key).encode('utf-8')).hexdigest()[:32] + '"'
+
+
+# Function to get the JSON body of the response with a key, computing it only once per version of the data,
+# however many requests ask for it at the same time.
+def get_response_body(group: Group, query: AggregatesQuery, key) -> bytes:
+    with _lock:
+        body = _responses.get(key)
+        if body is not None:
+            _responses.move_to_end(key)
+        future = _pending.get(key)
+        owner = body is None and future is None
+        if owner:
+            future = _pending[key] = Future()
+    record_cache('api', not owner)
+    if body is not None:
+        return body
+    if not owner:
+        return future.result()
+
+    try:
+        with stage('api_compute'):
+            body = json.dumps(compute_aggregates(group, query), ensure_ascii=False).encode('utf-8')
+    except BaseException as e:
+        with _lock:
+            _pending.pop(key, None)
+        future.set_exception(e)
+        raise
+    with _lock:
+        _pending.pop(key, None)
+        _responses[key] = body
+        while len(_responses) > MAX_RESPONSES:
+            _responses.popitem(last=False)
+    future.set_result(body)
+    return body
+
+
+# Handler of the requests: GET of the aggregates, answered with 304 (and no body) when the client's ETag is still current.
+class AggregatesHandler(BaseHTTPRequestHandler):
+    # Connections are kept open between requests, so pollers don't reconnect every time.
+    protocol_version = 'HTTP/1.1'
+    groups = None
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        try:
+            if url.path != AGGREGATES_PATH:
+                raise RequestError(404, f'Caminho desconhecido: {url.path}')
+            query = parse_query(url.query, self.groups)
+            group = self.groups[query.group_id]
+            key = get_response_key(group, query)
+            etag = make_etag(key)
+            if etag in (tag.strip() for tag in self.headers.get('If-None-Match', '').split(',')):
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.end_headers()
+                return
+            body = get_response_body(group, query, key)
+        except RequestError as e:
+            self.send_error_json(e.status, str(e))
+            return
+        except Exception as e:
+            traceback.print_exc()
+            self.send_error_json(500, f'Erro interno: {e}')
+            return
+        self.send_json(200, body, etag)
+
+    # Function to send a JSON response; clients must revalidate it (with its ETag) before reusing it
+    def send_json(self, status, body, etag=None):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-cache')
+        if etag:
+            self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    # Function to send an error as a JSON response
+    def send_error_json(self, status, message):
+        self.send_json(status, json.dumps({'erro': message}, ensure_ascii=False).encode('utf-8'))
+
+    # Requests are not logged one by one (pollers would flood the logs).
+    def log_message(self, format, *args):
+        pass
+
+
+# Function to create the server of the aggregates API (each request is answered in its own thread)
+def make_server(host='0.0.0.0', port=API_PORT, groups=None) -> ThreadingHTTPServer:
+    handler = type('Handler', (AggregatesHandler,), {'groups': groups or load_groups()})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve the aggregates of the dashboard as JSON over HTTP.')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=API_PORT)
+    args = parser.parse_args()
+    server = make_server(args.host, args.port)
+    print(f'A servir {AGGREGATES_PATH} em http://{args.host}:{args.port}')
+    server.serve_forever()
@@ -0,0 +1,219 @@
+import os
+import numpy as np
+import pandas as pd
+from collections import deque
+from utils.compact_events import CompactEvents
+from utils.data_extraction import DRINK_NAMES
+from utils.event_store import DRINK_VOLUMES_CL
+
+# Windowed metrics of each person over the whole history: litres of the last days, drinking streaks (consecutive days
+# with at least one drink) and sessions (drinks of a person less than SESSION_GAP_MINUTES apart). They are kept as a small
+# state per person that each new event updates in O(1) amortized, so lines appended to a chat don't reprocess its history.
+# The same state is also built with vectorized operations over the whole event table: when the events are loaded, when
+# events are removed (which the incremental updates can't undo), and as the oracle of benchmarks/check_analytics.py.
+
+# Rolling windows of the litres of each person, in days (ending on the day of the latest drink of the chat).
+ROLLING_WINDOWS = (7, 30)
+# Maximum number of minutes between two drinks of a person for them to belong to the same session.
+SESSION_GAP_MINUTES = int(os.environ.get('SESSION_GAP_MINUTES', 60))
+MINUTES_PER_DAY = 24 * 60
+# Volume of each drink (in centilitres), indexed by drink code: sums of integers stay exact however they are added up.
+DRINK_VOLUMES = np.array([DRINK_VOLUMES_CL[name] for name in DRINK_NAMES], dtype=np.int64)
+# Columns of the per-person table, besides the rolling windows ('Últimos N dias (L)').
+STREAK_COLUMNS = ['Sequência atual (dias)', 'Maior sequência (dias)']
+SESSION_COLUMNS = ['Sessões', 'Bebidas por sessão', 'Maior sessão (bebidas)', 'Sessão atual (bebidas)']
+
+
+# Function to get the name of the column of a rolling window
+def get_window_column(window: int) -> str:
+    return f'Últimos {window} dias (L)'
+
+
+# Function to get the litres of the days of a window after a given day. Days only leave the window kept by the state when
+# the person drinks again, so the ones that left it since (the oldest) are subtracted here.
+def get_window_litres(person_days, centilitres, after_day):
+    for day, volume in person_days:
+        if day > after_day:
+            break
+        centilitres -= volume
+    return centilitres / 100
+
+
+# Per-person state of the windowed metrics of a chat, for the events it has seen (in chat order).
+# Each field is a list indexed by person code (see utils.compact_events). Updating it with new events gives a new state,
+# so the sessions holding the previous one (with the previous tables) are unaffected.
+class PersonAnalytics:
+    __slots__ = ('session_gap', 'people', 'last_minute', 'drinks', 'last_day', 'current_streak', 'longest_streak',
+                 'last_drink', 'sessions', 'session_drinks', 'longest_session', 'window_days', 'window_sums', 'table')
+
+    def __init__(self, session_gap: int = SESSION_GAP_MINUTES):
+        self.session_gap = session_gap
+        self.people = np.array([], dtype=object)
+        self.last_minute = None       # Minute of the latest drink of the chat
+        self.drinks = []              # Number of drinks
+        self.last_day = []            # Day of the latest drink (days since 1970-01-01)
+        self.current_streak = []      # Length of the streak ending on last_day
+        self.longest_streak = []
+        self.last_drink = []          # Minute of the latest drink
+        self.sessions = []            # Number of sessions
+        self.session_drinks = []      # Drinks of the latest session
+        self.longest_session = []     # Drinks of the largest session
+        # For each rolling window: the (day, centilitres) of the days with drinks within the window, oldest first,
+        # and the centilitres of those days.
+        self.window_days = [[] for _ in ROLLING_WINDOWS]
+        self.window_sums = [[] for _ in ROLLING_WINDOWS]
+        self.table = None             # Per-person table, built once when first asked for
+
+    def __len__(self):
+        return len(self.drinks)
+
+    # Function to add the state of new people (with the next codes), before their first drink
+    def add_people(self, people: np.ndarray):
+        for _ in range(len(people) - len(self.people)):
+            for field in (self.drinks, self.current_streak, self.longest_streak, self.sessions, self.session_drinks, self.longest_session):
+                field.append(0)
+            self.last_day.append(None)
+            self.last_drink.append(None)
+            for days, sums in zip(self.window_days, self.window_sums):
+                days.append(deque())
+                sums.append(0)
+        self.people = people
+
+    # Function to add one drink of a person (in chat order): O(1) amortized, since each day leaves each window only once.
+    def update(self, minute: int, person: int, centilitres: int):
+        day = minute // MINUTES_PER_DAY
+        self.drinks[person] += 1
+        self.last_minute = minute if self.last_minute is None else max(self.last_minute, minute)
+
+        # Streaks: a drink on the day after the previous one extends the streak, a later one starts a new one.
+        last_day = self.last_day[person]
+        new_day = day != last_day
+        if new_day:
+            self.current_streak[person] = self.current_streak[person] + 1 if last_day is not None and day == last_day + 1 else 1
+            self.longest_streak[person] = max(self.longest_streak[person], self.current_streak[person])
+            self.last_day[person] = day
+
+        # Rolling windows: the drink is added to its day, and the days that left the window are dropped.
+        for window, days, sums in zip(ROLLING_WINDOWS, self.window_days, self.window_sums):
+            person_days = days[person]
+            if new_day:
+                person_days.append([day, centilitres])
+            else:
+                person_days[-1][1] += centilitres
+            sums[person] += centilitres
+            while person_days[0][0] <= day - window:
+                sums[person] -= person_days.popleft()[1]
+
+        # Sessions: a drink too long after the previous one starts a new session.
+        last_drink = self.last_drink[person]
+        if last_drink is None or minute - last_drink > self.session_gap:
+            self.sessions[person] += 1
+            self.session_drinks[person] = 0
+        self.session_drinks[person] += 1
+        self.longest_session[person] = max(self.longest_session[person], self.session_drinks[person])
+        self.last_drink[person] = minute
+
+    # Function to get a copy of the state, to be updated without changing this one
+    def copy(self) -> 'PersonAnalytics':
+        state = PersonAnalytics(self.session_gap)
+        state.people, state.last_minute = self.people, self.last_minute
+        for name in ('drinks', 'last_day', 'current_streak', 'longest_streak', 'last_drink', 'sessions', 'session_drinks', 'longest_session'):
+            setattr(state, name, list(getattr(self, name)))
+        state.window_days = [[deque([day, centilitres] for day, centilitres in person_days) for person_days in days] for days in self.window_days]
+        state.window_sums = [list(sums) for sums in self.window_sums]
+        return state
+
+    # Function to get the state with the events from `start` on added, one by one (e.g. the lines appended to a chat).
+    # The events before `start` must be the ones this state has seen.
+    def extend(self, events: CompactEvents, start: int = 0) -> 'PersonAnalytics':
+        state = self.copy()
+        state.add_people(events.people)
+        centilitres = DRINK_VOLUMES[events.drink_codes[start:]]
+        for minute, person, volume in zip(events.minutes[start:].tolist(), events.person_codes[start:].tolist(), centilitres.tolist()):
+            state.update(minute, person, volume)
+        return state
+
+    # Function to build the state of a whole event table with vectorized operations (the same state as adding its events
+    # one by one with update): the events are grouped by person, keeping their chat order.
+    @classmethod
+    def from_events(cls, events: CompactEvents, session_gap: int = SESSION_GAP_MINUTES) -> 'PersonAnalytics':
+        state = cls(session_gap)
+        state.add_people(events.people)
+        if not len(events):
+            return state
+        n_people = len(events.people)
+        order = np.argsort(events.person_codes, kind='stable')
+        persons = events.person_codes[order].astype(np.intp)
+        minutes = events.minutes[order].astype(np.int64)
+        centilitres = DRINK_VOLUMES[events.drink_codes[order]]
+        days = minutes // MINUTES_PER_DAY
+        first = np.r_[True, persons[1:] != persons[:-1]]
+        last = np.r_[first[1:], True]
+        state.last_minute = int(events.minutes.max())
+        state.drinks = np.bincount(persons, minlength=n_people).tolist()
+
+        # Days with drinks of each person, in order (a new entry whenever the day changes, like update).
+        day_starts = np.flatnonzero(first | (days != np.r_[-1, days[:-1]]))
+        day_persons, day_values = persons[day_starts], days[day_starts]
+        day_volumes = np.add.reduceat(centilitres, day_starts)
+        continues = np.r_[False, (day_persons[1:] == day_persons[:-1]) & (day_values[1:] == day_values[:-1] + 1)]
+        # Each streak is a run of entries continuing the previous one; its length is counted at every entry.
+        run_starts = np.flatnonzero(~continues)
+        streaks = np.arange(len(day_starts)) - np.repeat(run_starts, np.diff(np.r_[run_starts, len(day_starts)])) + 1
+        person_last_entry = np.flatnonzero(np.r_[day_persons[1:] != day_persons[:-1], True])
+        longest_streak = np.zeros(n_people, dtype=np.int64)
+        np.maximum.at(longest_streak, day_persons, streaks)
+        last_day = np.full(n_people, -1, dtype=np.int64)
+        last_day[day_persons[person_last_entry]] = day_values[person_last_entry]
+        current_streak = np.zeros(n_people, dtype=np.int64)
+        current_streak[day_persons[person_last_entry]] = streaks[person_last_entry]
+        state.longest_streak, state.current_streak = longest_streak.tolist(), current_streak.tolist()
+        state.last_day = [int(day) if day >= 0 else None for day in last_day]
+
+        # Rolling windows: the days after the last day of each person minus the window (the ones update keeps).
+        for window, window_days, window_sums in zip(ROLLING_WINDOWS, state.window_days, state.window_sums):
+            kept = day_values > last_day[day_persons] - window
+            window_sums[:] = np.bincount(day_persons[kept], day_volumes[kept], n_people).astype(np.int64).tolist()
+            for person, day, volume in zip(day_persons[kept].tolist(), day_values[kept].tolist(), day_volumes[kept].tolist()):
+                window_days[person].append([day, volume])
+
+        # Sessions: a new one starts with the first drink of each person and after every gap longer than session_gap.
+        session_starts = np.flatnonzero(first | (minutes - np.r_[0, minutes[:-1]] > session_gap))
+        session_persons = persons[session_starts]
+        session_sizes = np.diff(np.r_[session_starts, len(minutes)])
+        longest_session = np.zeros(n_people, dtype=np.int64)
+        np.maximum.at(longest_session, session_persons, session_sizes)
+        person_last_session = np.flatnonzero(np.r_[session_persons[1:] != session_persons[:-1], True])
+        session_drinks = np.zeros(n_people, dtype=np.int64)
+        session_drinks[session_persons[person_last_session]] = session_sizes[person_last_session]
+        last_drink = np.full(n_people, -1, dtype=np.int64)
+        last_drink[persons[last]] = minutes[last]
+        state.sessions = np.bincount(session_persons, minlength=n_people).tolist()
+        state.longest_session, state.session_drinks = longest_session.tolist(), session_drinks.tolist()
+        state.last_drink = [int(minute) if minute >= 0 else None for minute in last_drink]
+        return state
+
+    # Function to get the per-person table of the windowed metrics, as of the latest drink of the chat: the windows end
+    # on its day, a streak is current if it reached that day or the day before, and a session if it's still open then.
+    def to_frame(self) -> pd.DataFrame:
+        if self.table is not None:
+            return self.table
+        ref_minute = self.last_minute if self.last_minute is not None else 0
+        ref_day = ref_minute // MINUTES_PER_DAY
+        columns = {}
+        for window, days, sums in zip(ROLLING_WINDOWS, self.window_days, self.window_sums):
+            columns[get_window_column(window)] = [get_window_litres(person_days, total, ref_day - window) for person_days, total in zip(days, sums)]
+        columns[STREAK_COLUMNS[0]] = [streak if day is not None and day >= ref_day - 1 else 0 for streak, day in zip(self.current_streak, self.last_day)]
+        columns[STREAK_COLUMNS[1]] = self.longest_streak
+        drinks, sessions = np.array(self.drinks, dtype=float), np.array(self.sessions, dtype=float)
+        columns[SESSION_COLUMNS[0]] = self.sessions
+        columns[SESSION_COLUMNS[1]] = np.divide(drinks, sessions, out=np.zeros_like(drinks), where=sessions > 0)
+        columns[SESSION_COLUMNS[2]] = self.longest_session
+        columns[SESSION_COLUMNS[3]] = [size if minute is not None and ref_minute - minute <= self.session_gap else 0 for size, minute in zip(self.session_drinks, self.last_drink)]
+        self.table = pd.DataFrame(columns, index=pd.Index(self.people, name='Pessoa'))
+        return self.table
+
+
+# Function to compute the per-person table of the windowed metrics of an event table from scratch (vectorized)
+def compute_analytics(events: CompactEvents, session_gap: int = SESSION_GAP_MINUTES) -> pd.DataFrame:
+    return PersonAnalytics.from_events(events, session_gap).to_frame()
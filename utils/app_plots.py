@@ -1,51 +1,108 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-import emoji
 import os
-from typing import Tuple
+import io
+import functools
+from PIL import Image, ImageDraw, ImageFont
+from typing import Optional, Tuple
+from utils.metrics import DashboardMetrics, compute_metrics, WEEKDAY_NAMES
+from utils.compact_events import CompactEvents
+from utils.figure_cache import get_figure
+from utils.timeseries import resample_consumption
+from utils.analytics import ROLLING_WINDOWS, STREAK_COLUMNS, SESSION_COLUMNS, get_window_column
 
 # Dictionary that maps textual descriptions of drink sizes to their respective emoji.
 EMOJI_MAPPING = {'mini': '🍺', 'média': '🍻', 'litrosa': '🍾', 'vinho': '🍷'}
 
+# Folder with the profile pictures, one '<Pessoa>.png' per person.
+PROFILE_IMAGES_FOLDER = 'circular_profile_images'
+# Side (in pixels) of the avatar thumbnails: twice the displayed width, so they stay sharp on high-density screens.
+AVATAR_SIZE = 100
+# Number of entries of the latest updates shown at first, and added by each click on 'Ver mais'.
+NEWS_PAGE_SIZE = 5
+
 
 # Function to calculate key statistics like total volume, average daily consumption, top consumer, and favorite beer.
+# The DataFrame can be the event table or the rollup cube, where 'Quantidade' holds the number of drinks of each cell.
 def calculate_stats(df: pd.DataFrame) -> Tuple[float, float, str, str]:
-    total_volume = df['Quantidade (L)'].sum()
-    avg_daily_consumption = df.groupby('Date')['Quantidade (L)'].sum().mean()
-    top_consumer = df.groupby('Pessoa')['Quantidade (L)'].sum().idxmax()
-    favorite_beer = df['Emoji'].mode().values[0]
-    return total_volume, avg_daily_consumption, top_consumer, favorite_beer
+    metrics = compute_metrics(df, 'Quantidade (L)')
+    return metrics.total_volume, metrics.avg_daily_consumption, metrics.top_consumer, metrics.favorite_beer
 
 
-# Function to display key metrics in the dashboard, using Streamlit's metric widgets.
+# Function to display key metrics in the dashboard, using Streamlit's metric widgets (emojis written by their Unicode names).
 def display_key_metrics(total_volume: float, avg_daily_consumption: float, top_consumer: str, favorite_beer: str):
     col1, col2, col3, col4 = st.columns(4)
-    col1.metric("Consumo Total" + emoji.emojize(':fuel_pump:'), f"{total_volume:.2f}L")
-    col2.metric("Média de Consumo Diária" + emoji.emojize(':stopwatch:'), f"{avg_daily_consumption:.2f}L")
-    col3.metric("Principal Consumidor " + emoji.emojize(':trophy:'), top_consumer)
-    col4.metric("Cerveja Favorita" + emoji.emojize(':sports_medal:'), favorite_beer)
-
-
-# Function to display the latest updates (last 5 entries) in the dashboard.
-def display_latest_news(df: pd.DataFrame):
-    last_records = df.tail(5)[::-1]
-    for _, row in last_records.iterrows():
+    col1.metric("Consumo Total\N{FUEL PUMP}", f"{total_volume:.2f}L")
+    col2.metric("Média de Consumo Diária\N{STOPWATCH}\N{VARIATION SELECTOR-16}", f"{avg_daily_consumption:.2f}L")
+    col3.metric("Principal Consumidor \N{TROPHY}", top_consumer)
+    col4.metric("Cerveja Favorita\N{SPORTS MEDAL}", favorite_beer)
+
+
+# Function to draw the placeholder avatar of a person without a profile picture: a grey circle with their initial.
+def make_placeholder_avatar(person: str) -> Image.Image:
+    image = Image.new('RGBA', (AVATAR_SIZE, AVATAR_SIZE), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(image)
+    draw.ellipse((0, 0, AVATAR_SIZE - 1, AVATAR_SIZE - 1), fill=(203, 213, 225, 255))
+    font = ImageFont.load_default(size=AVATAR_SIZE // 2)
+    draw.text((AVATAR_SIZE / 2, AVATAR_SIZE / 2), person[:1].upper() or '?', fill=(30, 58, 138, 255), font=font, anchor='mm')
+    return image
+
+
+# Function to get the avatar of a person as a small PNG thumbnail.
+# Each picture is read and resized only once per process; the thumbnails (a few KB each) are then served from memory.
+@functools.lru_cache(maxsize=256)
+def load_avatar(person: str) -> bytes:
+    image_path = os.path.join(PROFILE_IMAGES_FOLDER, f"{person}.png")
+    try:
+        with Image.open(image_path) as image:
+            thumbnail = image.convert('RGBA')
+        thumbnail.thumbnail((AVATAR_SIZE, AVATAR_SIZE))
+    except OSError:
+        # Missing or unreadable pictures fall back to a placeholder instead of breaking the dashboard.
+        thumbnail = make_placeholder_avatar(person)
+    buffer = io.BytesIO()
+    thumbnail.save(buffer, format='PNG', optimize=True)
+    return buffer.getvalue()
+
+
+# Function to get a page of the latest updates (newest first), expanding only the last events.
+def get_latest_records(events: CompactEvents, n_records: int) -> pd.DataFrame:
+    return events.tail(n_records)[::-1]
+
+
+# Function to display the latest updates in the dashboard, with older entries loaded on demand by pages.
+def display_latest_news(events: CompactEvents, page_size: int = NEWS_PAGE_SIZE):
+    # The number of entries shown is kept per session, so it survives the reruns caused by the other widgets.
+    n_records = st.session_state.get('news_records', page_size)
+    last_records = get_latest_records(events, n_records)
+    for row in last_records[['Timestamp', 'Pessoa', 'Emoji']].itertuples(index=False):
         with st.container():
             cols = st.columns([1, 25])
             with cols[0]:
-                image_name = f"{row['Pessoa']}.png"
-                image_path = os.path.join('circular_profile_images', image_name)
-                st.image(image_path, width=50)
+                st.image(load_avatar(row.Pessoa), width=50)
             with cols[1]:
-                emoji_ = EMOJI_MAPPING[row['Emoji'].lower()]
-                message = f"[{row['Hour']}] {row['Pessoa']} bebeu uma {row['Emoji'].lower()}" + emoji_
+                emoji_ = EMOJI_MAPPING[row.Emoji.lower()]
+                message = f"[{row.Timestamp:%H:%M}] {row.Pessoa} bebeu uma {row.Emoji.lower()}" + emoji_
                 st.markdown(f'<div class="log-text">{message}</div>', unsafe_allow_html=True)
 
+    # Older entries are only read when asked for; the callback runs before the rerun, so the new page shows at once.
+    if len(last_records) < len(events):
+        st.button('Ver mais', key='news_more', on_click=lambda: st.session_state.update(news_records=n_records + page_size))
+
 
 # Function to create a bar plot for total consumption by person.
-def plot_total_consumption(df: pd.DataFrame, quantity_filter: str):
-    total_consumption = df.groupby('Pessoa')[quantity_filter].sum().sort_values(ascending=False).reset_index()
+# Figures are built once per cache key (filters, value column and data version) and reused by identical reruns.
+# Plotly Express is slow to import, so the builders only import it when the first figure is built.
+def plot_total_consumption(metrics: DashboardMetrics, cache_key: Optional[str] = None):
+    fig_total = get_figure('total_consumption', cache_key, lambda: make_total_consumption_figure(metrics))
+    st.plotly_chart(fig_total, use_container_width=True)
+
+
+# Function to build the bar plot of total consumption by person.
+def make_total_consumption_figure(metrics: DashboardMetrics):
+    import plotly.express as px
+    quantity_filter = metrics.value_col
+    total_consumption = metrics.per_person.reset_index()
     
     if quantity_filter == 'Quantidade (L)':
         y_axis = 'Consumo Total (L)'
@@ -55,12 +112,20 @@ def plot_total_consumption(df: pd.DataFrame, quantity_filter: str):
     fig_total = px.bar(total_consumption, x='Pessoa', y=quantity_filter, labels={quantity_filter: y_axis})
     
     fig_total.update_layout(height=500)
-    st.plotly_chart(fig_total, use_container_width=True)
+    return fig_total
 
 
 # Function to create a bar plot for consumption by beer type (emoji).
-def plot_consumption_by_type(df: pd.DataFrame, value_col: str):
-    emoji_consumption = df.groupby('Emoji')[value_col].sum().reset_index()
+def plot_consumption_by_type(metrics: DashboardMetrics, cache_key: Optional[str] = None):
+    fig_emoji = get_figure('consumption_by_type', cache_key, lambda: make_consumption_by_type_figure(metrics))
+    st.plotly_chart(fig_emoji, use_container_width=True)
+
+
+# Function to build the bar plot of consumption by beer type (emoji).
+def make_consumption_by_type_figure(metrics: DashboardMetrics):
+    import plotly.express as px
+    value_col = metrics.value_col
+    emoji_consumption = metrics.per_drink.reset_index()
     
     if value_col == 'Quantidade (L)':
         y_axis = 'Consumo Total (L)'
@@ -69,42 +134,41 @@ def plot_consumption_by_type(df: pd.DataFrame, value_col: str):
 
     fig_emoji = px.bar(emoji_consumption, x='Emoji', y=value_col, hover_data=[value_col], labels={y_axis: y_axis})
     fig_emoji.update_layout(xaxis_title='Emoji', yaxis_title=y_axis, uniformtext_minsize=8, uniformtext_mode='hide')
-    
-    st.plotly_chart(fig_emoji, use_container_width=True)
+    return fig_emoji
+
 
+# Function to plot the weekly consumption pattern (grouped by day of the week).
+def weekly_consumption_pattern(metrics: DashboardMetrics, cache_key: Optional[str] = None):
+    fig = get_figure('weekly_consumption', cache_key, lambda: make_weekly_consumption_figure(metrics))
+    st.plotly_chart(fig, use_container_width=True)
 
-# Function to plot the weekly consumption pattern (grouping by day of the week).
-def weekly_consumption_pattern(df, quantity_filter):
-    df['Date'] = pd.to_datetime(df['Date'], format='%d/%m/%Y')
-    df['Day'] = df['Date'].dt.day_name()
 
-    # Map the day names from English to Portuguese.
-    df['Day'] = df['Day'].map({'Monday': 'Segunda', 'Tuesday': 'Terça', 'Wednesday': 'Quarta', 'Thursday': 'Quinta', 'Friday': 'Sexta', 'Saturday': 'Sábado', 'Sunday': 'Domingo'})
-    
-    weekly_consumption = df.groupby('Day')[quantity_filter].sum().reindex(['Segunda', 'Terça', 'Quarta', 'Quinta', 'Sexta', 'Sábado', 'Domingo'])
+# Function to build the bar plot of the weekly consumption pattern.
+def make_weekly_consumption_figure(metrics: DashboardMetrics):
+    import plotly.express as px
+    quantity_filter = metrics.value_col
+    weekly_consumption = pd.Series(metrics.per_weekday.values, index=WEEKDAY_NAMES)
     
     if quantity_filter == 'Quantidade (L)':
         y_axis = 'Consumo Total (L)'
     else:
         y_axis = 'Número de Cervejas'
 
-    fig = px.bar(x=weekly_consumption.index, y=weekly_consumption.values, labels={'x': 'Dia da Semana', 'y': y_axis})
-    
-    st.plotly_chart(fig, use_container_width=True)
+    return px.bar(x=weekly_consumption.index, y=weekly_consumption.values, labels={'x': 'Dia da Semana', 'y': y_axis})
 
 
-# Function to plot the hourly consumption pattern (grouping by hour of the day).
-def hourly_consumption_pattern(df, quantity_filter):
-    df['Hora'] = df['Hour'].apply(lambda x: x.split(':')[0])
-    df['Hora'] = df['Hora'].astype(int)
-
-    hourly_consumption = df.groupby('Hora')[quantity_filter].sum().reset_index()
+# Function to plot the hourly consumption pattern (grouped by hour of the day).
+def hourly_consumption_pattern(metrics: DashboardMetrics, cache_key: Optional[str] = None):
+    fig = get_figure('hourly_consumption', cache_key, lambda: make_hourly_consumption_figure(metrics))
+    st.plotly_chart(fig, use_container_width=True)
 
-    # Ensure all hours from 0 to 23 are included, even if there's no data.
-    all_hours = pd.DataFrame({'Hora': range(24)})
-    hourly_consumption = pd.merge(all_hours, hourly_consumption, on='Hora', how='left')
 
-    hourly_consumption[quantity_filter].fillna(0, inplace=True)
+# Function to build the line plot of the hourly consumption pattern.
+def make_hourly_consumption_figure(metrics: DashboardMetrics):
+    import plotly.express as px
+    quantity_filter = metrics.value_col
+    # All hours from 0 to 23 are already included by the metrics engine, even if there's no data.
+    hourly_consumption = metrics.per_hour.rename_axis('Hora').reset_index()
 
     fig = px.line(hourly_consumption, x='Hora', y=quantity_filter)
 
@@ -116,5 +180,53 @@ def hourly_consumption_pattern(df, quantity_filter):
     fig.update_layout(xaxis_title='Hora do Dia', yaxis_title=y_axis)
     fig.update_xaxes(tickmode='linear', tick0=0, dtick=1)
     fig.update_xaxes(tickvals=list(range(24)), ticktext=[f'{h:02d}:00' for h in range(24)])
+    return fig
+
+
+# Function to plot the consumption over time, resampled to days, weeks or months (see utils.timeseries.FREQUENCIES).
+def consumption_over_time(metrics: DashboardMetrics, frequency: str, cache_key: Optional[str] = None):
+    # Filters that select no drink leave nothing to plot over time.
+    if metrics.per_date.empty:
+        st.info('Não há consumo para os filtros selecionados.')
+        return
+    fig = get_figure(f'consumption_over_time_{frequency}', cache_key, lambda: make_consumption_over_time_figure(metrics, frequency))
+    st.plotly_chart(fig, use_container_width=True)
+
+
+# Function to build the line plot of the consumption over time.
+# The series is resampled and downsampled here, so years of history are sent as a bounded number of points.
+def make_consumption_over_time_figure(metrics: DashboardMetrics, frequency: str):
+    import plotly.express as px
+    quantity_filter = metrics.value_col
+    consumption = resample_consumption(metrics.per_date, frequency)
+
+    if quantity_filter == 'Quantidade (L)':
+        y_axis = 'Consumo Total (L)'
+    else:
+        y_axis = 'Número de Cervejas'
+
+    # Named columns (rather than bare arrays) also give a valid, empty figure for an empty series.
+    consumption = pd.DataFrame({'Data': consumption.index, quantity_filter: consumption.to_numpy()})
+    fig = px.line(consumption, x='Data', y=quantity_filter, labels={quantity_filter: y_axis})
+    return fig
+
 
+# Function to display the windowed metrics of each person: the litres of the rolling windows as a bar plot, and their
+# streaks and sessions as a table (see utils.analytics).
+def display_person_trends(trends: pd.DataFrame, cache_key: Optional[str] = None):
+    fig = get_figure('rolling_consumption', cache_key, lambda: make_rolling_consumption_figure(trends))
     st.plotly_chart(fig, use_container_width=True)
+    st.dataframe(trends[STREAK_COLUMNS + SESSION_COLUMNS], use_container_width=True,
+                 column_config={'Bebidas por sessão': st.column_config.NumberColumn(format='%.2f')})
+
+
+# Function to build the grouped bar plot of the litres of each person in the rolling windows.
+def make_rolling_consumption_figure(trends: pd.DataFrame):
+    import plotly.express as px
+    columns = [get_window_column(window) for window in ROLLING_WINDOWS]
+    # People are sorted by the litres of the longest window, the most recent drinkers first.
+    rolling = trends[columns].sort_values(columns[-1], ascending=False).reset_index()
+    rolling = rolling.melt(id_vars='Pessoa', value_vars=columns, var_name='Janela', value_name='Consumo (L)')
+    fig = px.bar(rolling, x='Pessoa', y='Consumo (L)', color='Janela', barmode='group')
+    fig.update_layout(height=500, legend_title_text='')
+    return fig
@@ -0,0 +1,38 @@
+import os
+import tempfile
+from contextlib import contextmanager
+
+# File locks are only taken where fcntl exists (Linux and macOS, e.g. the container image). Elsewhere, the processes
+# sharing a cache folder aren't serialized (the locks of utils.event_cache still serialize the sessions of one process).
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+# Function to write a file atomically, so a concurrent reader never sees a half-written file. Each write gets a temporary
+# file of its own next to the target, so processes writing the same file (e.g. the app and the API server) never share one.
+def write_atomically(path, write):
+    folder, name = os.path.split(path)
+    fd, tmp_path = tempfile.mkstemp(dir=folder or '.', prefix=f'{name}.', suffix='.tmp')
+    os.close(fd)
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+# Function to hold an exclusive lock on a file (created if needed) for the duration of a with block, across processes
+@contextmanager
+def file_lock(path):
+    with open(path, 'a') as file:
+        if fcntl is not None:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(file.fileno(), fcntl.LOCK_UN)
@@ -0,0 +1,116 @@
+import os
+import threading
+import traceback
+import pandas as pd
+from collections import deque
+from datetime import date
+from typing import NamedTuple, Optional, FrozenSet, Tuple, List
+from utils.data_extraction import find_chat_file
+from utils.event_cache import refresh_tables
+
+# Seconds between two checks of the chat file of a watched group.
+WATCH_INTERVAL = float(os.environ.get('LIVE_WATCH_INTERVAL', 2))
+# Number of recent changes remembered, so a session that missed a few of them can still tell what they touched.
+MAX_CHANGES = 64
+
+
+# Summary of a change of the chat data: the days, people and drinks of the events added or removed by it.
+# A change without days (first_date is None) is a full reload of the file, which may have changed anything.
+class DataChange(NamedTuple):
+    version: int
+    first_date: Optional[pd.Timestamp]
+    last_date: Optional[pd.Timestamp]
+    people: FrozenSet[str]
+    drinks: FrozenSet[str]
+
+    # Function to check whether the change can alter the data selected by the filters of a session (empty lists select all).
+    # With open_ended, the selected dates have no end, as for a session that shows everything up to the latest day.
+    def touches(self, date_range: Tuple[date, date], people: List[str], drinks: List[str], open_ended: bool = False) -> bool:
+        if self.first_date is None:
+            return True
+        if self.last_date < pd.Timestamp(date_range[0]) or (not open_ended and self.first_date > pd.Timestamp(date_range[1])):
+            return False
+        if people and self.people.isdisjoint(people):
+            return False
+        return not (drinks and self.drinks.isdisjoint(drinks))
+
+
+# Function to summarize the events changed in the tables (see event_cache.refresh_tables), or a full reload if None
+def make_change(version, changes) -> DataChange:
+    if changes is None:
+        return DataChange(version, None, None, frozenset(), frozenset())
+    events = pd.concat(changes, ignore_index=True)
+    if events.empty:
+        return DataChange(version, pd.Timestamp.max, pd.Timestamp.min, frozenset(), frozenset())
+    return DataChange(version, events['Date'].min(), events['Date'].max(), frozenset(events['Pessoa']), frozenset(events['Emoji']))
+
+
+# Background worker that watches the chat file of a group (the plain chat text, or the export synced from Google Drive)
+# and brings its cached tables up to date as soon as it changes, parsing only the appended lines.
+# One watcher is shared by all sessions of the process; sessions only compare its version with the one they last showed.
+class ChatWatcher:
+    def __init__(self, data_folder, cache_folder, interval=WATCH_INTERVAL):
+        self.data_folder = data_folder
+        self.cache_folder = cache_folder
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._changes = deque(maxlen=MAX_CHANGES)
+
+        self.version = 0        # Incremented every time the chat data changes
+        self.last_error = None  # Error message of the last refresh, if it failed
+        self._signature = self.get_signature()
+
+        self._thread = threading.Thread(target=self._run, name='chat-watcher', daemon=True)
+        self._thread.start()
+
+    # Function to get what identifies the current state of the chat file: its path, modification time and size
+    def get_signature(self):
+        file_path = find_chat_file(self.data_folder)
+        try:
+            stat = os.stat(file_path)
+        except FileNotFoundError:
+            return None
+        return file_path, stat.st_mtime_ns, stat.st_size
+
+    # Function to get the changes after a version, or None if some of them are no longer remembered
+    def get_changes_since(self, version) -> Optional[List[DataChange]]:
+        with self._lock:
+            changes = [change for change in self._changes if change.version > version]
+            if len(changes) < self.version - version:
+                return None
+            return changes
+
+    # Function to check whether the data changed after a version in a way that alters what the filters select
+    def touches_since(self, version, date_range, people, drinks, open_ended=False) -> bool:
+        changes = self.get_changes_since(version)
+        return changes is None or any(change.touches(date_range, people, drinks, open_ended) for change in changes)
+
+    # Function to stop watching (useful outside Streamlit, e.g. in scripts and checks)
+    def stop(self):
+        self._stopped.set()
+
+    # Function to check the chat file once, refreshing its tables if it changed; returns True if it did
+    def check(self):
+        signature = self.get_signature()
+        if signature == self._signature:
+            return False
+        changes = None
+        if signature is not None:
+            try:
+                changes = refresh_tables(signature[0], self.cache_folder)
+            except Exception as e:
+                # The signature is kept as it was, so the next check tries again even if the file doesn't change.
+                self.last_error = str(e)
+                traceback.print_exc()
+                return False
+        self._signature = signature
+        with self._lock:
+            self.version += 1
+            self._changes.append(make_change(self.version, changes))
+            self.last_error = None
+        return True
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.check()
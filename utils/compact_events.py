@@ -0,0 +1,104 @@
+import sys
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from utils.data_extraction import DRINK_NAMES
+from utils.event_store import DRINK_VOLUMES_CL
+
+# Memory target of the events kept by the dashboard, in bytes per drink: 4 for the timestamp (minutes), 2 for the person
+# code and 1 for the drink code. benchmarks/check_event_memory.py checks it (and the budget of a million events).
+BYTES_PER_EVENT_TARGET = 8
+# Code of each drink: its position in DRINK_NAMES.
+DRINK_CODES = {name: code for code, name in enumerate(DRINK_NAMES)}
+# Volume of each drink (in litres), indexed by drink code: volumes are derived from the drink and never stored.
+DRINK_VOLUMES_L = np.array([DRINK_VOLUMES_CL[name] for name in DRINK_NAMES]) / 100
+NS_PER_MINUTE = 60 * 10**9
+
+
+# Compact, read-only table of events (one per drink, in chat order) shared by every session of the process.
+# People and drinks are integer codes into small dictionaries, and timestamps are packed as minutes (the resolution
+# of the chat), instead of a DataFrame with a Python string per row for the person and the drink.
+class CompactEvents:
+    __slots__ = ('minutes', 'person_codes', 'drink_codes', 'people')
+
+    def __init__(self, minutes: np.ndarray, person_codes: np.ndarray, drink_codes: np.ndarray, people: np.ndarray):
+        self.minutes = minutes            # int32 minutes since 1970-01-01
+        self.person_codes = person_codes  # uint16 positions in people
+        self.drink_codes = drink_codes    # int8 positions in DRINK_NAMES
+        self.people = people              # Names of the people (object array)
+        # Sessions share the same arrays, so they are made read-only.
+        for array in (minutes, person_codes, drink_codes, people):
+            array.flags.writeable = False
+
+    # Function to build the compact events from a table with the store schema
+    @classmethod
+    def from_store_table(cls, table: pa.Table) -> 'CompactEvents':
+        timestamps = table.column('Timestamp').to_numpy().astype('datetime64[ns]').view(np.int64)
+        people = table.column('Pessoa').combine_chunks()
+        drinks = table.column('Emoji').combine_chunks()
+        names = np.array(people.dictionary.to_pylist(), dtype=object)
+        # The store keeps its drinks in order of appearance; they are recoded to the fixed order of DRINK_NAMES.
+        drink_lookup = np.array([DRINK_CODES[name] for name in drinks.dictionary.to_pylist()], dtype=np.int8)
+        return cls(
+            minutes=(timestamps // NS_PER_MINUTE).astype(np.int32),
+            person_codes=people.indices.to_numpy(zero_copy_only=False).astype(np.uint16 if len(names) <= 2**16 else np.uint32),
+            drink_codes=drink_lookup[drinks.indices.to_numpy(zero_copy_only=False)],
+            people=names,
+        )
+
+    # Function to get the events with the last `drop` ones replaced by the events of a table with the store schema
+    # (e.g. the lines appended to a watched chat). The arrays are new, so the sessions holding these events are unaffected.
+    def append(self, table: pa.Table, drop: int = 0) -> 'CompactEvents':
+        new = CompactEvents.from_store_table(table)
+        keep = len(self) - drop
+        # New people get the next codes, so the codes of the known ones don't change.
+        people = list(self.people)
+        codes = {name: code for code, name in enumerate(people)}
+        for name in new.people:
+            codes.setdefault(name, len(people))
+            if codes[name] == len(people):
+                people.append(name)
+        recode = np.array([codes[name] for name in new.people], dtype=np.int64)
+        return CompactEvents(
+            minutes=np.concatenate([self.minutes[:keep], new.minutes]),
+            person_codes=np.concatenate([self.person_codes[:keep], recode[new.person_codes]]).astype(np.uint16 if len(people) <= 2**16 else np.uint32),
+            drink_codes=np.concatenate([self.drink_codes[:keep], new.drink_codes]),
+            people=np.array(people, dtype=object),
+        )
+
+    def __len__(self):
+        return len(self.minutes)
+
+    # Memory used by the events, in bytes (the arrays plus the names of the people)
+    @property
+    def nbytes(self) -> int:
+        names = sum(sys.getsizeof(name) for name in self.people)
+        return self.minutes.nbytes + self.person_codes.nbytes + self.drink_codes.nbytes + self.people.nbytes + names
+
+    # Timestamps of the events in [start, stop) as datetime64[ns]
+    def get_timestamps(self, start=0, stop=None) -> np.ndarray:
+        return (self.minutes[start:stop].astype(np.int64) * NS_PER_MINUTE).view('datetime64[ns]')
+
+    # Volumes (in litres) of the events in [start, stop), derived from their drinks
+    def get_volumes(self, start=0, stop=None) -> np.ndarray:
+        return DRINK_VOLUMES_L[self.drink_codes[start:stop]]
+
+    # Function to expand the events in [start, stop) into the DataFrame columns used by the dashboard.
+    # Only the requested rows are expanded, e.g. the last few for the latest updates.
+    def to_frame(self, start=0, stop=None) -> pd.DataFrame:
+        timestamps = pd.Series(self.get_timestamps(start, stop))
+        return pd.DataFrame({
+            'Timestamp': timestamps,
+            'Date': timestamps.dt.normalize(),
+            'Dia': timestamps.dt.weekday.astype('int8'),  # 0 = Monday
+            'Hora': timestamps.dt.hour.astype('int8'),
+            'Pessoa': self.people[self.person_codes[start:stop]],
+            'Emoji': DRINK_NAMES[self.drink_codes[start:stop]],
+            'Quantidade (L)': self.get_volumes(start, stop),
+            'Quantidade': 1,
+        })
+
+    # Function to expand the last n events (in chat order)
+    def tail(self, n: int) -> pd.DataFrame:
+        start = max(len(self) - n, 0)
+        return self.to_frame(start).set_axis(pd.RangeIndex(start, len(self)))
@@ -1,146 +1,158 @@
 import os 
-import emoji
-import re
+import zipfile
+import numpy as np
 import pandas as pd
-import shutil
-import datetime
+import pyarrow as pa
+import pyarrow.compute as pc
 
-# Function to read the file and return its content
-def read_file(file_path):
-    # Open and read the file with UTF-8 encoding, returning the lines as a list.
-    with open(file_path, 'r', encoding='utf-8') as file:
-        return file.readlines()
+# Size (in bytes) of each block read (and parsed) from the chat export.
+CHUNK_SIZE = 1024 * 1024
 
-# Function to parse the chat log using a regular expression pattern to extract date, time, author, and message
+# Name of the chat export downloaded from Google Drive and of the plain chat text (e.g. copied by hand).
+CHAT_ZIP_NAME = 'chat_data.zip'
+CHAT_TXT_NAME = '_chat.txt'
+
+# Function to get the chat file of a data folder: the WhatsApp .zip export if there is one, otherwise the plain text
+def find_chat_file(data_folder):
+    zip_path = os.path.join(data_folder, CHAT_ZIP_NAME)
+    return zip_path if os.path.exists(zip_path) else os.path.join(data_folder, CHAT_TXT_NAME)
+
+# Function to find the chat text inside a WhatsApp .zip export (the only .txt file next to the media attachments)
+def find_chat_member(zip_ref):
+    txt_members = [name for name in zip_ref.namelist() if name.lower().endswith('.txt')]
+    if len(txt_members) != 1:
+        raise ValueError(f'Expected one .txt file in {zip_ref.filename}, found {len(txt_members)}.')
+    return txt_members[0]
+
+# Function to open the chat text of a file for binary reading: a plain text file or the .txt member of a .zip export
+def open_chat(file_path):
+    if not file_path.lower().endswith('.zip'):
+        return open(file_path, 'rb')
+    # The chat is read (and decompressed) straight from the archive, without extracting anything to disk.
+    # The member keeps the archive open until it is closed itself.
+    with zipfile.ZipFile(file_path, 'r') as zip_ref:
+        return zip_ref.open(find_chat_member(zip_ref))
+
+# Function to get the size (in bytes) of the chat text of a file
+def get_chat_size(file_path):
+    if not file_path.lower().endswith('.zip'):
+        return os.path.getsize(file_path)
+    with zipfile.ZipFile(file_path, 'r') as zip_ref:
+        return zip_ref.getinfo(find_chat_member(zip_ref)).file_size
+
+# Function to read the file in fixed-size chunks, yielding blocks that always end at a line boundary
+def read_blocks(file_path, chunk_size=CHUNK_SIZE, start=0, end=None):
+    # Read raw bytes so that memory is bounded by the chunk size and not by the file size.
+    with open_chat(file_path) as file:
+        # Only the byte range [start, end) is read, which allows parsing just the tail of the export.
+        file.seek(start)
+        position = start
+        remainder = b''
+        while end is None or position < end:
+            size = chunk_size if end is None else min(chunk_size, end - position)
+            chunk = file.read(size)
+            if not chunk:
+                break
+            position += len(chunk)
+            # A line may be cut by the chunk boundary, so the piece after the last newline is kept for the next block.
+            # Splitting on b'\n' is safe because it never appears inside a multi-byte UTF-8 sequence.
+            block = remainder + chunk
+            cut = block.rfind(b'\n') + 1
+            remainder = block[cut:]
+            if cut:
+                yield block[:cut]
+        # The last line of the export may not end with a newline.
+        if remainder:
+            yield remainder
+
+# Function to split a block of complete lines into an Arrow array of lines (without line endings)
+def split_lines(block):
+    # The block is split by Arrow as a single string, without creating a Python string per line.
+    lines = pc.split_pattern(pa.array([block.decode('utf-8')], pa.string()), '\n').flatten()
+    # A block ending with a newline leaves an empty piece after it, which isn't a line.
+    if block.endswith(b'\n'):
+        lines = lines.slice(0, len(lines) - 1)
+    return pc.utf8_rtrim(lines, characters='\r')
+
+# Function to read the file in fixed-size chunks and yield its content line by line
+def read_file(file_path, chunk_size=CHUNK_SIZE, start=0, end=None):
+    for block in read_blocks(file_path, chunk_size, start, end):
+        yield from split_lines(block).to_pylist()
+
+# Regular expression matching the start of the first line of a message: date and time (e.g. "31/12/23, 23:59 - "),
+# followed by the author and the message, separated by the first ": ".
+MESSAGE_PREFIX_PATTERN = r'^\d{2}/\d{2}/\d{2}, \d{2}:\d{2} - '
+MESSAGE_PREFIX_LENGTH = 18
+TIMESTAMP_LENGTH = 15
+
+# Drinks tracked in the chat. The position of each drink is its integer code.
+# The emojis are written by their Unicode names, which costs nothing at start-up (unlike importing an emoji library).
+DRINK_EMOJIS = [
+    '\N{BEER MUG}',
+    '\N{CLINKING BEER MUGS}',
+    '\N{BOTTLE WITH POPPING CORK}',
+    '\N{WINE GLASS}',
+]
+DRINK_NAMES = np.array(['Mini', 'Média', 'Litrosa', 'Vinho'], dtype=object)
+DRINK_VOLUMES = np.array([0.25, 0.33, 1.0, 0.25])  # Volume of each drink (in liters)
+
+# Function to parse a batch of lines of the chat log, extracting date, time, author, and message
 def parse_chat(lines):
-    # Define a regular expression pattern to match the date, time, author, and message in the chat log.
-    pattern = re.compile(r'(\d{2}/\d{2}/\d{2}), (\d{2}:\d{2}) - (.*?): (.*)')
-    chat_data = []
-    
-    # Loop through each line and attempt to match it with the pattern.
-    for line in lines:
-        match = pattern.match(line)
-        if match:
-            # Extract date, time, author, and message from the matched pattern.
-            date, time, author, message = match.groups()
-            # Convert the date string to a datetime object for easier manipulation later.
-            date = datetime.datetime.strptime(date, "%d/%m/%y")
-            # Append the parsed data (date, time, author, message) as a tuple to the chat_data list.
-            chat_data.append((date, time, author, message))
-    
-    return chat_data
+    # Match all lines of the batch at once with Arrow's regex engine (lines can be a list or an Arrow array).
+    # Continuation lines of multi-line messages (e.g. "🍻 = 1 média") don't match and are dropped.
+    # Only the fixed-width prefix is matched (a regex without captures is much cheaper); the fields are sliced after it.
+    lines = pa.array(lines, pa.string())
+    lines = lines.filter(pc.match_substring_regex(lines, MESSAGE_PREFIX_PATTERN))
+    fields = pc.split_pattern(pc.utf8_slice_codeunits(lines, MESSAGE_PREFIX_LENGTH), ': ', max_splits=1)
+    is_message = pc.equal(pc.list_value_length(fields), 2)
+    lines, fields = lines.filter(is_message), fields.filter(is_message)
+
+    # Convert the date and time to a single timestamp, parsed once here for the whole app.
+    return pa.table({
+        'Timestamp': pc.strptime(pc.utf8_slice_codeunits(lines, 0, TIMESTAMP_LENGTH), format='%d/%m/%y, %H:%M', unit='s'),
+        'Pessoa': pc.list_element(fields, 0),
+        'Message': pc.list_element(fields, 1),
+    })
+
+# Function to find the drinks of a batch of parsed messages, returning the message and the drink code of each drink
+def find_drinks(chat_data):
+    # Count every drink emoji in all messages at once, giving a (messages x drinks) matrix.
+    counts = np.column_stack([
+        pc.count_substring(chat_data['Message'], drink).to_numpy(zero_copy_only=False)
+        for drink in DRINK_EMOJIS
+    ]).ravel()
 
-# Function to extract emojis from the chat messages
+    # Repeat each (message, drink code) pair as many times as the emoji appears in the message,
+    # which keeps the order of the original loop: message by message, then drink by drink.
+    message_index = np.repeat(np.repeat(np.arange(chat_data.num_rows), len(DRINK_EMOJIS)), counts)
+    drink_codes = np.repeat(np.tile(np.arange(len(DRINK_EMOJIS), dtype=np.int8), chat_data.num_rows), counts)
+    return message_index, drink_codes
+
+# Function to extract the drink emojis of a batch of parsed messages into one row per drink
 def extract_emojis(chat_data):
-    # Define a mapping between specific emojis and their descriptions.
-    emoji_mapping = {'🍺': 'mini', '🍻': 'média', '🍾': 'litrosa', '🍷': 'vinho'}
-    data = []
-
-    # Loop through each entry in the chat data.
-    for date, time, author, message in chat_data:
-        # For each emoji in the mapping, count how many times it appears in the message.
-        for emoji in emoji_mapping.keys():
-            count = message.count(emoji)
-            # Append a new entry for each occurrence of the emoji.
-            for _ in range(count):
-                data.append((date, time, author, emoji))
-    
-    return data
+    message_index, drink_codes = find_drinks(chat_data)
+    events = chat_data.take(message_index)
+
+    # Create a DataFrame with columns for Timestamp, Author (Pessoa), Emoji, and quantities.
+    df = pd.DataFrame({
+        'Timestamp': events['Timestamp'].to_numpy().astype('datetime64[ns]'),
+        'Pessoa': events['Pessoa'].to_numpy(zero_copy_only=False),
+        # Replace the drink codes with their descriptions and volumes (in liters).
+        'Emoji': DRINK_NAMES[drink_codes],
+        'Quantidade (L)': DRINK_VOLUMES[drink_codes],
+    })
+    df['Quantidade'] = 1  # Add a quantity column (always 1 for each emoji)
+
+    return df
 
 # Function to load and process the chat data into a DataFrame
-def load_data(file_path):
-    # Read the file's content
-    lines = read_file(file_path)
-    
-    # Parse the chat data from the lines
-    chat_data = parse_chat(lines)
+def load_data(file_path, chunk_size=CHUNK_SIZE, start=0, end=None):
+    # Stream the file's content (or the requested byte range of it) as blocks of complete lines.
+    blocks = read_blocks(file_path, chunk_size, start, end)
     
-    # Extract emojis from the chat data
-    emoji_data = extract_emojis(chat_data)
-    
-    # Create a DataFrame from the emoji data, with columns for Date, Hour, Author (Pessoa), and Emoji.
-    df = pd.DataFrame(emoji_data, columns=['Date', 'Hour', 'Pessoa', 'Emoji'])
-
-    # Replace the extracted emojis with their corresponding descriptions.
-    emoji_replacements = {
-            emoji.emojize(':beer_mug:'): 'Mini',
-            emoji.emojize(':bottle_with_popping_cork:'): 'Litrosa',
-            emoji.emojize(':clinking_beer_mugs:'): 'Média',
-            emoji.emojize(':wine_glass:'): 'Vinho',
-    }
-    df['Emoji'] = df['Emoji'].replace(emoji_replacements)
-
-    # Map each emoji description to its corresponding volume (in liters).
-    emoji_volumes = {
-        'Mini': 0.25,
-        'Litrosa': 1.0,
-        'Média': 0.33,
-        'Vinho': 0.25,
-    }
-    df['Quantidade (L)'] = df['Emoji'].map(emoji_volumes)  # Map emoji to volume
-    df['Quantidade'] = 1  # Add a quantity column (always 1 for each emoji)
+    # Parse each bounded block and extract its emojis, so only one block is alive at a time.
+    frames = [extract_emojis(parse_chat(split_lines(block))) for block in blocks]
+    if not frames:
+        return extract_emojis(parse_chat([]))
 
-    # Format the date column as a string with the format 'dd/mm/YYYY'.
-    df['Date'] = df['Date'].dt.strftime('%d/%m/%Y')
-
-    return df  # Return the final DataFrame with parsed data.
-
-# Function to delete all files in a specified folder
-def delete_all_files_in_folder(folder_path):
-    # Loop through all files in the folder.
-    for filename in os.listdir(folder_path):
-        file_path = os.path.join(folder_path, filename)
-        try:
-            # If it's a file or a symbolic link, delete it.
-            if os.path.isfile(file_path) or os.path.islink(file_path):
-                os.unlink(file_path)
-            # If it's a directory, delete it and its contents.
-            elif os.path.isdir(file_path):
-                shutil.rmtree(file_path)
-        except Exception as e:
-            # Print any errors that occur during deletion.
-            print(f'Failed to delete {file_path}. Reason: {e}')
-
-# Function to delete all files in a folder except for .txt files
-def delete_files_except_txt(folder_path):
-    try:
-        # Get a list of all files in the folder.
-        files = os.listdir(folder_path)
-        
-        # Loop through each file.
-        for file in files:
-            # Create the full file path.
-            file_path = os.path.join(folder_path, file)
-            
-            # Check if the file is not a .txt file.
-            if os.path.isfile(file_path) and not file.lower().endswith('.txt'):
-                # Delete the file.
-                os.remove(file_path)
-    except Exception as e:
-        # Print any errors that occur.
-        print(f"An error occurred: {e}")
-
-# Function to rename a unique .txt file in a folder to '_chat.txt'
-def rename_unique_txt(folder_path):
-    try:
-        # Get a list of all files in the folder.
-        files = os.listdir(folder_path)
-        
-        # Filter out files that have the .txt extension.
-        txt_files = [file for file in files if os.path.isfile(os.path.join(folder_path, file)) and file.lower().endswith('.txt')]
-        
-        # Check if there is exactly one .txt file.
-        if len(txt_files) == 1:
-            # Get the full file path for renaming.
-            old_file_path = os.path.join(folder_path, txt_files[0])
-            new_file_path = os.path.join(folder_path, '_chat.txt')
-            
-            # Rename the file.
-            os.rename(old_file_path, new_file_path)
-        elif len(txt_files) == 0:
-            print("No .txt files found in the folder.")
-        else:
-            print("Multiple .txt files found in the folder.")
-    except Exception as e:
-        # Print any errors that occur.
-        print(f"An error occurred: {e}")
+    return pd.concat(frames, ignore_index=True)  # Return the final DataFrame with parsed data.
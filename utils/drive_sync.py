@@ -0,0 +1,65 @@
+import threading
+import traceback
+from datetime import datetime
+
+
+# Background worker that runs the Google Drive sync outside of the Streamlit request thread.
+# One worker is shared by all sessions of the process; sessions only request syncs and read its status.
+class DriveSyncWorker:
+    def __init__(self, sync_function):
+        # sync_function() does the whole sync and returns True if the local data changed.
+        self._sync_function = sync_function
+        self._requested = threading.Event()
+        self._lock = threading.Lock()
+        self._finished = threading.Condition(self._lock)
+
+        self.is_syncing = False
+        self.sync_count = 0        # Number of finished syncs (successful or not)
+        self.data_version = 0      # Incremented every time a sync brings new data
+        self.last_changed = False  # Whether the last finished sync brought new data
+        self.last_error = None     # Error message of the last sync, if it failed
+        self.last_sync = None      # When the last sync finished
+
+        self._thread = threading.Thread(target=self._run, name='drive-sync', daemon=True)
+        self._thread.start()
+
+    # Whether a sync was requested and hasn't finished yet (it may not have started: is_syncing is still False then)
+    @property
+    def is_busy(self):
+        with self._lock:
+            return self._requested.is_set() or self.is_syncing
+
+    # Function to ask for a sync without waiting for it; requests made during a sync are merged into the next one
+    def request_sync(self):
+        self._requested.set()
+
+    # Function to request a sync and block until it finishes (useful outside Streamlit, e.g. in scripts and checks)
+    def wait_for_sync(self, timeout=None):
+        with self._lock:
+            # A sync already running may have started before this request, so wait for the one after it.
+            target = self.sync_count + (2 if self.is_syncing else 1)
+            self.request_sync()
+            return self._finished.wait_for(lambda: self.sync_count >= target, timeout)
+
+    def _run(self):
+        while True:
+            self._requested.wait()
+            with self._lock:
+                self._requested.clear()
+                self.is_syncing = True
+            changed, error = False, None
+            try:
+                changed = self._sync_function()
+            except Exception as e:
+                error = str(e)
+                traceback.print_exc()
+
+            with self._lock:
+                self.is_syncing = False
+                self.last_changed = changed
+                self.last_error = error
+                self.last_sync = datetime.now()
+                if changed:
+                    self.data_version += 1
+                self.sync_count += 1
+                self._finished.notify_all()
@@ -0,0 +1,162 @@
+import os
+import threading
+import pandas as pd
+from typing import NamedTuple
+from collections import OrderedDict, defaultdict
+from utils.ingest import load_events, read_appended, CACHE_FOLDER
+from utils.rollup import update_cube_frame
+from utils.instrumentation import stage, record_cache
+from utils.table_index import TableIndex
+from utils.analytics import PersonAnalytics
+from utils.compact_events import CompactEvents
+
+# Memory budget (in MB) of the parsed tables of all the chat files (one per group) kept by the process.
+# Beyond it, the least recently used files are unloaded; they are reloaded from their event store when needed again.
+MAX_CACHE_BYTES = int(os.environ.get('EVENT_CACHE_MAX_MB', 1024)) * 1024 * 1024
+
+# Module-level state is shared by every Streamlit session (and rerun) of the same process.
+# Parsed tables, keyed by chat file path, in order of use:
+# {file_path: (file_key, (CompactEvents, cube DataFrame, cube TableIndex, PersonAnalytics), size, ChatPosition parsed up to)}.
+_events_cache = OrderedDict()
+_lock = threading.Lock()
+# One lock per chat file, so loading a file only blocks the sessions waiting for that same file.
+_load_locks = defaultdict(threading.Lock)
+
+
+# Tables of a chat file as loaded at a given moment, with the version (cache key) of the data they were built from.
+# The index and the version always belong to this cube: after the file changes, the cache holds a new cube (with a new
+# index and version), so they must never be looked up separately.
+class ChatTables(NamedTuple):
+    events: CompactEvents
+    cube: pd.DataFrame
+    cube_index: TableIndex
+    version: tuple
+
+
+# Function to get what identifies the current state of a file on disk: its modification time and size
+def get_file_stat(file_path):
+    stat = os.stat(file_path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+# Function to get the cache key of a file from its state on disk (taken before it was parsed) and the position its tables
+# were parsed up to. The position already identifies the parsed content (the offset and the hash of the prefix, see
+# utils.ingest.ChatPosition), so the file is never read again just to compute its key.
+def make_file_key(file_stat, position):
+    return file_stat + (position.offset, position.prefix_hash)
+
+
+# Function to get the memory used by the parsed tables
+def get_tables_size(tables):
+    events, cube, cube_index, _ = tables
+    # Object columns of the cube only count their pointers: their strings (names of people and drinks) are shared by all rows.
+    index_size = sum(positions.nbytes for positions in (*cube_index.person_positions.values(), *cube_index.drink_positions.values()))
+    return events.nbytes + int(cube.memory_usage(index=True).sum()) + index_size + cube_index.drink_codes.nbytes
+
+
+# Function to unload the least recently used files until the cache fits its memory budget (the file in use is kept)
+def evict_tables(keep):
+    total = sum(entry[2] for entry in _events_cache.values())
+    for file_path in list(_events_cache):
+        if total <= MAX_CACHE_BYTES:
+            break
+        if file_path != keep:
+            total -= _events_cache.pop(file_path)[2]
+
+
+# Function to add the lines appended to a chat file since its tables were loaded to a copy of them, parsing only those lines.
+# Returns the new tables, the new position and the changed events (removed, added), or None if the file has to be reloaded.
+def append_to_tables(file_path, tables, position):
+    appended = read_appended(file_path, position)
+    if appended is None:
+        return None
+    tail, new_position = appended
+    events, cube, cube_index, analytics = tables
+    # The events of the unterminated last line were parsed but not committed: they are parsed again with the new lines.
+    keep = len(events) - position.pending_rows
+    new_events = events.append(tail, drop=position.pending_rows)
+    # Exports only ever append, so the new lines can't start before the events already loaded.
+    if keep and len(new_events) > keep and new_events.minutes[keep] < events.minutes[keep - 1]:
+        return None
+
+    removed, added = events.to_frame(keep), new_events.to_frame(keep)
+    new_cube, start = update_cube_frame(cube, added, removed)
+    # New events update the per-person analytics one by one; removed ones (of the last line) can't be undone, so then
+    # the analytics are computed again from all the events.
+    new_analytics = analytics.extend(new_events, keep) if keep == len(events) else PersonAnalytics.from_events(new_events)
+    new_tables = (new_events, new_cube, cube_index.replace_tail(start, new_cube.iloc[start:]), new_analytics)
+    return new_tables, new_position, (removed, added)
+
+
+# Function to load the tables of a chat file, or bring them up to date if the file changed, parsing it at most once per
+# version of the file (the caller holds the lock of the file). Lines appended to a loaded file are parsed on their own and
+# added to its tables. Returns the entry and the changed events (removed, added), which are None unless lines were appended.
+def load_entry(file_path, cache_folder):
+    # The file is stated before it's parsed: if it changes meanwhile, the next lookup sees a new state and catches up.
+    file_stat = get_file_stat(file_path)
+    with _lock:
+        entry = _events_cache.get(file_path)
+        hit = entry is not None and entry[0][:2] == file_stat
+        if hit:
+            _events_cache.move_to_end(file_path)
+    record_cache('events', hit)
+    if hit:
+        return entry, None
+
+    appended = None
+    with stage('ingest'):
+        if entry is not None:
+            appended = append_to_tables(file_path, entry[1], entry[3])
+        if appended is not None:
+            tables, position, changes = appended
+        else:
+            events, cube, position = load_events(file_path, cache_folder)
+            # The cube is sorted by date, so it's indexed once here and every filter is then a lookup.
+            tables, changes = (events, cube, TableIndex(cube), PersonAnalytics.from_events(events)), None
+    entry = (make_file_key(file_stat, position), tables, get_tables_size(tables), position)
+    with _lock:
+        _events_cache[file_path] = entry
+        evict_tables(keep=file_path)
+    return entry, changes
+
+
+# Function to get the cache entry of a chat file: its key and its tables (events, rollup cube, its index and the per-person
+# analytics). Each group has its own chat file and cache folder, so loading a group never touches the tables of another one.
+def get_entry(file_path, cache_folder=CACHE_FOLDER):
+    with _load_locks[file_path]:
+        return load_entry(file_path, cache_folder)[0]
+
+
+# Function to bring the cached tables of a chat file up to date (e.g. when a watcher sees the file change), returning
+# the changed events (removed, added) if only lines were appended, or None if the file was loaded in full (or unchanged).
+def refresh_tables(file_path, cache_folder=CACHE_FOLDER):
+    with _load_locks[file_path]:
+        return load_entry(file_path, cache_folder)[1]
+
+
+# Function to get the parsed tables (events, rollup cube and its index, see utils.table_index) of a chat file
+def get_tables(file_path, cache_folder=CACHE_FOLDER):
+    # Sessions share the (read-only) events and get a shallow view of the cube, never a copy of the data. With pandas'
+    # copy-on-write enabled, any change a session makes to its view copies only what it touches and never alters the cache.
+    key, (events, cube, cube_index, _) = get_entry(file_path, cache_folder)[:2]
+    return ChatTables(events, cube.copy(deep=False), cube_index, key)
+
+
+# Function to get the per-person windowed metrics (rolling litres, streaks and sessions, see utils.analytics) of a chat file,
+# with the version of the data they were computed from
+def get_analytics(file_path, cache_folder=CACHE_FOLDER):
+    key, tables = get_entry(file_path, cache_folder)[:2]
+    return key, tables[3].to_frame()
+
+
+# Function to get the version of the data of a chat file (its cache key), e.g. to key what is derived from its tables.
+# The key comes from parsing the file, so its tables are loaded (or brought up to date) if they aren't already.
+def get_data_version(file_path, cache_folder=CACHE_FOLDER):
+    return get_entry(file_path, cache_folder)[0]
+
+
+# Function to get the files currently loaded and the memory used by their tables: {file_path: size in bytes}
+def get_cache_usage():
+    with _lock:
+        return {file_path: entry[2] for file_path, entry in _events_cache.items()}
+
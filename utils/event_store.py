@@ -0,0 +1,85 @@
+import pandas as pd
+import pyarrow as pa
+from typing import Optional
+from utils.atomic_files import write_atomically
+
+# Volume of each drink in centilitres, so it can be stored as an int8 code (all values fit in 0..127).
+DRINK_VOLUMES_CL = {'Mini': 25, 'Média': 33, 'Litrosa': 100, 'Vinho': 25}
+
+# Schema of the on-disk event store: one row per drink, in chat order.
+STORE_SCHEMA = pa.schema([
+    ('Timestamp', pa.timestamp('ns')),
+    ('Pessoa', pa.dictionary(pa.int32(), pa.string())),
+    ('Emoji', pa.dictionary(pa.int8(), pa.string())),
+    ('Volume (cL)', pa.int8()),
+])
+# Key of the schema metadata of a store file holding the offset of the chat text it was ingested up to.
+OFFSET_METADATA_KEY = b'offset'
+
+
+# Function to convert the DataFrame returned by load_data into the compact store layout
+def to_store_frame(df: pd.DataFrame) -> pd.DataFrame:
+    store_df = pd.DataFrame({
+        'Timestamp': df['Timestamp'],
+        'Pessoa': df['Pessoa'].astype('category'),
+        'Emoji': df['Emoji'].astype('category'),
+        'Volume (cL)': df['Emoji'].map(DRINK_VOLUMES_CL).astype('int8'),
+    })
+    return store_df
+
+
+# Function to convert a table read from the store back into the DataFrame used by the dashboard
+def from_store_table(table: pa.Table) -> pd.DataFrame:
+    store_df = table.to_pandas()
+    timestamps = store_df['Timestamp']
+
+    # The calendar columns used by the filters and charts are derived once per load, not per rerun.
+    df = pd.DataFrame({
+        'Timestamp': timestamps,
+        'Date': timestamps.dt.normalize(),
+        'Dia': timestamps.dt.weekday.astype('int8'),  # 0 = Monday
+        'Hora': timestamps.dt.hour.astype('int8'),
+        'Pessoa': store_df['Pessoa'].astype(object),
+        'Emoji': store_df['Emoji'].astype(object),
+        'Quantidade (L)': store_df['Volume (cL)'] / 100,
+        'Quantidade': 1,
+    })
+    return df
+
+
+# Function to build an Arrow table with the store schema from a store DataFrame
+def to_store_table(store_df: pd.DataFrame) -> pa.Table:
+    return pa.Table.from_pandas(store_df, schema=STORE_SCHEMA, preserve_index=False)
+
+
+# Function to write the event table to disk as an (uncompressed, memory-mappable) Arrow IPC file, recording the offset
+# of the chat text it covers (if given) in its schema metadata
+def write_store(path: str, table: pa.Table, offset: Optional[int] = None):
+    if offset is not None:
+        table = table.replace_schema_metadata({OFFSET_METADATA_KEY: str(offset)})
+    # Write to a temporary file first, so a concurrent reader never sees a half-written store.
+    def write(tmp_path):
+        with pa.OSFile(tmp_path, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+    write_atomically(path, write)
+
+
+# Function to memory-map the event table stored on disk (the data is only paged in when used)
+def read_store(path: str) -> pa.Table:
+    source = pa.memory_map(path, 'r')
+    return pa.ipc.open_file(source).read_all()
+
+
+# Function to get the offset of the chat text a table read from the store covers (or None if it wasn't recorded)
+def get_store_offset(table: pa.Table) -> Optional[int]:
+    metadata = table.schema.metadata or {}
+    return int(metadata[OFFSET_METADATA_KEY]) if OFFSET_METADATA_KEY in metadata else None
+
+
+# Function to append new events to an existing table, keeping a single chunk per column
+def append_to_store(table: pa.Table, new_table: pa.Table) -> pa.Table:
+    if new_table.num_rows == 0:
+        return table
+    # The dictionaries of the person and drink columns are merged so that the file format can store them.
+    return pa.concat_tables([table, new_table]).unify_dictionaries().combine_chunks()
@@ -0,0 +1,293 @@
+import os
+import re
+import json
+import heapq
+import hashlib
+import numpy as np
+from typing import NamedTuple, List, Optional
+from utils.data_extraction import read_file, CHAT_TXT_NAME, CHAT_ZIP_NAME
+from utils.groups import load_groups
+from utils.instrumentation import stage
+
+# Exports of several members cover overlapping stretches of the chat, so none of them can replace the others. Every export
+# of a group (in its 'exports' folder) is merged into a single chat text (its '_chat.txt', which the ingest then parses),
+# keeping each message once. Messages are told apart by a fingerprint of (minute, author, text, ordinal within the minute),
+# and the fingerprints of the merged chat are kept in a sorted array on disk: memory grows with that index (8 bytes per
+# message), not with the size of the exports, which are streamed. Exports already merged are recognized by their hash.
+# Run from the project root with: python -m utils.export_merge (merges the exports of every group of the registry)
+
+EXPORTS_FOLDER_NAME = 'exports'
+EXPORT_EXTENSIONS = ('.zip', '.txt')
+# Start of the first line of a message: "dd/mm/yy, HH:MM - " (continuation lines of multi-line messages don't have it).
+HEADER_PATTERN = re.compile(r'\d{2}/\d{2}/\d{2}, \d{2}:\d{2} - ')
+
+
+# A message of a chat export: its minute (as a sortable integer, yymmddHHMM), author ('' for system messages), text
+# (continuation lines included) and the lines it was written on.
+class ChatMessage(NamedTuple):
+    minute: int
+    author: str
+    text: str
+    lines: List[str]
+
+
+# Function to get the paths of the merge state and of the fingerprint index of a group
+def get_merge_paths(cache_folder):
+    return os.path.join(cache_folder, 'export_merge.json'), os.path.join(cache_folder, 'fingerprints.npy')
+
+
+# Function to stream the messages of a chat export (a plain text or a .zip export), in the order of the file
+def iter_messages(file_path):
+    minute, author, lines = None, None, []
+    for line in read_file(file_path):
+        # Some exports start with a byte order mark, which would hide the date of the first message.
+        if minute is None and line.startswith('\ufeff'):
+            line = line[1:]
+        match = HEADER_PATTERN.match(line)
+        if match is None:
+            # Lines before the first message (if any) belong to no message and are dropped.
+            if lines:
+                lines.append(line)
+            continue
+        if lines:
+            yield ChatMessage(minute, author, '\n'.join([text] + lines[1:]) if len(lines) > 1 else text, lines)
+        # "dd/mm/yy, HH:MM" is read as the number yymmddHHMM.
+        minute = int(line[6:8] + line[3:5] + line[:2] + line[10:12] + line[13:15])
+        # Like the parser, the author ends at the first ': '; system messages have none.
+        author, separator, text = line[match.end():].partition(': ')
+        if not separator:
+            author, text = '', author
+        lines = [line]
+    if lines:
+        yield ChatMessage(minute, author, '\n'.join([text] + lines[1:]) if len(lines) > 1 else text, lines)
+
+
+# Function to stream the messages of a chat export with their fingerprints. The ordinal tells apart identical messages
+# sent in the same minute (e.g. two '🍺' in a row), which are distinct drinks and not copies of one another.
+def iter_fingerprinted(file_path):
+    minute, counts = None, {}
+    for message in iter_messages(file_path):
+        if message.minute != minute:
+            minute, counts = message.minute, {}
+        ordinal = counts.get((message.author, message.text), 0)
+        counts[(message.author, message.text)] = ordinal + 1
+        key = f'{message.minute}\x00{message.author}\x00{message.text}\x00{ordinal}'.encode('utf-8')
+        yield message, int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'little')
+
+
+# Function to stream the messages of an export whose bit is set in a packed mask (see merge_exports)
+def iter_selected(file_path, packed_mask):
+    for position, message in enumerate(iter_messages(file_path)):
+        if packed_mask[position >> 3] >> (7 - (position & 7)) & 1:
+            yield message
+
+
+# Function to hash the whole content of a file, reading it in chunks
+def hash_file(file_path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        while chunk := file.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Function to get what identifies the current state of a file: its modification time and size (None if it doesn't exist)
+def get_signature(file_path):
+    try:
+        stat = os.stat(file_path)
+    except FileNotFoundError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+# Sorted set of message fingerprints (uint64), kept on disk between merges.
+class FingerprintIndex:
+    __slots__ = ('fingerprints',)
+
+    def __init__(self, fingerprints: Optional[np.ndarray] = None):
+        self.fingerprints = np.unique(fingerprints) if fingerprints is not None else np.empty(0, dtype=np.uint64)
+
+    def __len__(self):
+        return len(self.fingerprints)
+
+    # Function to build the index of every message of a chat text, returning it with the minute of its last message
+    @classmethod
+    def from_chat(cls, file_path):
+        fingerprints, last_minute = [], None
+        for message, fingerprint in iter_fingerprinted(file_path):
+            fingerprints.append(fingerprint)
+            last_minute = message.minute
+        return cls(np.array(fingerprints, dtype=np.uint64)), last_minute
+
+    # Function to check which fingerprints of an array are not in the index
+    def missing(self, fingerprints: np.ndarray) -> np.ndarray:
+        return ~np.isin(fingerprints, self.fingerprints)
+
+    def add(self, fingerprints: np.ndarray):
+        self.fingerprints = np.union1d(self.fingerprints, fingerprints)
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f'{path}.tmp', 'wb') as file:
+            np.save(file, self.fingerprints)
+        os.replace(f'{path}.tmp', path)
+
+    @classmethod
+    def load(cls, path):
+        index = cls()
+        index.fingerprints = np.load(path)
+        return index
+
+
+# Function to read the merge state of a group, returning an empty state if it doesn't exist or is unreadable
+def load_merge_state(state_path):
+    try:
+        with open(state_path, 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+# Function to save the merge state atomically
+def save_merge_state(state, state_path):
+    os.makedirs(os.path.dirname(state_path), exist_ok=True)
+    with open(f'{state_path}.tmp', 'w', encoding='utf-8') as file:
+        json.dump(state, file)
+    os.replace(f'{state_path}.tmp', state_path)
+
+
+# Function to get the exports of a data folder, sorted by name. An export left in the data folder by an older sync
+# (chat_data.zip, which would be read instead of the merged chat) is moved to the exports folder first.
+def find_exports(data_folder):
+    exports_folder = os.path.join(data_folder, EXPORTS_FOLDER_NAME)
+    legacy_path = os.path.join(data_folder, CHAT_ZIP_NAME)
+    if os.path.exists(legacy_path):
+        os.makedirs(exports_folder, exist_ok=True)
+        os.replace(legacy_path, os.path.join(exports_folder, CHAT_ZIP_NAME))
+    if not os.path.isdir(exports_folder):
+        return []
+    return [os.path.join(exports_folder, name) for name in sorted(os.listdir(exports_folder)) if name.lower().endswith(EXPORT_EXTENSIONS)]
+
+
+# Function to check if a (non-empty) file ends with a newline
+def ends_with_newline(file_path):
+    with open(file_path, 'rb') as file:
+        file.seek(-1, os.SEEK_END)
+        return file.read(1) == b'\n'
+
+
+# Function to undo an append to the chat that was interrupted (e.g. by a crash, see merge_exports): the chat is truncated
+# back to its size before the append. The merge state wasn't updated by it, so the same exports are merged again, and the
+# chat changed since the state was saved, so the fingerprint index is rebuilt from it.
+def recover_chat(chat_path, state, state_path):
+    size = state.pop('append_from', None)
+    if size is None:
+        return
+    if os.path.exists(chat_path) and os.path.getsize(chat_path) > size:
+        with open(chat_path, 'r+b') as file:
+            file.truncate(size)
+    save_merge_state(state, state_path)
+
+
+# Function to write messages to a chat text, one line per line of each message
+def write_messages(file, messages):
+    for message in messages:
+        file.write('\n'.join(message.lines).encode('utf-8') + b'\n')
+
+
+# Function to merge the exports of a group into its chat text, returning True if the chat changed.
+# Each new export is read twice, streamed both times: once to find which of its messages are new (kept as a bit mask),
+# and once to merge them, with a k-way merge by minute, into the chat. When the new messages all come after the chat
+# (the usual case: a newer export), they are appended to it, so the ingest only parses them; otherwise the chat is rewritten.
+def merge_exports(data_folder, cache_folder):
+    chat_path = os.path.join(data_folder, CHAT_TXT_NAME)
+    state_path, index_path = get_merge_paths(cache_folder)
+    state = load_merge_state(state_path)
+    recover_chat(chat_path, state, state_path)
+    exports = find_exports(data_folder)
+
+    # Exports already merged (same content hash) are skipped; files are only hashed again when they change.
+    known_files = state.get('files', {})
+    merged_hashes = set(state.get('merged', []))
+    files, new_exports = {}, []
+    for path in exports:
+        signature = get_signature(path)
+        cached = known_files.get(path)
+        content_hash = cached[2] if cached and cached[:2] == signature else hash_file(path)
+        files[path] = signature + [content_hash]
+        if content_hash not in merged_hashes:
+            merged_hashes.add(content_hash)
+            new_exports.append(path)
+    state['files'] = files
+    if not new_exports:
+        save_merge_state({**state, 'merged': sorted(merged_hashes)}, state_path)
+        return False
+
+    # The index holds the fingerprints of every message of the chat. It's rebuilt if the chat changed outside of a merge
+    # (e.g. lines appended by hand), so it always matches the chat.
+    with stage('merge_index'):
+        chat_signature = get_signature(chat_path)
+        if chat_signature is not None and chat_signature == state.get('chat_signature') and os.path.exists(index_path):
+            index, last_minute = FingerprintIndex.load(index_path), state.get('last_minute')
+        elif chat_signature is not None:
+            index, last_minute = FingerprintIndex.from_chat(chat_path)
+        else:
+            index, last_minute = FingerprintIndex(), None
+
+    # First pass: find the new messages of each export. The index grows with them, so a message in several new exports
+    # is only taken from the first one.
+    masks, new_minutes, new_messages = {}, [], 0
+    with stage('merge_scan'):
+        for path in new_exports:
+            minutes, fingerprints = [], []
+            for message, fingerprint in iter_fingerprinted(path):
+                minutes.append(message.minute)
+                fingerprints.append(fingerprint)
+            fingerprints = np.array(fingerprints, dtype=np.uint64)
+            is_new = index.missing(fingerprints)
+            if is_new.any():
+                index.add(fingerprints[is_new])
+                masks[path] = np.packbits(is_new)
+                minutes = np.array(minutes, dtype=np.int64)[is_new]
+                new_minutes += [int(minutes.min()), int(minutes.max())]
+                new_messages += int(is_new.sum())
+
+    # Second pass: k-way merge of the new messages of every export (and of the chat, if they don't all come after it).
+    if masks:
+        with stage('merge_write'):
+            sources = [iter_selected(path, mask) for path, mask in masks.items()]
+            key = lambda message: message.minute
+            os.makedirs(data_folder, exist_ok=True)
+            if last_minute is None or min(new_minutes) >= last_minute:
+                # Appending isn't atomic, so the size of the chat before it is saved first: an append interrupted midway
+                # is undone by the next merge (see recover_chat), before the previous state is used.
+                save_merge_state({**state, 'append_from': os.path.getsize(chat_path) if chat_signature else 0}, state_path)
+                with open(chat_path, 'ab') as file:
+                    # A chat without a final newline would glue its last line to the first new one.
+                    if file.tell() and not ends_with_newline(chat_path):
+                        file.write(b'\n')
+                    write_messages(file, heapq.merge(*sources, key=key))
+                    file.flush()
+                    os.fsync(file.fileno())
+            else:
+                # The chat comes first among the sources, so its messages keep their place within each minute.
+                with open(f'{chat_path}.tmp', 'wb') as file:
+                    write_messages(file, heapq.merge(iter_messages(chat_path), *sources, key=key))
+                os.replace(f'{chat_path}.tmp', chat_path)
+        last_minute = max(new_minutes + ([last_minute] if last_minute is not None else []))
+
+    index.save(index_path)
+    state.update({
+        'merged': sorted(merged_hashes),
+        'chat_signature': get_signature(chat_path),
+        'last_minute': last_minute,
+        'new_messages': new_messages,
+    })
+    save_merge_state(state, state_path)
+    return bool(masks)
+
+
+if __name__ == '__main__':
+    for group in load_groups().values():
+        if merge_exports(group.data_folder, group.cache_folder):
+            print(f'{group.name}: {load_merge_state(get_merge_paths(group.cache_folder)[0])["new_messages"]} mensagens novas')
@@ -0,0 +1,44 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from utils.instrumentation import record_cache
+
+# Maximum number of figures kept; the least recently used ones are dropped first.
+MAX_FIGURES = 128
+
+# Module-level state is shared by every Streamlit session (and rerun) of the same process.
+# Built Plotly figures, keyed by (chart name, figure key), in order of use.
+_figures = OrderedDict()
+_lock = threading.Lock()
+
+
+# Function to build the key of a set of figures from everything they depend on (filters, value column, data version, ...)
+def make_figure_key(*parts) -> str:
+    return hashlib.sha256(repr(parts).encode('utf-8')).hexdigest()
+
+
+# Function to get a figure from the cache, building it (outside the lock) only if it isn't there yet.
+# Without a key the figure is always built, e.g. for callers that don't know the version of their data.
+def get_figure(chart: str, key, build):
+    if key is None:
+        return build()
+    with _lock:
+        figure = _figures.get((chart, key))
+        record_cache('figures', figure is not None)
+        if figure is not None:
+            _figures.move_to_end((chart, key))
+            return figure
+
+    # Streamlit serializes a copy of the figure (Figure.to_dict), so a cached figure is never modified by a session.
+    figure = build()
+    with _lock:
+        _figures[(chart, key)] = figure
+        while len(_figures) > MAX_FIGURES:
+            _figures.popitem(last=False)
+    return figure
+
+
+# Function to drop every cached figure
+def clear_figures():
+    with _lock:
+        _figures.clear()
@@ -1,19 +1,67 @@
 import os
-from google.auth.transport.requests import Request
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from google.oauth2.credentials import Credentials
-from googleapiclient.http import MediaIoBaseDownload
-import io
+import time
+import threading
+import urllib.request
+from typing import NamedTuple, List
+
+# The Google client libraries are only imported when the Drive service is first built (see authenticate): they take
+# longer to import than the rest of the app, and aren't needed at all while the Drive sync is turned off.
 
 # The SCOPES variable defines the permissions required for Google Drive API.
 # 'https://www.googleapis.com/auth/drive' allows full access to a user's Drive.
 SCOPES = ['https://www.googleapis.com/auth/drive']
 api_service_name = 'drive'
 api_version = 'v3'
+# Local copy of the discovery document of the Drive API, so the service is built without looking it up (or fetching it).
+DISCOVERY_DOCUMENT_PATH = os.path.join('cache', f'{api_service_name}.{api_version}.discovery.json')
+DISCOVERY_URL = f'https://www.googleapis.com/discovery/v1/apis/{api_service_name}/{api_version}/rest'
+# Size (in bytes) of each ranged request when downloading a file.
+DOWNLOAD_CHUNK_SIZE = 10 * 1024 * 1024
+# Maximum number of files per page when listing a folder (Drive's limit).
+LIST_PAGE_SIZE = 1000
+# Fields fetched for every file of a folder snapshot.
+FILE_FIELDS = 'id, name, createdTime, modifiedTime, md5Checksum, size'
+# How long (in seconds) a folder snapshot is reused before the folder is listed again.
+SNAPSHOT_MAX_AGE = 60
+
+
+# Files of a Drive folder (newest first) as listed at a given moment.
+class FolderSnapshot(NamedTuple):
+    files: List[dict]
+    fetched_at: float
+
+
+# Cached folder snapshots, keyed by folder ID, shared by all sessions of the process.
+_folder_snapshots = {}
+_snapshots_lock = threading.Lock()
+
+# Function to get the discovery document of the Drive API, saving a local copy the first time
+def load_discovery_document(path=DISCOVERY_DOCUMENT_PATH):
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            return file.read()
+    except OSError:
+        pass
+
+    from googleapiclient.discovery_cache import get_static_doc
+    # Recent client libraries ship the document; otherwise it's fetched once from the discovery service.
+    document = get_static_doc(api_service_name, api_version)
+    if document is None:
+        with urllib.request.urlopen(DISCOVERY_URL) as response:
+            document = response.read().decode('utf-8')
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f'{path}.tmp', 'w', encoding='utf-8') as file:
+        file.write(document)
+    os.replace(f'{path}.tmp', path)
+    return document
 
 # Function to handle authentication with Google Drive API
 def authenticate():
+    from google.auth.transport.requests import Request
+    from google_auth_oauthlib.flow import InstalledAppFlow
+    from google.oauth2.credentials import Credentials
+    from googleapiclient.discovery import build_from_document
+
     creds = None
     # Check if the 'token.json' file already exists (stores user credentials). 
     # If present, use this to authenticate without needing to re-login.
@@ -33,7 +81,7 @@ def authenticate():
 
     try:
         # Build the Google Drive API service object using the authenticated credentials.
-        service = build(api_service_name, api_version, credentials=creds)
+        service = build_from_document(load_discovery_document(), credentials=creds)
     except Exception as e:
         # Handle errors in case the service object creation fails.
         print(f"Failed to create service object: {e}")
@@ -41,101 +89,59 @@ def authenticate():
 
     return service  # Return the service object for interacting with Google Drive API.
 
-# Function to list all files in a specified folder on Google Drive
-def list_files_in_folder(service, folder_id):
+# Function to list all files in a specified folder on Google Drive, following every page of results
+def list_files_in_folder(service, folder_id, fields='id, name'):
     # Query to find all files that are not in the trash and belong to the specified folder.
     query = f"'{folder_id}' in parents and trashed=false"
-    # Execute the API call to list files, requesting their ID and name.
-    results = service.files().list(q=query, pageSize=100, fields="nextPageToken, files(id, name)").execute()
-    items = results.get('files', [])
-    if not items:
-        # If no files are found, return an empty list.
-        return []
-    return items  # Return the list of files in the folder.
-
-# Function to delete all files in a folder except the most recently uploaded one
-def delete_all_except_last_uploaded(service, folder_id):
-    # Query to find all files in the folder that aren't in the trash.
-    query = f"'{folder_id}' in parents and trashed=false"
-    # Execute the API call to list files, including their created time.
-    results = service.files().list(q=query, fields="nextPageToken, files(id, name, createdTime)").execute()
-    items = results.get('files', [])
-
-    if not items:
-        # If no files are found, exit the function.
-        return
-
-    # Sort files by creation time in descending order (newest first).
-    items.sort(key=lambda x: x['createdTime'], reverse=True)
-
-    # Keep the most recently uploaded file and store the rest for deletion.
-    last_uploaded_file = items[0]
-    files_to_delete = items[1:]
-
-    # Attempt to delete each file except the last uploaded one.
-    for file in files_to_delete:
-        try:
-            service.files().delete(fileId=file['id']).execute()
-        except Exception as e:
-            print(f"Failed to delete {file['name']} (ID: {file['id']}). Reason: {e}")
-
-    # Rename the last uploaded file to 'chat_data.zip'.
-    try:
-        file_id = last_uploaded_file['id']
-        new_name = 'chat_data.zip'
-        service.files().update(fileId=file_id, body={'name': new_name}).execute()
-    except Exception as e:
-        print(f"Failed to rename file ID: {file_id}. Reason: {e}")
-
-# Function to download a file from Google Drive by its name
-def download_file(service, folder_id, file_name, download_path):
-    # Query to find the file with the given name in the specified folder.
-    query = f"'{folder_id}' in parents and trashed=false and name='{file_name}'"
-    # Execute the API call to find the file ID by name.
-    results = service.files().list(q=query, fields="files(id, name)").execute()
-    items = results.get('files', [])
-
-    if not items:
-        # If the file is not found, exit the function.
-        return
-
-    # Assuming there's only one file with the name, use its ID to download it.
-    file_id = items[0]['id']
-    request = service.files().get_media(fileId=file_id)
-    fh = io.FileIO(download_path, 'wb')
-    downloader = MediaIoBaseDownload(fh, request)
-
-    # Download the file in chunks.
-    done = False
-    while not done:
-        status, done = downloader.next_chunk()
-
-# Function to get the ID of the most recently created file in a folder
-def get_latest_file(service, folder_id='1x7v5YqdVp_deQ9q61l2McgdQgSPk30QQ'):
-    # Query to get the most recent file (sorted by created time in descending order).
-    query = f"'{folder_id}' in parents and trashed=false"
-    results = service.files().list(q=query, orderBy='createdTime desc', pageSize=1, fields="files(id, name, createdTime)").execute()
-    items = results.get('files', [])
-
-    if not items:
-        # If no files are found, return None.
-        return None
-
-    # Return the ID of the most recently created file.
-    last_created_file = items[0]
-    return last_created_file['id']
-
-# Function to get the file ID by file name in a specific folder
-def get_file_id_by_name(service, file_name, folder_id='1x7v5YqdVp_deQ9q61l2McgdQgSPk30QQ'):
-    # Query to find the file by name in the specified folder.
-    query = f"name='{file_name}' and '{folder_id}' in parents and trashed = false"
-    
-    # Execute the API call to find the file by name.
-    results = service.files().list(q=query, spaces='drive', fields='nextPageToken, files(id, name)').execute()
-    items = results.get('files', [])
-
-    # If found, return the file's ID; otherwise, return None.
-    if items:
-        return items[0]['id']
-    else:
-        return None
+    items = []
+    page_token = None
+    while True:
+        # Execute the API call to list one page of files, requesting the given fields.
+        results = service.files().list(q=query, pageSize=LIST_PAGE_SIZE, pageToken=page_token,
+                                       fields=f"nextPageToken, files({fields})").execute()
+        items.extend(results.get('files', []))
+        # Folders with more files than a page are split in several pages.
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            return items  # Return the list of files in the folder.
+
+# Function to get a snapshot of the files of a folder, listing it again only if the cached one is too old
+def get_folder_snapshot(service, folder_id, max_age=SNAPSHOT_MAX_AGE):
+    with _snapshots_lock:
+        snapshot = _folder_snapshots.get(folder_id)
+        if snapshot is None or time.monotonic() - snapshot.fetched_at > max_age:
+            files = list_files_in_folder(service, folder_id, FILE_FIELDS)
+            # Sort files by creation time in descending order (newest first).
+            files.sort(key=lambda x: x['createdTime'], reverse=True)
+            snapshot = FolderSnapshot(files, time.monotonic())
+            _folder_snapshots[folder_id] = snapshot
+        return snapshot
+
+# Function to get the version of a Drive file: its MD5 checksum, or its modification time if there's no checksum
+def get_file_version(metadata):
+    return metadata.get('md5Checksum') or metadata.get('modifiedTime')
+
+# Function to check if a folder has an export not among the known ones ({file ID: version}), with a single (cached) list call
+def has_newer_export(service, folder_id, known_versions, max_age=SNAPSHOT_MAX_AGE):
+    files = get_folder_snapshot(service, folder_id, max_age).files
+    return any(known_versions.get(file['id']) != get_file_version(file) for file in files)
+
+# Function to download a file from Google Drive in ranged chunks, resuming a previous partial download
+def download_file(service, file_id, download_path, size, chunk_size=DOWNLOAD_CHUNK_SIZE):
+    # Bytes already in the partial file (from an interrupted download) are not requested again.
+    offset = os.path.getsize(download_path) if os.path.exists(download_path) else 0
+
+    with open(download_path, 'ab') as fh:
+        while offset < size:
+            # Request only the next chunk of the file with an HTTP Range header.
+            request = service.files().get_media(fileId=file_id)
+            request.headers['Range'] = f'bytes={offset}-{min(offset + chunk_size, size) - 1}'
+            content = request.execute()
+            if not content:
+                raise IOError(f'Download of file ID {file_id} stopped at byte {offset} of {size}.')
+            fh.write(content)
+            offset += len(content)
+
+# Save the local copy of the discovery document on its own (e.g. when building the container image).
+if __name__ == '__main__':
+    load_discovery_document()
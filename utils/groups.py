@@ -0,0 +1,57 @@
+import os
+import re
+import json
+from typing import NamedTuple, Optional
+
+# File with the registry of the WhatsApp groups served by this instance (see groups.json).
+GROUPS_FILE = os.environ.get('GROUPS_FILE', 'groups.json')
+# URL query parameter that selects the group shown by the dashboard (e.g. '?grupo=contabilidade').
+GROUP_QUERY_PARAM = 'grupo'
+# Group ids are used in folder names and URLs, so they are kept to lowercase letters, digits, '-' and '_'.
+GROUP_ID_PATTERN = re.compile(r'^[a-z0-9_-]+$')
+
+
+# A WhatsApp group: where its exports are uploaded in Google Drive and where its data and caches are kept.
+class Group(NamedTuple):
+    group_id: str
+    name: str                  # Name shown in the dashboard
+    folder_id: Optional[str]   # Google Drive folder of the exports (None if the group isn't synced)
+    data_folder: str           # Folder of the chat (_chat.txt, merged from the exports in its 'exports' folder, or chat_data.zip)
+    cache_folder: str          # Folder of the event store, the rollup cube and the sync state
+
+    @property
+    def sync_state_path(self):
+        return os.path.join(self.cache_folder, 'drive_sync.json')
+
+
+# Function to read the group registry, keeping the order of the file (the first group is the default one).
+# Without a registry, the app serves a single local group from 'data' and 'cache', as before.
+def load_groups(groups_file=GROUPS_FILE):
+    try:
+        with open(groups_file, 'r', encoding='utf-8') as file:
+            entries = json.load(file)
+    except FileNotFoundError:
+        entries = {'default': {'data_folder': 'data', 'cache_folder': 'cache'}}
+
+    groups = {}
+    for group_id, entry in entries.items():
+        if not GROUP_ID_PATTERN.match(group_id):
+            raise ValueError(f'Invalid group id {group_id!r} in {groups_file}.')
+        # Groups without explicit folders get their own subfolders, so no two groups share a chat file or a cache.
+        groups[group_id] = Group(
+            group_id=group_id,
+            name=entry.get('name', group_id),
+            folder_id=entry.get('folder_id'),
+            data_folder=entry.get('data_folder', os.path.join('data', group_id)),
+            cache_folder=entry.get('cache_folder', os.path.join('cache', group_id)),
+        )
+    if not groups:
+        raise ValueError(f'No groups defined in {groups_file}.')
+    return groups
+
+
+# Function to get a group by id (the default group if no id is given), returning None for unknown ids
+def get_group(groups, group_id=None):
+    if not group_id:
+        return next(iter(groups.values()))
+    return groups.get(group_id)
@@ -0,0 +1,186 @@
+import os
+import json
+import hashlib
+import pandas as pd
+import pyarrow as pa
+from typing import NamedTuple, Optional, Tuple
+from utils.data_extraction import open_chat, get_chat_size, find_chat_file
+from utils.parallel_parse import load_data_parallel
+from utils.event_store import to_store_frame, to_store_table, read_store, write_store, append_to_store, get_store_offset
+from utils.compact_events import CompactEvents
+from utils.rollup import build_cube, merge_cubes, from_cube_table
+from utils.groups import load_groups
+from utils.atomic_files import write_atomically, file_lock
+
+# Folder where the ingest checkpoints, the event stores and the rollup cubes are stored.
+# It is kept apart from 'data', which only holds the chat and the exports it is merged from: everything here is derived
+# from them, so it isn't versioned and can be deleted at any time (it is rebuilt on the next load).
+CACHE_FOLDER = 'cache'
+# Number of bytes hashed at the start and at the end of the already ingested prefix.
+PREFIX_HASH_SIZE = 64 * 1024
+
+
+# Position in the chat text up to which a table of events was parsed, to later parse only what is appended after it.
+class ChatPosition(NamedTuple):
+    offset: int        # Offset right after the last complete line parsed
+    prefix_hash: str   # hash_prefix of the text up to offset
+    pending_rows: int  # Number of events of the unterminated last line, parsed after offset but never committed
+
+
+# Function to get the paths of the checkpoint, the event store and the rollup cube for a chat file
+def get_cache_paths(file_path, cache_folder=CACHE_FOLDER):
+    base_name = os.path.basename(file_path)
+    checkpoint_path = os.path.join(cache_folder, f'{base_name}.checkpoint.json')
+    events_path = os.path.join(cache_folder, f'{base_name}.events.arrow')
+    cube_path = os.path.join(cache_folder, f'{base_name}.cube.arrow')
+    return checkpoint_path, events_path, cube_path
+
+
+# Function to find the offset right after the last complete line (the last '\n') of a file
+def find_committed_offset(file_path, size, chunk_size=PREFIX_HASH_SIZE):
+    with open_chat(file_path) as file:
+        if file_path.lower().endswith('.zip'):
+            # A compressed member can't seek backwards without decompressing again from its start, so it's scanned
+            # forwards once, keeping the position of the last line break seen.
+            offset, committed = 0, 0
+            while offset < size and (chunk := file.read(min(chunk_size, size - offset))):
+                index = chunk.rfind(b'\n')
+                if index != -1:
+                    committed = offset + index + 1
+                offset += len(chunk)
+            return committed
+        # Scan the file backwards, so only the last (possibly unterminated) line is read.
+        end = size
+        while end > 0:
+            start = max(0, end - chunk_size)
+            file.seek(start)
+            index = file.read(end - start).rfind(b'\n')
+            if index != -1:
+                return start + index + 1
+            end = start
+    return 0
+
+
+# Function to hash the already ingested prefix of a file
+def hash_prefix(file_path, offset):
+    # Hashing the head and the tail of the prefix is enough to detect a re-export with another format
+    # or a rewritten history, without reading the whole prefix on every load.
+    digest = hashlib.sha256(str(offset).encode())
+    with open_chat(file_path) as file:
+        digest.update(file.read(min(PREFIX_HASH_SIZE, offset)))
+        tail_start = max(0, offset - PREFIX_HASH_SIZE)
+        file.seek(tail_start)
+        digest.update(file.read(offset - tail_start))
+    return digest.hexdigest()
+
+
+# Function to read the checkpoint of a chat file, returning None if it doesn't exist or is unreadable
+def load_checkpoint(checkpoint_path):
+    try:
+        with open(checkpoint_path, 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+# Function to save a dictionary as a JSON file
+def save_json(data, path):
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(data, file)
+
+
+# Function to parse a byte range of a chat file into an Arrow table with the store schema.
+# Large ranges (e.g. a full re-import) are parsed by a pool of worker processes, see utils.parallel_parse.
+def parse_range(file_path, start=0, end=None):
+    return to_store_table(to_store_frame(load_data_parallel(file_path, start=start, end=end)))
+
+
+# Function to get the timestamp of the last event of a store table (or None if it's empty)
+def get_last_timestamp(table):
+    if table.num_rows == 0:
+        return None
+    return pd.Timestamp(table.column('Timestamp')[-1].as_py()).isoformat()
+
+
+# Function to bring the event store and the rollup cube of a chat file up to date, parsing only the part appended since the last ingest
+def ingest(file_path, cache_folder=CACHE_FOLDER):
+    checkpoint_path, events_path, cube_path = get_cache_paths(file_path, cache_folder)
+    # The app and the API server may ingest the same chat at the same time (each process only serializes its own
+    # sessions), so the whole ingest of a chat file holds a lock shared by every process.
+    os.makedirs(cache_folder, exist_ok=True)
+    with file_lock(os.path.join(cache_folder, f'{os.path.basename(file_path)}.lock')):
+        size = get_chat_size(file_path)
+        # Only complete lines are committed: the last line may still grow in a future export.
+        committed_offset = find_committed_offset(file_path, size)
+
+        events = None
+        checkpoint = load_checkpoint(checkpoint_path)
+        # The store can only be reused if the already ingested prefix is unchanged.
+        if checkpoint is not None and os.path.exists(events_path) and os.path.exists(cube_path) \
+                and checkpoint['offset'] <= committed_offset \
+                and checkpoint['prefix_hash'] == hash_prefix(file_path, checkpoint['offset']):
+            stored_events, stored_cube = read_store(events_path), read_store(cube_path)
+            # The store and the cube are written before the checkpoint: if the process died in between, they already hold
+            # a tail the checkpoint doesn't know of, which would be appended twice. Both must cover the checkpoint's offset.
+            is_consistent = get_store_offset(stored_events) == checkpoint['offset'] == get_store_offset(stored_cube) \
+                and stored_events.num_rows == checkpoint.get('rows')
+            tail = parse_range(file_path, checkpoint['offset'], committed_offset) if is_consistent else None
+            last_timestamp = checkpoint['last_timestamp']
+            # Exports only ever append, so the new tail can't start before the last ingested event.
+            if tail is not None and (tail.num_rows == 0 or last_timestamp is None or
+                                     pd.Timestamp(tail.column('Timestamp')[0].as_py()) >= pd.Timestamp(last_timestamp)):
+                events = append_to_store(stored_events, tail)
+                # The cube is maintained incrementally: only the cells of the tail are added to it.
+                cube = merge_cubes(stored_cube, build_cube(tail))
+
+        # Rebuild the whole store if there's no usable checkpoint.
+        if events is None:
+            checkpoint = None
+            events = parse_range(file_path, end=committed_offset)
+            cube = build_cube(events)
+
+        # Persist the merged store, the cube and the new checkpoint if anything was ingested.
+        if checkpoint is None or checkpoint['offset'] != committed_offset:
+            write_store(events_path, events, committed_offset)
+            write_store(cube_path, cube, committed_offset)
+            new_checkpoint = {
+                'offset': committed_offset,
+                'rows': events.num_rows,
+                'last_timestamp': get_last_timestamp(events),
+                'prefix_hash': hash_prefix(file_path, committed_offset),
+            }
+            write_atomically(checkpoint_path, lambda path: save_json(new_checkpoint, path))
+
+        # The unterminated last line (if any) is parsed on every load but never committed.
+        pending = parse_range(file_path, start=committed_offset)
+        position = ChatPosition(committed_offset, hash_prefix(file_path, committed_offset), pending.num_rows)
+        return append_to_store(events, pending), merge_cubes(cube, build_cube(pending)), position
+
+
+# Function to parse only the text appended to a chat file after a position, e.g. while the file is being watched.
+# Returns the events from the position on (the pending events of the position included, parsed again) and the new position,
+# or None if the text before the position changed, in which case the file has to be ingested again.
+def read_appended(file_path, position: ChatPosition) -> Optional[Tuple[pa.Table, ChatPosition]]:
+    size = get_chat_size(file_path)
+    if size < position.offset or hash_prefix(file_path, position.offset) != position.prefix_hash:
+        return None
+    committed_offset = find_committed_offset(file_path, size)
+    tail = parse_range(file_path, position.offset, committed_offset)
+    pending = parse_range(file_path, start=committed_offset)
+    new_position = ChatPosition(committed_offset, hash_prefix(file_path, committed_offset), pending.num_rows)
+    return append_to_store(tail, pending), new_position
+
+
+# Function to load the chat data as used by the dashboard: the compact events, the cube DataFrame and the position parsed up to
+def load_events(file_path, cache_folder=CACHE_FOLDER):
+    events, cube, position = ingest(file_path, cache_folder)
+    return CompactEvents.from_store_table(events), from_cube_table(cube), position
+
+
+# Run the ingestion step on its own (e.g. when building the container image), so the app starts from the store.
+# Every group of the registry with a chat export is ingested into its own cache folder.
+if __name__ == '__main__':
+    for group in load_groups().values():
+        file_path = find_chat_file(group.data_folder)
+        if os.path.exists(file_path):
+            ingest(file_path, group.cache_folder)
@@ -0,0 +1,117 @@
+import os
+import io
+import json
+import time
+import pstats
+import threading
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+import numpy as np
+
+# Number of recent samples kept for each stage (older ones are dropped, so memory stays bounded).
+MAX_SAMPLES = 1000
+# Structured logs (one JSON line per traced run on stdout, which Cloud Run turns into jsonPayload entries).
+# They are on by default on Cloud Run (where K_SERVICE is set) and can be forced on or off with PERF_LOGS=1/0.
+STRUCTURED_LOGS = os.environ.get('PERF_LOGS', '1' if os.environ.get('K_SERVICE') else '0') == '1'
+
+# Module-level state is shared by every Streamlit session (and by the sync worker) of the same process.
+# Recent samples of each stage: {stage: deque of (seconds, RSS change in bytes)}.
+_timings = defaultdict(lambda: deque(maxlen=MAX_SAMPLES))
+# Lookups of each cache: {cache: [hits, misses]}.
+_cache_counts = defaultdict(lambda: [0, 0])
+_lock = threading.Lock()
+# Stages of the run being traced in the current thread (None outside of a trace).
+_current_trace = ContextVar('current_trace', default=None)
+
+
+# Function to get the resident memory of the process in bytes (0 where /proc isn't available)
+def get_rss():
+    try:
+        with open('/proc/self/statm', 'r') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+
+# Context manager to time a stage and the change of resident memory during it
+@contextmanager
+def stage(name):
+    rss_before = get_rss()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        rss_change = get_rss() - rss_before
+        with _lock:
+            _timings[name].append((seconds, rss_change))
+        stages = _current_trace.get()
+        if stages is not None:
+            stages.append({'stage': name, 'ms': round(seconds * 1000, 3), 'rss_change_mb': round(rss_change / 1e6, 3)})
+
+
+# Context manager to trace a whole run (e.g. a rerun of the dashboard): it is timed as a stage, the stages run inside it
+# are collected and logged together (with the extra fields given, e.g. the group), and a cProfile.Profile (if given) profiles it
+@contextmanager
+def trace(name, profiler=None, **fields):
+    stages = []
+    token = _current_trace.set(stages)
+    if profiler is not None:
+        profiler.enable()
+    try:
+        with stage(name):
+            yield stages
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        _current_trace.reset(token)
+        log_event(name, stages=stages, total_ms=stages[-1]['ms'] if stages else None, rss_mb=round(get_rss() / 1e6, 1), **fields)
+
+
+# Function to count a lookup of a cache
+def record_cache(name, hit):
+    with _lock:
+        _cache_counts[name][0 if hit else 1] += 1
+
+
+# Function to get the latency percentiles (in milliseconds) and mean memory change of every stage
+def get_stage_stats():
+    with _lock:
+        samples = {name: np.array(values) for name, values in _timings.items() if values}
+    stats = []
+    for name, values in sorted(samples.items()):
+        p50, p90, p99 = np.percentile(values[:, 0] * 1000, [50, 90, 99])
+        stats.append({'stage': name, 'count': len(values), 'p50_ms': round(p50, 2), 'p90_ms': round(p90, 2),
+                      'p99_ms': round(p99, 2), 'max_ms': round(values[:, 0].max() * 1000, 2),
+                      'mean_rss_change_mb': round(values[:, 1].mean() / 1e6, 2)})
+    return stats
+
+
+# Function to get the hits, misses and hit rate of every cache
+def get_cache_stats():
+    with _lock:
+        counts = {name: tuple(value) for name, value in _cache_counts.items()}
+    return [{'cache': name, 'hits': hits, 'misses': misses, 'hit_rate': round(hits / (hits + misses), 3) if hits + misses else None}
+            for name, (hits, misses) in sorted(counts.items())]
+
+
+# Function to write a structured log entry (a JSON line that Cloud Run can filter and aggregate)
+def log_event(message, severity='INFO', force=False, **fields):
+    if STRUCTURED_LOGS or force:
+        entry = {'severity': severity, 'message': message, 'component': 'dashboard-perf', **fields}
+        print(json.dumps(entry, default=str, ensure_ascii=False), flush=True)
+
+
+# Function to format the functions with the largest cumulative time of a profile
+def format_profile(profiler, limit=30):
+    output = io.StringIO()
+    pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(limit)
+    return output.getvalue()
+
+
+# Function to drop every sample and counter
+def reset_stats():
+    with _lock:
+        _timings.clear()
+        _cache_counts.clear()
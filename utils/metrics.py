@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+from typing import NamedTuple, Optional
+
+# Portuguese names of the days of the week, indexed by the 'Dia' column (0 = Monday).
+WEEKDAY_NAMES = ['Segunda', 'Terça', 'Quarta', 'Quinta', 'Sexta', 'Sábado', 'Domingo']
+
+
+# Immutable result of the metrics engine: every number and series the dashboard renders.
+class DashboardMetrics(NamedTuple):
+    value_col: str                   # Column shown in the charts ('Quantidade (L)' or 'Quantidade')
+    total_volume: float              # Total litres
+    avg_daily_consumption: float     # Mean litres per day with at least one drink
+    top_consumer: Optional[str]      # Person with the most litres
+    favorite_beer: Optional[str]     # Drink with the most units
+    per_person: pd.Series            # value_col per person, sorted in descending order
+    per_drink: pd.Series             # value_col per drink
+    per_weekday: pd.Series           # value_col per day of the week (0 = Monday), NaN on days without drinks
+    per_hour: pd.Series              # value_col per hour of the day (0 to 23), 0 on hours without drinks
+    per_date: pd.Series              # value_col per day with at least one drink, in chronological order
+
+
+# Function to compute all dashboard aggregates from the filtered events (or rollup cube) in a single pass
+def compute_metrics(df: pd.DataFrame, value_col: str) -> DashboardMetrics:
+    litres = df['Quantidade (L)'].to_numpy(dtype=float)
+    units = df['Quantidade'].to_numpy(dtype=float)
+    values = df[value_col].to_numpy(dtype=float)
+    # Drink counts are summed as floats by bincount, but are shown as integers.
+    value_type = np.int64 if pd.api.types.is_integer_dtype(df[value_col]) else float
+
+    # Each key column is encoded once; every aggregate is then a weighted bincount over these codes.
+    # People and drinks are sorted so ties are broken alphabetically, as with a groupby.
+    date_codes, dates = pd.factorize(df['Date'])
+    person_codes, people = pd.factorize(df['Pessoa'], sort=True)
+    drink_codes, drinks = pd.factorize(df['Emoji'], sort=True)
+    weekdays = df['Dia'].to_numpy(dtype=np.intp)
+    hours = df['Hora'].to_numpy(dtype=np.intp)
+
+    by_date = np.bincount(date_codes, litres, len(dates))
+    person_litres = np.bincount(person_codes, litres, len(people))
+    drink_units = np.bincount(drink_codes, units, len(drinks))
+
+    # Days of the week without any drink are left empty (NaN), hours without drinks count as 0.
+    per_weekday = pd.Series(np.bincount(weekdays, values, 7).astype(value_type), name=value_col).rename_axis('Dia')
+    per_weekday = per_weekday.where(np.bincount(weekdays, minlength=7) > 0)
+
+    return DashboardMetrics(
+        value_col=value_col,
+        total_volume=float(by_date.sum()),
+        avg_daily_consumption=float(by_date.mean()) if len(by_date) else 0.0,
+        top_consumer=people[person_litres.argmax()] if len(people) else None,
+        favorite_beer=drinks[drink_units.argmax()] if len(drinks) else None,
+        per_person=pd.Series(np.bincount(person_codes, values, len(people)).astype(value_type), index=people.rename('Pessoa'), name=value_col).sort_values(ascending=False),
+        per_drink=pd.Series(np.bincount(drink_codes, values, len(drinks)).astype(value_type), index=drinks.rename('Emoji'), name=value_col),
+        per_weekday=per_weekday,
+        per_hour=pd.Series(np.bincount(hours, values, 24).astype(float), name=value_col).rename_axis('Hora'),
+        per_date=pd.Series(np.bincount(date_codes, values, len(dates)).astype(value_type), index=pd.DatetimeIndex(dates, name='Date'), name=value_col).sort_index(),
+    )
@@ -0,0 +1,83 @@
+import os
+import numpy as np
+import pandas as pd
+from itertools import repeat
+from multiprocessing import get_context
+from concurrent.futures import ProcessPoolExecutor
+from utils.data_extraction import CHUNK_SIZE, DRINK_NAMES, DRINK_VOLUMES, open_chat, get_chat_size, read_blocks, \
+    split_lines, parse_chat, find_drinks, extract_emojis, load_data
+
+# Number of worker processes used to parse large exports (PARSE_WORKERS=1 always parses in the current process).
+PARSE_WORKERS = int(os.environ.get('PARSE_WORKERS', os.cpu_count() or 1))
+# Byte ranges below this size are parsed serially: starting the workers would cost more than it saves.
+PARALLEL_MIN_SIZE = 32 * 1024 * 1024
+# Each worker gets several smaller ranges instead of one, so a slow range doesn't leave the other workers idle.
+RANGES_PER_WORKER = 4
+
+
+# Function to split the byte range [start, end) of a chat file into n_parts ranges that start and end at line boundaries.
+# Continuation lines of a message are dropped by the parser, so any line boundary is a safe place to split.
+def split_ranges(file_path, start, end, n_parts):
+    bounds = [start]
+    with open_chat(file_path) as file:
+        for target in np.linspace(start, end, n_parts + 1)[1:-1].astype(np.int64):
+            # Move each split point forward to the start of the next line (it stays if a line already starts there).
+            file.seek(int(target) - 1)
+            bound = int(target) - 1 + len(file.readline())
+            if bounds[-1] < bound < end:
+                bounds.append(bound)
+    bounds.append(end)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+# Function run by the workers: parse a byte range of a chat file into compact arrays, one item per drink:
+# timestamps (datetime64[s]), author codes (int32) with the names of the authors, and drink codes (int8).
+# Parsing a range of a .zip export decompresses the member up to its start, which is still far cheaper than parsing it.
+def parse_range_arrays(file_path, start, end):
+    timestamps, person_codes, drinks = [np.empty(0, 'datetime64[s]')], [np.empty(0, np.int32)], [np.empty(0, np.int8)]
+    # Authors are dictionary-encoded, so only their integer codes and the few distinct names are sent back.
+    names = {}
+    for block in read_blocks(file_path, CHUNK_SIZE, start, end):
+        chat_data = parse_chat(split_lines(block))
+        message_index, drink_codes = find_drinks(chat_data)
+        people = chat_data['Pessoa'].combine_chunks().dictionary_encode()
+        # Codes of the names of this block in the list of names of the whole range.
+        block_codes = np.array([names.setdefault(name, len(names)) for name in people.dictionary.to_pylist()], dtype=np.int32)
+        timestamps.append(chat_data['Timestamp'].to_numpy()[message_index])
+        person_codes.append(block_codes[people.indices.to_numpy(zero_copy_only=False)[message_index]])
+        drinks.append(drink_codes)
+    return np.concatenate(timestamps), np.concatenate(person_codes), list(names), np.concatenate(drinks)
+
+
+# Function to load the byte range [start, end) of a chat file like load_data, parsing it in a pool of worker processes.
+# The result is identical to load_data's; small ranges (e.g. the tail of an incremental ingest) are parsed serially.
+def load_data_parallel(file_path, start=0, end=None, workers=PARSE_WORKERS):
+    if end is None:
+        end = get_chat_size(file_path)
+    if workers <= 1 or end - start < PARALLEL_MIN_SIZE:
+        return load_data(file_path, start=start, end=end)
+
+    ranges = split_ranges(file_path, start, end, workers * RANGES_PER_WORKER)
+    starts, ends = zip(*ranges)
+    # Workers are spawned (not forked), since the Streamlit server and the sync worker run other threads.
+    with ProcessPoolExecutor(workers, mp_context=get_context('spawn')) as pool:
+        # map returns the results in the order of the ranges, so the events keep the order of the file.
+        parts = list(pool.map(parse_range_arrays, repeat(file_path), starts, ends))
+    if not any(len(part[3]) for part in parts):
+        return extract_emojis(parse_chat([]))
+
+    # Map the author codes of every range to a single list of names (in order of first appearance).
+    names = pd.unique(np.array([name for part in parts for name in part[2]], dtype=object))
+    positions = {name: i for i, name in enumerate(names)}
+    person_codes = np.concatenate([np.array([positions[name] for name in part[2]], dtype=np.int32)[part[1]] for part in parts])
+    drink_codes = np.concatenate([part[3] for part in parts])
+
+    # Build the same DataFrame as load_data.
+    df = pd.DataFrame({
+        'Timestamp': np.concatenate([part[0] for part in parts]).astype('datetime64[ns]'),
+        'Pessoa': names[person_codes],
+        'Emoji': DRINK_NAMES[drink_codes],
+        'Quantidade (L)': DRINK_VOLUMES[drink_codes],
+    })
+    df['Quantidade'] = 1
+    return df
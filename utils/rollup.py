@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from typing import Tuple
+
+# Granularity of the rollup cube: one cell per (day, hour, person, drink).
+CUBE_KEYS = ['Date', 'Hora', 'Pessoa', 'Emoji']
+
+# Schema of the on-disk rollup cube. Volumes are summed in centilitres, so the sums stay exact integers.
+CUBE_SCHEMA = pa.schema([
+    ('Date', pa.timestamp('ns')),
+    ('Hora', pa.int8()),
+    ('Pessoa', pa.dictionary(pa.int32(), pa.string())),
+    ('Emoji', pa.dictionary(pa.int8(), pa.string())),
+    ('Quantidade', pa.int32()),
+    ('Volume (cL)', pa.int64()),
+])
+
+
+# Function to sum cells with the same keys and build a cube table from the result
+def aggregate_cells(cells: pd.DataFrame) -> pa.Table:
+    cube_df = cells.groupby(CUBE_KEYS, observed=True, sort=True)[['Quantidade', 'Volume (cL)']].sum().reset_index()
+    cube_df['Pessoa'] = cube_df['Pessoa'].astype('category')
+    cube_df['Emoji'] = cube_df['Emoji'].astype('category')
+    return pa.Table.from_pandas(cube_df, schema=CUBE_SCHEMA, preserve_index=False)
+
+
+# Function to build the rollup cube of a table of events with the store schema
+def build_cube(table: pa.Table) -> pa.Table:
+    events = table.to_pandas()
+    cells = pd.DataFrame({
+        'Date': events['Timestamp'].dt.normalize(),
+        'Hora': events['Timestamp'].dt.hour.astype('int8'),
+        'Pessoa': events['Pessoa'].astype(object),
+        'Emoji': events['Emoji'].astype(object),
+        'Quantidade': 1,
+        'Volume (cL)': events['Volume (cL)'].astype('int64'),
+    })
+    return aggregate_cells(cells)
+
+
+# Function to add the cells of a new cube (e.g. from the ingested tail) to an existing cube
+def merge_cubes(cube: pa.Table, new_cube: pa.Table) -> pa.Table:
+    if new_cube.num_rows == 0:
+        return cube
+    # Only the cells of the last ingested hour can overlap, but re-aggregating is cheap: the cube is small.
+    cells = pd.concat([table.to_pandas() for table in (cube, new_cube)], ignore_index=True)
+    cells['Pessoa'] = cells['Pessoa'].astype(object)
+    cells['Emoji'] = cells['Emoji'].astype(object)
+    return aggregate_cells(cells)
+
+
+# Function to build the cube DataFrame used by the dashboard from cells with the cube keys, 'Quantidade' and 'Volume (cL)'
+def to_cube_frame(cells: pd.DataFrame) -> pd.DataFrame:
+    # Each cell is like a group of events: 'Quantidade' is the number of drinks and 'Quantidade (L)' the litres.
+    df = pd.DataFrame({
+        'Date': cells['Date'],
+        'Dia': cells['Date'].dt.weekday.astype('int8'),  # 0 = Monday
+        'Hora': cells['Hora'].astype('int8'),
+        'Pessoa': cells['Pessoa'].astype(object),
+        'Emoji': cells['Emoji'].astype(object),
+        'Quantidade (L)': cells['Volume (cL)'] / 100,
+        'Quantidade': cells['Quantidade'].astype('int64'),
+    })
+    return df
+
+
+# Function to convert a cube table into a DataFrame with the same columns as the event DataFrame
+def from_cube_table(table: pa.Table) -> pd.DataFrame:
+    return to_cube_frame(table.to_pandas())
+
+
+# Function to get the cells of a cube DataFrame or of an event DataFrame (one drink per row), counted with a sign
+def to_cells(df: pd.DataFrame, sign: int = 1) -> pd.DataFrame:
+    cells = df[CUBE_KEYS].copy()
+    cells['Quantidade'] = df['Quantidade'].to_numpy(dtype=np.int64) * sign
+    # Litres are summed back as whole centilitres, so the sums stay exact.
+    cells['Volume (cL)'] = np.rint(df['Quantidade (L)'].to_numpy() * 100).astype(np.int64) * sign
+    return cells
+
+
+# Function to update a cube DataFrame with added and removed events (event DataFrames, e.g. from CompactEvents.to_frame).
+# Events are appended to the chat in order, so they fall at the end of the cube (which is sorted by its keys): only the
+# cells from the first day of the events on are re-aggregated. Returns the new cube and its number of unchanged first rows.
+def update_cube_frame(cube_df: pd.DataFrame, added: pd.DataFrame, removed: pd.DataFrame) -> Tuple[pd.DataFrame, int]:
+    if added.empty and removed.empty:
+        return cube_df, len(cube_df)
+    first_date = min(events['Date'].min() for events in (added, removed) if not events.empty)
+    start = int(np.searchsorted(cube_df['Date'].to_numpy(), first_date.to_datetime64(), side='left'))
+
+    cells = pd.concat([to_cells(cube_df.iloc[start:]), to_cells(added), to_cells(removed, -1)], ignore_index=True)
+    cells = cells.groupby(CUBE_KEYS, sort=True)[['Quantidade', 'Volume (cL)']].sum().reset_index()
+    # Cells left without drinks (all their events were removed) are dropped, as if they had never been ingested.
+    cells = cells[cells['Quantidade'] != 0]
+    return pd.concat([cube_df.iloc[:start], to_cube_frame(cells)], ignore_index=True), start
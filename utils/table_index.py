@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+from datetime import date
+from typing import Dict, List
+
+
+# Function to group the row positions of a table by the value of a column: {value: sorted positions of its rows}
+def build_positions(column: pd.Series) -> Dict[str, np.ndarray]:
+    codes, values = pd.factorize(column)
+    # A stable sort by code keeps the positions of each value in ascending order.
+    order = np.argsort(codes, kind='stable')
+    bounds = np.cumsum(np.bincount(codes, minlength=len(values)))[:-1]
+    return dict(zip(values, np.split(order, bounds)))
+
+
+# Function to get the sorted positions, within [start, stop), of the rows of the selected values
+def lookup_positions(positions: Dict[str, np.ndarray], selected: List[str], start: int, stop: int) -> np.ndarray:
+    # Each list of positions is sorted, so its part inside the date range is found by binary search.
+    parts = [rows[np.searchsorted(rows, start):np.searchsorted(rows, stop)]
+             for rows in (positions.get(value) for value in selected) if rows is not None]
+    return np.sort(np.concatenate(parts)) if parts else np.empty(0, dtype=np.intp)
+
+
+# Function to merge the positions of the first `start` rows of a table with those of the rows that follow them
+def merge_positions(positions: Dict[str, np.ndarray], tail_positions: Dict[str, np.ndarray], start: int) -> Dict[str, np.ndarray]:
+    merged = {}
+    for value in {**positions, **tail_positions}:
+        head = positions.get(value, np.empty(0, dtype=np.intp))
+        rows = np.concatenate([head[:np.searchsorted(head, start)], tail_positions.get(value, np.empty(0, dtype=np.intp)) + start])
+        if len(rows):
+            merged[value] = rows
+    return merged
+
+
+# Index of a table with 'Date', 'Pessoa' and 'Emoji' columns (the rollup cube or the event DataFrame), sorted by 'Date'.
+# Date ranges resolve to a contiguous slice by binary search, and people and drinks to precomputed row positions,
+# so a query only touches the rows it selects and never copies the whole table.
+class TableIndex:
+    __slots__ = ('dates', 'person_positions', 'drink_positions', 'drink_codes', 'drink_names')
+
+    def __init__(self, df: pd.DataFrame):
+        dates = df['Date'].to_numpy()
+        if len(dates) and (dates[1:] < dates[:-1]).any():
+            raise ValueError("The table must be sorted by 'Date' to be indexed.")
+        self.dates = dates
+        self.person_positions = build_positions(df['Pessoa'])
+        self.drink_positions = build_positions(df['Emoji'])
+        # Drink code of every row, to narrow down the rows of the selected people to the selected drinks.
+        codes, names = pd.factorize(df['Emoji'])
+        self.drink_codes, self.drink_names = codes.astype(np.int8), list(names)
+
+    # Function to get the positions [start, stop) of the rows between two dates (both included)
+    def get_date_slice(self, start_date: date, end_date: date):
+        start = np.searchsorted(self.dates, np.datetime64(pd.Timestamp(start_date)), side='left')
+        stop = np.searchsorted(self.dates, np.datetime64(pd.Timestamp(end_date)), side='right')
+        return int(start), int(stop)
+
+    # Function to select the rows of a table between two dates, of the selected people and drinks (all if empty),
+    # keeping the order and the index labels of the table (like a boolean mask would).
+    def select(self, df: pd.DataFrame, start_date: date, end_date: date, people: List[str], drinks: List[str]) -> pd.DataFrame:
+        start, stop = self.get_date_slice(start_date, end_date)
+        if not people and not drinks:
+            # A contiguous slice: with copy-on-write, a view that never copies the table.
+            return df.iloc[start:stop]
+
+        if people:
+            positions = lookup_positions(self.person_positions, people, start, stop)
+            if drinks:
+                codes = [self.drink_names.index(drink) for drink in drinks if drink in self.drink_names]
+                positions = positions[np.isin(self.drink_codes[positions], codes)]
+        else:
+            positions = lookup_positions(self.drink_positions, drinks, start, stop)
+        # Only the selected rows are gathered.
+        return df.take(positions)
+
+    # Function to get the index of the table made of the first `start` rows of the indexed one followed by the rows of tail
+    # (e.g. the cube after new drinks are added to its last days), indexing only the tail instead of the whole table.
+    def replace_tail(self, start: int, tail: pd.DataFrame) -> 'TableIndex':
+        index = TableIndex(tail)
+        if start and len(tail) and index.dates[0] < self.dates[start - 1]:
+            raise ValueError("The table must be sorted by 'Date' to be indexed.")
+        index.dates = np.concatenate([self.dates[:start], index.dates])
+        index.person_positions = merge_positions(self.person_positions, index.person_positions, start)
+        index.drink_positions = merge_positions(self.drink_positions, index.drink_positions, start)
+        # Drinks new to the table get the next codes, so the codes of the first rows don't change.
+        names = self.drink_names + [name for name in index.drink_names if name not in self.drink_names]
+        recode = np.array([names.index(name) for name in index.drink_names], dtype=np.int8)
+        index.drink_codes = np.concatenate([self.drink_codes[:start], recode[index.drink_codes]])
+        index.drink_names = names
+        return index
@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+
+# Resampling frequencies of the consumption over time chart: {label: pandas offset}.
+# Weeks start on Monday, like the 'Dia' column.
+FREQUENCIES = {'Diário': 'D', 'Semanal': 'W-MON', 'Mensal': 'MS'}
+# Maximum number of points sent to the browser for a time series, whatever the length of the history.
+MAX_POINTS = 500
+
+
+# Function to pick the points that best keep the shape of a series (Largest-Triangle-Three-Buckets).
+# The first and last points are always kept; every bucket in between keeps the point that forms the largest triangle
+# with the point kept in the previous bucket and the mean of the next one. Returns the positions of the kept points.
+def downsample(x: np.ndarray, y: np.ndarray, max_points: int = MAX_POINTS) -> np.ndarray:
+    n_points = len(x)
+    if max_points >= n_points or max_points < 3:
+        return np.arange(n_points)
+
+    edges = np.linspace(1, n_points - 1, max_points - 1).astype(np.intp)
+    selected = np.empty(max_points, dtype=np.intp)
+    selected[0], selected[-1] = 0, n_points - 1
+    previous = 0
+    for i in range(max_points - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n_points
+        mean_x, mean_y = x[end:next_end].mean(), y[end:next_end].mean()
+        areas = np.abs((x[previous] - mean_x) * (y[start:end] - y[previous]) - (x[previous] - x[start:end]) * (mean_y - y[previous]))
+        previous = start + int(areas.argmax())
+        selected[i + 1] = previous
+    return selected
+
+
+# Function to resample the daily consumption to a frequency (periods without drinks count as 0),
+# downsampled on the server so the chart never has more than max_points points.
+def resample_consumption(per_date: pd.Series, frequency: str, max_points: int = MAX_POINTS) -> pd.Series:
+    if per_date.empty:
+        return per_date
+    resampled = per_date.resample(FREQUENCIES[frequency], label='left', closed='left').sum()
+    x = resampled.index.asi8.astype(float)
+    return resampled.iloc[downsample(x, resampled.to_numpy(dtype=float), max_points)]
@@ -1,41 +1,114 @@
-from utils.google_api import download_file, delete_all_except_last_uploaded
+from utils.google_api import download_file, get_folder_snapshot, get_file_version, has_newer_export
+from utils.data_extraction import find_chat_member
+from utils.export_merge import merge_exports, EXPORTS_FOLDER_NAME
+from utils.instrumentation import stage, log_event
+from utils.atomic_files import write_atomically
+import os
+import json
+import hashlib
 import zipfile
-from utils.data_extraction import delete_files_except_txt, rename_unique_txt
-import time
-
-def update_chat_data(service):
-    # Define the Google Drive folder ID where the chat data is stored.
-    folder_id = '1x7v5YqdVp_deQ9q61l2McgdQgSPk30QQ'  
-    # Define the name of the ZIP file that contains the chat data.
-    file_name = 'chat_data.zip'   
-    # Define the path where the ZIP file will be downloaded.
-    download_path = 'data/chat_data.zip' 
-    # Define the local folder where the unzipped files will be extracted.
-    data_folder = 'data'    
-
-    # Step 1: Delete all files in the Google Drive folder except the most recent one.
-    # This ensures that only the last uploaded file is kept in the folder.
-    delete_all_except_last_uploaded(service, folder_id)
-
-    # Step 2: Download the last uploaded file (chat_data.zip) from Google Drive.
-    # This file contains the chat data that will be processed locally.
-    download_file(service, folder_id, file_name, download_path)
-
-    # Step 3: Introduce a delay (5 seconds) to ensure the download completes before proceeding.
-    time.sleep(5)
-
-    # Step 4: Unzip the downloaded file into the specified data folder.
-    # This will extract all the files inside 'chat_data.zip' to the 'data' directory.
-    with zipfile.ZipFile(download_path, 'r') as zip_ref:
-        zip_ref.extractall(data_folder)
-
-    # Step 5: Introduce another delay (5 seconds) after extraction.
-    time.sleep(5)
-
-    # Step 6: Delete all non-.txt files in the extracted folder.
-    # This function removes any file that isn't a .txt file, ensuring only chat data files remain.
-    delete_files_except_txt(data_folder)
-
-    # Step 7: Rename the remaining .txt file in the folder to '_chat.txt', provided there is exactly one.
-    # If there are multiple or no .txt files, it handles those cases with appropriate messages.
-    rename_unique_txt(data_folder)
+
+# File where the versions of the synced exports (and the metadata of a partial download) are kept.
+# Each group has its own (see utils.groups.Group.sync_state_path); this one belongs to the default local group.
+SYNC_STATE_PATH = os.path.join('cache', 'drive_sync.json')
+
+
+# Function to read the sync state, returning an empty state if it doesn't exist or is unreadable
+def load_sync_state(state_path):
+    try:
+        with open(state_path, 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+# Function to save the sync state atomically
+def save_sync_state(state, state_path):
+    os.makedirs(os.path.dirname(state_path), exist_ok=True)
+    def write(tmp_path):
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(state, file)
+    write_atomically(state_path, write)
+
+
+# Function to compute the MD5 checksum of a local file, reading it in chunks
+def md5_file(file_path, chunk_size=1024 * 1024):
+    digest = hashlib.md5()
+    with open(file_path, 'rb') as file:
+        while chunk := file.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Function to get the local path of a Drive export of a group
+def get_export_path(data_folder, metadata):
+    return os.path.join(data_folder, EXPORTS_FOLDER_NAME, f"{metadata['id']}.zip")
+
+
+# Function to download a Drive export to its local path, resuming a partial download only if it belongs to the same version.
+# Returns False (and discards the download) if the file isn't a WhatsApp export, i.e. a .zip with a single .txt chat.
+def download_export(service, metadata, export_path, state, state_path):
+    part_path = f'{export_path}.part'
+    remote_version = get_file_version(metadata)
+    os.makedirs(os.path.dirname(export_path), exist_ok=True)
+    if state.get('partial') != [metadata['id'], remote_version] and os.path.exists(part_path):
+        os.remove(part_path)
+    state['partial'] = [metadata['id'], remote_version]
+    save_sync_state(state, state_path)
+    with stage('drive_download'):
+        download_file(service, metadata['id'], part_path, int(metadata.get('size', 0)))
+
+    # Check the download against Drive's checksum, and that it contains a chat, before it's merged.
+    with stage('verify_download'):
+        if metadata.get('md5Checksum') and md5_file(part_path) != metadata['md5Checksum']:
+            os.remove(part_path)
+            raise IOError(f"Checksum mismatch for {metadata['name']}, the download will restart on the next sync.")
+        try:
+            with zipfile.ZipFile(part_path, 'r') as zip_ref:
+                find_chat_member(zip_ref)
+        except (zipfile.BadZipFile, ValueError) as e:
+            os.remove(part_path)
+            log_event('skipped_drive_file', severity='WARNING', force=True, file=metadata['name'], error=str(e))
+            return False
+    os.replace(part_path, export_path)
+    return True
+
+
+# Function to sync the chat data of a group with the exports uploaded to its Google Drive folder,
+# returning True if the data changed.
+# Exports of different members (or from before a phone was reinstalled) cover different stretches of the chat, so none
+# of them is deleted: each one is downloaded once to the group's exports folder and merged into its chat (see
+# utils.export_merge), which only gains the messages it didn't have yet.
+def update_chat_data(service, folder_id, data_folder='data', state_path=SYNC_STATE_PATH):
+    # Step 1: List the exports of the Drive folder (fresh, since the sync acts on it; a single paginated call).
+    with stage('drive_list'):
+        files = get_folder_snapshot(service, folder_id, max_age=0).files
+
+    # Step 2: Download, oldest first, the exports whose checksum differs from the synced one (or whose copy is missing).
+    # Other files of the folder (not WhatsApp exports) are skipped, and remembered so they aren't downloaded again.
+    state = load_sync_state(state_path)
+    synced = state.setdefault('exports', {})
+    skipped = state.setdefault('skipped', {})
+    for metadata in reversed(files):
+        export_path = get_export_path(data_folder, metadata)
+        version = get_file_version(metadata)
+        if skipped.get(metadata['id']) == version:
+            continue
+        if synced.get(metadata['id']) != version or not os.path.exists(export_path):
+            if download_export(service, metadata, export_path, state, state_path):
+                synced[metadata['id']] = version
+            else:
+                skipped[metadata['id']] = version
+            state.pop('partial', None)
+            save_sync_state(state, state_path)
+
+    # Step 3: Merge the new exports into the chat. Exports already merged are recognized by their hash and skipped,
+    # so this is nearly free when nothing was downloaded. The merge state is kept next to the sync state.
+    with stage('merge_exports'):
+        return merge_exports(data_folder, os.path.dirname(state_path))
+
+
+# Function to check (with a cached folder snapshot) if Google Drive has an export that isn't synced (or skipped) yet
+def is_newer_export_available(service, folder_id, state_path=SYNC_STATE_PATH):
+    state = load_sync_state(state_path)
+    return has_newer_export(service, folder_id, {**state.get('exports', {}), **state.get('skipped', {})})